@@ -0,0 +1,232 @@
+"""
+----- Batch Module -----
+Clusters many data-sets at once, fanned out across a pool of processes - each
+of them imports the program once, and gets the arrays of its data-sets
+through shared memory (so they are neither pickled nor parsed again).
+Each data-set's output files are saved to a directory of its own.
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from binary_data import load_data
+from initialization import ProgramParams
+
+# The extensions of the data-sets files, when given a directory
+DATASET_EXTENSIONS = (".txt", ".bin")
+
+
+@dataclass
+class BatchJob:
+    """
+    A data class to hold a data-set in shared memory, and how to cluster it.
+    The shared memory block holds the points (float32, C-contiguous) and then
+    the centers (int32).
+    """
+    name: str
+    shm_name: str
+    n: int
+    dim: int
+    k: int
+    random: bool
+    output_dir: str
+    options: dict
+
+
+@dataclass
+class BatchReport:
+    """
+    A data class to hold the results of a batch.
+    """
+    n_datasets: int = 0
+    n_points: int = 0
+    wall_time: float = 0.0
+    # the time of each data-set, by its name
+    job_times: dict = field(default_factory=dict)
+    # the error of each failed data-set, by its name
+    failures: dict = field(default_factory=dict)
+
+    @property
+    def datasets_per_second(self):
+        return self.n_datasets / self.wall_time if self.wall_time else 0.0
+
+    @property
+    def points_per_second(self):
+        return self.n_points / self.wall_time if self.wall_time else 0.0
+
+
+def read_manifest(fname):
+    """
+    :param fname: path of a manifest - a line per data-set, its path (relative
+                  to the manifest's directory) and optionally its k, separated
+                  by a comma. Empty lines and lines starting with '#' are
+                  skipped.
+    :return: list of (path, k) of the data-sets, k is None when not given
+    """
+    base = os.path.dirname(fname)
+    datasets = []
+    with open(fname) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path, _, k = line.partition(",")
+            datasets.append((os.path.join(base, path.strip()),
+                             int(k) if k.strip() else None))
+    return datasets
+
+
+def find_datasets(path):
+    """
+    :param path: a directory of data-sets files (see DATASET_EXTENSIONS), or a
+                 manifest file (see read_manifest)
+    :return: list of (path, k) of the data-sets, k is None when not given
+    """
+    if not os.path.isdir(path):
+        return read_manifest(path)
+    return [(os.path.join(path, fname), None)
+            for fname in sorted(os.listdir(path))
+            if os.path.splitext(fname)[1] in DATASET_EXTENSIONS]
+
+
+def _to_shared_memory(points, centers):
+    """
+    :return: SharedMemory block of the points (as float32) and the centers
+    """
+    n, d = points.shape
+    shm = SharedMemory(create=True, size=max(1, n * (d + 1) * 4))
+    np.ndarray((n, d), np.float32, buffer=shm.buf)[:] = points
+    np.ndarray(n, np.int32, buffer=shm.buf, offset=n * d * 4)[:] = centers
+    return shm
+
+
+def _free_shared_memory(shm):
+    """
+    Closes and unlinks a SharedMemory block of _to_shared_memory.
+    """
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _run_job(job):
+    """
+    Clusters the data-set of the job, in a worker process.
+    :return: the wall time of the clustering
+    """
+    from main import run_clustering
+    shm = SharedMemory(name=job.shm_name)
+    try:
+        points = np.ndarray((job.n, job.dim), np.float32, buffer=shm.buf)
+        centers = np.ndarray(job.n, np.int32, buffer=shm.buf,
+                             offset=job.n * job.dim * 4)
+        params = ProgramParams(job.n, job.k, job.dim, job.random)
+        os.makedirs(job.output_dir, exist_ok=True)
+        start = time.perf_counter()
+        run_clustering(params, points, centers, output_dir=job.output_dir,
+                       **job.options)
+        return time.perf_counter() - start
+    finally:
+        # the arrays must not outlive the block
+        points = centers = None
+        shm.close()
+
+
+def _output_dirs(paths, output_dir):
+    """
+    :return: an output directory per data-set, named after its file (and its
+             index, when the names collide)
+    """
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    dirs = []
+    for i, name in enumerate(names):
+        if names.count(name) > 1:
+            name = f"{name}_{i}"
+        dirs.append(os.path.join(output_dir, name))
+    return dirs
+
+
+def run_batch(datasets, output_dir, k=None, n_workers=None, max_pending=None,
+              log=print, **options):
+    """
+    Clusters each data-set with main.run_clustering, in a pool of processes.
+    :param datasets: a directory or a manifest (see find_datasets), or a list
+                     of (path, k)
+    :param output_dir: directory to save the output files of each data-set to,
+                       in a sub-directory named after it
+    :param k: the k of the data-sets that don't have one in the manifest, None
+              means the eigengap heuristic's k (as params.random)
+    :param n_workers: amount of processes, None means a process per CPU
+    :param max_pending: maximal amount of data-sets in shared memory at once,
+                        None means twice n_workers
+    :param log: function to print the progress with, None for silence
+    :param options: options of run_clustering for all of the data-sets, e.g.
+                    skip_visualization=True
+    :return: BatchReport of the batch
+    """
+    if isinstance(datasets, str):
+        datasets = find_datasets(datasets)
+    n_workers = n_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * n_workers
+    output_dirs = _output_dirs([path for path, _ in datasets], output_dir)
+    report = BatchReport()
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            # the job is done, so its block can be freed
+            name, shm = pending.pop(future)
+            _free_shared_memory(shm)
+            if isinstance(result, Exception):
+                report.failures[name] = repr(result)
+            else:
+                report.job_times[name] = result
+            if log is not None:
+                log(f"- {name}: " + (f"{report.job_times[name]:.3f} sec"
+                                     if name in report.job_times else
+                                     f"failed, {report.failures[name]}"))
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(n_workers) as executor:
+            for (path, dataset_k), job_dir in zip(datasets, output_dirs):
+                name = os.path.basename(job_dir)
+                try:
+                    points, centers = load_data(path)
+                except (OSError, ValueError) as e:
+                    report.failures[name] = repr(e)
+                    if log is not None:
+                        log(f"- {name}: failed, {report.failures[name]}")
+                    continue
+                dataset_k = k if dataset_k is None else dataset_k
+                shm = _to_shared_memory(points, centers)
+                job = BatchJob(name, shm.name, points.shape[0],
+                               points.shape[1],
+                               dataset_k if dataset_k is not None
+                               else len(np.unique(centers)),
+                               dataset_k is None, job_dir, options)
+                try:
+                    future = executor.submit(_run_job, job)
+                except BaseException:
+                    _free_shared_memory(shm)
+                    raise
+                pending[future] = (name, shm)
+                report.n_datasets += 1
+                report.n_points += points.shape[0]
+                if len(pending) >= max_pending:
+                    collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            collect(list(pending))
+    finally:
+        # left by an error - the pool is shut down, so no job uses them
+        for _, shm in pending.values():
+            _free_shared_memory(shm)
+    report.wall_time = time.perf_counter() - start
+    return report
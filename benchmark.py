@@ -0,0 +1,275 @@
+"""
+----- Benchmark Module -----
+Times each phase of a full run over a grid of (n, k, d), fits a scaling curve
+to each phase, and re-derives the Max Capacity constants of config for the
+current machine (see README.md). The results are saved as JSON, so runs of
+different commits (or machines) can be compared, to catch regressions.
+"""
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from itertools import product
+import numpy as np
+import config
+import mykmeanssp as km
+from initialization import make_blobs
+from kmeans_pp import k_means_pp, kmeans_fit
+from linalg import smallest_eigenpairs, eigengap_method
+from output_data import calc_jaccard, print_data_txt, print_clusters_txt, \
+    visualization_pdf
+from spectral_clustering import form_dense_laplacian, form_t
+
+# The phases of a full run (see main.run_clustering), in order
+PHASES = ("form_laplacian", "eigenpairs", "eigengap", "spectral_kmeans",
+          "k_means_pp", "kmeans", "jaccard", "output")
+# The default grid of the benchmark
+BENCH_NS = (250, 500, 1000, 2000)
+BENCH_KS = (10, 100)
+BENCH_DIMS = (2, 3)
+BENCH_RANDOM_SEED = 0
+# Max Capacity is the {n,k} a full run takes exactly 4:59 minutes for
+CAPACITY_TIME_LIMIT = 299.0
+# k of the Max Capacity, relative to its n (as the original 350 / 470)
+CAPACITY_K_RATIO = 0.75
+# A phase regressed if it got slower by more than this factor, and by more
+# than REGRESSION_MIN_TIME seconds (shorter timings are mostly noise)
+REGRESSION_TOLERANCE = 1.25
+REGRESSION_MIN_TIME = 0.005
+
+
+@contextmanager
+def _output_to(directory):
+    """
+    Temporarily redirects the output files of config to the given directory.
+    """
+    names = ("FNAME_DATA_TXT", "FNAME_CLUSTERS_TXT", "FNAME_VIS_PDF")
+    saved = {name: getattr(config, name) for name in names}
+    try:
+        for name in names:
+            setattr(config, name, os.path.join(directory, saved[name]))
+        yield
+    finally:
+        for name, fname in saved.items():
+            setattr(config, name, fname)
+
+
+def time_phases(n, k, d, random_state=BENCH_RANDOM_SEED):
+    """
+    Runs the clustering as main.run_clustering does (with a given k), timing
+    each phase.
+    :param n: amount of points
+    :param k: amount of clusters
+    :param d: dimensions of the points
+    :param random_state: seed of the generated points
+    :return: dict from each phase of PHASES to its wall time, in seconds
+    """
+    points, centers = make_blobs(n, d, centers=k, random_state=random_state)
+    points = points.astype(np.float32)
+    times = {}
+    clock = time.perf_counter()
+
+    def lap(phase):
+        nonlocal clock
+        now = time.perf_counter()
+        times[phase] = now - clock
+        clock = now
+
+    # NSC:
+    l = form_dense_laplacian(points)
+    lap("form_laplacian")
+    e_values, e_vectors = smallest_eigenpairs(l, k)
+    lap("eigenpairs")
+    t = form_t(e_vectors[:, eigengap_method(e_values, k)])
+    lap("eigengap")
+    spectral_clusters, _ = kmeans_fit(t, k, n, k, config.MAX_ITER)
+    lap("spectral_kmeans")
+    # KMEANS (the initialization and the C extension apart):
+    indices = k_means_pp(k, points)
+    lap("k_means_pp")
+    kmeans_clusters = np.empty(n, dtype=np.int32)
+    km.kmeans_fit(points, indices, k, n, d, config.MAX_ITER, kmeans_clusters,
+                  np.empty((k, d)))
+    lap("kmeans")
+    # OUTPUT:
+    spectral_jaccard = calc_jaccard(centers, spectral_clusters)
+    kmeans_jaccard = calc_jaccard(centers, kmeans_clusters)
+    lap("jaccard")
+    with tempfile.TemporaryDirectory() as directory, _output_to(directory):
+        print_data_txt(points, centers)
+        print_clusters_txt(k, spectral_clusters, kmeans_clusters)
+        visualization_pdf(k, points, kmeans_clusters, spectral_clusters, k,
+                          spectral_jaccard, kmeans_jaccard)
+    lap("output")
+    return times
+
+
+def fit_scaling(records):
+    """
+    Fits t = a * n^b * k^c to the timings of each phase (least squares, in
+    log-space).
+    :param records: list of dicts with 'n', 'k' and 'times' (of time_phases)
+    :return: dict from each phase to its fit, a dict of 'a', 'b' and 'c'
+             (with a single k in the records, c is 0)
+    """
+    n = np.array([r["n"] for r in records], dtype=np.float64)
+    k = np.array([r["k"] for r in records], dtype=np.float64)
+    columns = [np.ones_like(n), np.log(n)]
+    if len(np.unique(k)) > 1:
+        columns.append(np.log(k))
+    x = np.stack(columns, axis=1)
+    fits = {}
+    for phase in PHASES:
+        # clamped, as log(0) is undefined and such timings are noise anyway
+        t = np.array([max(r["times"][phase], 1e-7) for r in records])
+        coefficients = np.linalg.lstsq(x, np.log(t), rcond=None)[0]
+        fits[phase] = {"a": float(np.exp(coefficients[0])),
+                       "b": float(coefficients[1]),
+                       "c": float(coefficients[2]) if len(coefficients) > 2
+                       else 0.0}
+    return fits
+
+
+def predict_time(fits, n, k):
+    """
+    :param fits: the fits of each phase (see fit_scaling)
+    :return: the predicted time of a full run on n points and k clusters
+    """
+    return sum(f["a"] * n ** f["b"] * k ** f["c"] for f in fits.values())
+
+
+def derive_capacity(fits, time_limit=CAPACITY_TIME_LIMIT,
+                    k_ratio=CAPACITY_K_RATIO):
+    """
+    Finds the Max Capacity by binary search on the fitted curves - the biggest
+    n (with k = k_ratio * n) that a full run is predicted to take at most
+    time_limit seconds for.
+    Note: usually extrapolates far beyond the benchmark's grid
+    :param fits: the fits of each phase (see fit_scaling)
+    :return: (n, k) of the Max Capacity
+    """
+    def k_of(n):
+        return max(1, int(k_ratio * n))
+
+    low, high = 1, 2
+    while predict_time(fits, high, k_of(high)) <= time_limit:
+        low, high = high, high * 2
+        if high > 2 ** 40:
+            # doesn't grow with n
+            break
+    while high - low > 1:
+        middle = (low + high) // 2
+        if predict_time(fits, middle, k_of(middle)) <= time_limit:
+            low = middle
+        else:
+            high = middle
+    return low, k_of(low)
+
+
+def _git_commit():
+    """
+    :return: the hash of the current git commit, None when unavailable
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(ns=BENCH_NS, ks=BENCH_KS, dims=BENCH_DIMS, repeat=1,
+                  log=print):
+    """
+    Times each phase over the grid of ns x ks x dims (skipping k >= n), fits
+    the scaling curves and derives the capacities of each dimension.
+    :param repeat: amount of runs of each grid point, the fastest one is kept
+    :param log: function to print the progress with, None for silence
+    :return: the results, a JSON-serializable dict
+    """
+    # warms up (imports, allocations) so the first grid point isn't slower
+    time_phases(min(ns), min(ks), min(dims))
+    records = []
+    for d, n, k in product(dims, ns, ks):
+        if k >= n:
+            continue
+        runs = [time_phases(n, k, d) for _ in range(repeat)]
+        times = {phase: min(r[phase] for r in runs) for phase in PHASES}
+        records.append({"n": n, "k": k, "d": d, "times": times})
+        if log is not None:
+            log(f"- d = {d}, n = {n}, k = {k}: {sum(times.values()):.3f} sec")
+
+    fits, capacities = {}, {}
+    for d in dims:
+        fits[str(d)] = fit_scaling([r for r in records if r["d"] == d])
+        n, k = derive_capacity(fits[str(d)])
+        capacities[f"MAX_N_{d}D_CAPACITY"] = n
+        capacities[f"MAX_K_{d}D_CAPACITY"] = k
+    return {"commit": _git_commit(),
+            "machine": {"platform": platform.platform(),
+                        "processor": platform.processor(),
+                        "python": platform.python_version(),
+                        "cpu_count": os.cpu_count()},
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "records": records,
+            "fits": fits,
+            "capacities": capacities}
+
+
+def save_results(results, fname):
+    """
+    :param results: results of a benchmark (see run_benchmark)
+    :param fname: path of the JSON file to write
+    """
+    with open(fname, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(fname):
+    """
+    :param fname: path of a JSON file of save_results
+    :return: the results of the benchmark
+    """
+    with open(fname) as f:
+        return json.load(f)
+
+
+def compare_results(baseline, results, tolerance=REGRESSION_TOLERANCE,
+                    min_time=REGRESSION_MIN_TIME):
+    """
+    :param baseline: results of an earlier benchmark (see run_benchmark)
+    :param results: results of the current benchmark
+    :return: list of the regressions, a dict per phase of a grid point (of
+             both benchmarks) that got slower by more than the tolerance
+    """
+    baseline_times = {(r["n"], r["k"], r["d"]): r["times"]
+                      for r in baseline["records"]}
+    regressions = []
+    for record in results["records"]:
+        before = baseline_times.get((record["n"], record["k"], record["d"]))
+        if before is None:
+            continue
+        for phase, after in record["times"].items():
+            if phase in before and after > before[phase] * tolerance and \
+                    after - before[phase] > min_time:
+                regressions.append({"n": record["n"], "k": record["k"],
+                                    "d": record["d"], "phase": phase,
+                                    "before": before[phase], "after": after})
+    return regressions
+
+
+def update_config(capacities, fname="config.py"):
+    """
+    Rewrites the Max Capacity constants of the config file.
+    :param capacities: dict from the constants' names to their values
+    """
+    with open(fname) as f:
+        source = f.read()
+    for name, value in capacities.items():
+        source = re.sub(rf"^{name} = \d+$", f"{name} = {value}", source,
+                        flags=re.M)
+    with open(fname, "w") as f:
+        f.write(source)
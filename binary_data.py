@@ -0,0 +1,183 @@
+"""
+----- Binary Data Module -----
+A binary container for the data-sets and the results, as an alternative to
+'data.txt' - loaded with np.memmap so big data-sets are never parsed or read
+into memory at once.
+The points are kept as float32 (about 7 significant digits), so unlike the 6
+decimals of 'data.txt', coordinates above about 10 are rounded.
+Layout (little-endian):
+    header - the magic bytes, n, d, and the amount of label arrays (1 or 3)
+    points - n*d float32 values, row by row
+    labels - n int32 values per label array: the real centers, and optionally
+             the spectral clustering's and the K-means' clusters
+"""
+import os
+import struct
+from dataclasses import dataclass
+from itertools import islice
+import numpy as np
+
+# Identifies the binary files, and the version of their layout
+MAGIC = b"NSCDATA1"
+HEADER_FORMAT = "<8sqqq"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+POINTS_DTYPE = np.dtype("<f4")
+LABELS_DTYPE = np.dtype("<i4")
+# Amount of lines the converters read / write at once
+CONVERT_CHUNK_SIZE = 2 ** 16
+
+
+@dataclass
+class BinaryData:
+    """
+    A data class to hold the (memory-mapped) arrays of a binary file.
+    """
+    points: np.ndarray
+    centers: np.ndarray
+    spectral_clusters: np.ndarray = None
+    kmeans_clusters: np.ndarray = None
+
+
+def is_binary(fname):
+    """
+    :param fname: path of a file
+    :return: True iff the file is in the binary format
+    """
+    with open(fname, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _create(fname, n, d, n_labels):
+    """
+    Creates a binary file of the given sizes, and maps its arrays.
+    :return: the points array, and a list of the label arrays (memory-mapped,
+             writable)
+    """
+    with open(fname, "wb") as f:
+        f.write(struct.pack(HEADER_FORMAT, MAGIC, n, d, n_labels))
+        f.truncate(HEADER_SIZE + n * d * POINTS_DTYPE.itemsize +
+                   n_labels * n * LABELS_DTYPE.itemsize)
+    return _map(fname, "r+")
+
+
+def _map(fname, mode):
+    """
+    :param fname: path of a binary file
+    :param mode: np.memmap mode, 'r' or 'r+'
+    :return: the points array, and a list of the label arrays (memory-mapped)
+    """
+    with open(fname, "rb") as f:
+        magic, n, d, n_labels = struct.unpack(HEADER_FORMAT,
+                                              f.read(HEADER_SIZE))
+    if magic != MAGIC:
+        raise ValueError(f"'{fname}' isn't a binary data file")
+    points = np.memmap(fname, POINTS_DTYPE, mode, HEADER_SIZE, (n, d))
+    labels_offset = HEADER_SIZE + n * d * POINTS_DTYPE.itemsize
+    labels = [np.memmap(fname, LABELS_DTYPE, mode,
+                        labels_offset + i * n * LABELS_DTYPE.itemsize, (n,))
+              for i in range(n_labels)]
+    return points, labels
+
+
+def save_binary(fname, points, centers, spectral_clusters=None,
+                kmeans_clusters=None):
+    """
+    :param fname: path of the binary file to write
+    :param points: array of shape (n,d), saved as float32
+    :param centers: The REAL center corresponding to each point
+    :param spectral_clusters: optional - the cluster of each point by the
+                              spectral clustering (both clusters arrays, or
+                              none of them)
+    :param kmeans_clusters: optional - the cluster of each point by K-means
+    """
+    n, d = points.shape
+    labels = [centers]
+    if spectral_clusters is not None or kmeans_clusters is not None:
+        labels += [spectral_clusters, kmeans_clusters]
+    # written aside and then renamed, as the arrays may be mapped from 'fname'
+    tmp_fname = fname + ".tmp"
+    out_points, out_labels = _create(tmp_fname, n, d, len(labels))
+    out_points[:] = points
+    for out, array in zip(out_labels, labels):
+        out[:] = array
+    out_points.flush()
+    for out in out_labels:
+        out.flush()
+    del out_points, out_labels
+    os.replace(tmp_fname, fname)
+
+
+def load_binary(fname):
+    """
+    :param fname: path of a binary file
+    :return: BinaryData of the file's arrays, memory-mapped (read-only) - so
+             only the parts that are used are read from the disk
+    """
+    points, labels = _map(fname, "r")
+    return BinaryData(points, *labels)
+
+
+def load_data(fname):
+    """
+    :param fname: path of a data-set - a binary file, or a 'data.txt' file
+    :return: the points (array of shape (n,d)) and the real center of each
+             point (n-sized int32 array), memory-mapped for a binary file
+    """
+    if is_binary(fname):
+        data = load_binary(fname)
+        return data.points, data.centers
+    data = np.loadtxt(fname, delimiter=',', ndmin=2)
+    return data[:, :-1], data[:, -1].astype(np.int32)
+
+
+def txt_to_binary(txt_fname, bin_fname, chunk_size=CONVERT_CHUNK_SIZE):
+    """
+    Converts a 'data.txt' file (a line per point, its coordinates and then its
+    center, separated by commas) to a binary file, a chunk of lines at a time.
+    :param txt_fname: path of the txt file to read
+    :param bin_fname: path of the binary file to write
+    :param chunk_size: amount of lines to parse at once
+    """
+    # a first pass only counts the points, so the binary file is created once
+    # (blank lines and comments are skipped, as np.loadtxt does)
+    n = d = 0
+    with open(txt_fname, "rb") as f:
+        for line in f:
+            line = line.partition(b"#")[0]
+            if line.strip():
+                d = d or line.count(b",")
+                n += 1
+    points, (centers,) = _create(bin_fname, n, d, 1)
+
+    with open(txt_fname) as f:
+        start = 0
+        for chunk in iter(lambda: list(islice(f, chunk_size)), []):
+            lines = [line for line in chunk if line.partition("#")[0].strip()]
+            if not lines:
+                continue
+            data = np.loadtxt(lines, delimiter=',', ndmin=2)
+            points[start:start + len(data)] = data[:, :-1]
+            centers[start:start + len(data)] = data[:, -1]
+            start += len(data)
+    points.flush()
+    centers.flush()
+
+
+def binary_to_txt(bin_fname, txt_fname, chunk_size=CONVERT_CHUNK_SIZE):
+    """
+    Converts a binary file to a 'data.txt' file (in the format of
+    output_data.print_data_txt), a chunk of points at a time.
+    :param bin_fname: path of the binary file to read
+    :param txt_fname: path of the txt file to write
+    :param chunk_size: amount of lines to format at once
+    """
+    data = load_binary(bin_fname)
+    n, d = data.points.shape
+    format_arr = ["%f"] * d + ["%d"]
+    with open(txt_fname, "w") as f:
+        for start in range(0, n, chunk_size):
+            end = min(start + chunk_size, n)
+            output_array = np.empty((end - start, d + 1))
+            output_array[:, :-1] = data.points[start:end]
+            output_array[:, -1] = data.centers[start:end]
+            np.savetxt(f, output_array, fmt=format_arr, delimiter=',')
@@ -13,8 +13,14 @@ MAX_N_2D_CAPACITY = 470
 MAX_K_2D_CAPACITY = 350
 MAX_N_3D_CAPACITY = 470
 MAX_K_3D_CAPACITY = 350
+# Maximal amount of elements in each temporary block of distances, when
+# searching for the neighbours of the sparse affinity graphs, and in each tile
+# of the dense laplacian
+AFFINITY_BLOCK_SIZE = 2 ** 22
 
 # Misc.
 FNAME_DATA_TXT = "data.txt"
+FNAME_DATA_BIN = "data.bin"
 FNAME_CLUSTERS_TXT = "clusters.txt"
 FNAME_VIS_PDF = "clusters.pdf"
+FNAME_METRICS_JSON = "metrics.json"
@@ -0,0 +1,173 @@
+"""
+----- Eigen Cache Module -----
+A content-addressed cache of the laplacian's eigenpairs - keyed by a hash of
+the points and of the settings they were computed with, so repeated analyses
+of the same points (e.g. forcing k after looking at the eigengap method's
+choice) skip the weights, the laplacian and the eigensolver.
+Kept in memory and optionally on disk, each with its own size bound, and the
+least recently used entries are evicted first.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+
+# Default maximal size of the arrays the cache keeps in memory / on disk
+CACHE_MEMORY_BYTES = 2 ** 30
+CACHE_DISK_BYTES = 2 ** 32
+CACHE_FILE_EXTENSION = ".npz"
+
+
+def cache_key(points, settings):
+    """
+    :param points: array of shape (n,d)
+    :param settings: tuple of everything the eigenpairs depend on other than
+                     the points (a tuple of str, numbers and None)
+    :return: hex digest that identifies the points and the settings
+    """
+    points = np.ascontiguousarray(points)
+    h = hashlib.sha256()
+    h.update(repr((points.dtype.str, points.shape, settings)).encode())
+    h.update(memoryview(points).cast("B"))
+    return h.hexdigest()
+
+
+class EigenCache:
+    """
+    LRU cache from a cache_key to eigenpairs - the smallest eigenvalues
+    (ascending) and their eigenvectors. Besides them, an entry knows how many
+    of them the eigengap method looks at when k isn't forced (n_auto), if they
+    were computed without forcing k.
+    """
+    def __init__(self, max_bytes=CACHE_MEMORY_BYTES, directory=None,
+                 max_disk_bytes=CACHE_DISK_BYTES):
+        """
+        :param max_bytes: maximal size of the entries kept in memory
+        :param directory: optional - a directory to keep the entries in too,
+                          which can be shared between runs
+        :param max_disk_bytes: maximal size of the entries' files in directory
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, k=None):
+        """
+        :param key: cache_key of the points and the settings
+        :param k: the amount of eigenpairs needed, None for the amount the
+                  eigengap method looks at when k isn't forced
+        :return: (values, vectors) of the first k (or n_auto) eigenpairs, None
+                 when the cache doesn't have them
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif self.directory is not None:
+            entry = self._load(key)
+        n_wanted = None if entry is None else (entry[2] if k is None else k)
+        if n_wanted is None or n_wanted > len(entry[0]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        values, vectors, _ = entry
+        return values[:n_wanted], vectors[:, :n_wanted]
+
+    def put(self, key, values, vectors, n_auto=None):
+        """
+        Adds eigenpairs to the cache, merged with the entry it already has for
+        the key (the bigger set of eigenpairs is kept).
+        :param n_auto: the amount of eigenpairs the eigengap method looks at
+                       when k isn't forced - len(values) if they were computed
+                       without forcing k, otherwise None
+        """
+        old = self._entries.get(key)
+        if old is None and self.directory is not None:
+            old = self._load(key)
+        if old is not None:
+            if len(old[0]) > len(values):
+                values, vectors = old[0], old[1]
+            n_auto = old[2] if n_auto is None else n_auto
+        entry = (np.asarray(values), np.asarray(vectors), n_auto)
+        self._remember(key, entry)
+        if self.directory is not None:
+            self._save(key, entry)
+
+    def _remember(self, key, entry):
+        """
+        Keeps the entry in memory, evicting the least recently used entries.
+        """
+        if key in self._entries:
+            self._size -= self._entry_bytes(self._entries.pop(key))
+        size = self._entry_bytes(entry)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = entry
+        self._size += size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= self._entry_bytes(evicted)
+
+    @staticmethod
+    def _entry_bytes(entry):
+        return entry[0].nbytes + entry[1].nbytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_FILE_EXTENSION)
+
+    def _load(self, key):
+        """
+        :return: the entry of the key from the directory (and keeps it in
+                 memory), None when it isn't there
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as f:
+                n_auto = int(f["n_auto"])
+                entry = (f["values"], f["vectors"],
+                         None if n_auto < 0 else n_auto)
+        except (OSError, KeyError, ValueError):
+            return None
+        # marks it as recently used, for the eviction of the files
+        os.utime(path)
+        self._remember(key, entry)
+        return entry
+
+    def _save(self, key, entry):
+        """
+        Writes the entry to the directory, evicting the least recently used
+        files.
+        """
+        path = self._path(key)
+        # written aside and then renamed, so readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, values=entry[0], vectors=entry[1],
+                     n_auto=-1 if entry[2] is None else entry[2])
+        os.replace(tmp_path, path)
+
+        stats = []
+        for fname in os.listdir(self.directory):
+            if fname.endswith(CACHE_FILE_EXTENSION):
+                fname = os.path.join(self.directory, fname)
+                try:
+                    stat = os.stat(fname)
+                except FileNotFoundError:
+                    # evicted meanwhile, by another process
+                    continue
+                stats.append((stat.st_mtime, stat.st_size, fname))
+        total = 0
+        for _, size, fname in sorted(stats, reverse=True):
+            total += size
+            if total > self.max_disk_bytes and fname != path:
+                try:
+                    os.remove(fname)
+                except FileNotFoundError:
+                    pass
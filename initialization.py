@@ -6,10 +6,12 @@ Also deals  with generating random points intended to be clustered
 import argparse
 from dataclasses import dataclass
 import numpy as np
-from sklearn.datasets import make_blobs
 
 import config
 
+# The box the centers of make_blobs are drawn from
+CENTER_BOX = (-10.0, 10.0)
+
 
 @dataclass
 class ProgramParams:
@@ -80,6 +82,53 @@ def _generate_data_properties(dimensions):
     return n, k
 
 
+def _check_random_state(random_state):
+    """
+    :param random_state: None, int seed or np.random.RandomState
+    :return: np.random.RandomState - the global one for None
+    """
+    if random_state is None:
+        return np.random.mtrand._rand
+    if isinstance(random_state, np.random.RandomState):
+        return random_state
+    return np.random.RandomState(random_state)
+
+
+def make_blobs(n_samples, n_features, centers, cluster_std=1.0,
+               random_state=None):
+    """
+    Generates isotropic Gaussian blobs - the same points as
+    sklearn.datasets.make_blobs (for an int n_samples and centers), drawn from
+    the same random stream, without importing sklearn.
+    :param n_samples: The amount of points, split as equally as possible
+                      between the blobs
+    :param n_features: The dimensions of each point
+    :param centers: The amount of blobs
+    :param cluster_std: The standard deviation of the blobs
+    :param random_state: None, int seed or np.random.RandomState
+    :return: array of shape (n_samples, n_features) of the points, and the
+             n_samples-sized array of the blob of each point
+    """
+    generator = _check_random_state(random_state)
+    centers_arr = generator.uniform(CENTER_BOX[0], CENTER_BOX[1],
+                                    size=(centers, n_features))
+    n_per_center = np.full(centers, n_samples // centers)
+    n_per_center[:n_samples % centers] += 1
+    ends = np.cumsum(n_per_center)
+
+    points = np.empty((n_samples, n_features), dtype=np.float64)
+    labels = np.empty(n_samples, dtype=int)
+    for i, (start, end) in enumerate(zip(ends - n_per_center, ends)):
+        points[start:end] = generator.normal(loc=centers_arr[i],
+                                             scale=cluster_std,
+                                             size=(end - start, n_features))
+        labels[start:end] = i
+
+    indices = np.arange(n_samples)
+    generator.shuffle(indices)
+    return points[indices], labels[indices]
+
+
 def generate_points(args, dimensions=None, random_state=None):
     """
     Generate the points that the program will use.
@@ -1,20 +1,43 @@
 #include <Python.h>
 #include <math.h>
+#include <string.h>
+#ifndef _WIN32
+#include <pthread.h>
+#endif
 
 /*================================ MACROS ==================================*/
 
 /* Frees a given pointer iff it's not NULL */
 #define FREE_MEM(mem) if (NULL != (mem)) { free((mem)); }
-/* Frees all of the memory the program allocated */
+/* Frees all of the memory the program allocated, and releases the buffers */
 #define FREE_ALL_MEM() do{ \
         free_memory(observations, observations_mem_region, clusters, \
-            clusters_indices, K);} while(0);
+            clusters_indices, K); \
+        PyBuffer_Release(&obs_view); \
+        PyBuffer_Release(&indices_view);} while(0);
 /* Fail the program and free memory if condition `cond` happens */
 #define FAIL_IF(cond) if ((cond)) { FREE_ALL_MEM(); return error_msg(rc); }
+/* Frees the inertias of kmeans_fit, or releases them if given by the user */
+#define FIT_RELEASE_INERTIAS() do{ \
+        if (Py_None == inertias_obj) { FREE_MEM(inertias); } \
+        PyBuffer_Release(&inertias_view);} while(0);
+/* Same as FAIL_IF, and also releases the output buffers of kmeans_fit */
+#define FIT_FAIL_IF(cond) if ((cond)) { \
+        PyBuffer_Release(&labels_view); \
+        PyBuffer_Release(&centroids_view); \
+        FIT_RELEASE_INERTIAS(); \
+        FAIL_IF(1); }
 /* Value of an invalid cluster index, used for initializing the observations */
 #define INVALID_CLUSTER (-1)
 /* How accurate the equals sign will be */
 #define EPSILON (0.0001)
+/* 
+ * Relative slack given to the distance bounds of the accelerated algorithms,
+ * so rounding errors will never prune a cluster that Lloyd's scan would pick
+ */
+#define BOUNDS_TOLERANCE (1e-10)
+/* The same, for float32 observations (whose distances are calculated in float) */
+#define BOUNDS_TOLERANCE32 (1e-4)
 
 /*================================ ENUMS ===================================*/
 
@@ -35,6 +58,17 @@ typedef enum errors_e
     E_UNINITIALIZED = -1
 } errors_t;
 
+/* An enum that describes the different algorithms of the assignment step */
+typedef enum algorithm_e
+{
+    /* Lloyd's algorithm - compares each observation with every cluster */
+    ALGORITHM_LLOYD = 0,
+    /* Hamerly's algorithm - keeps 1 upper bound and 1 lower bound per obs. */
+    ALGORITHM_HAMERLY,
+    /* Elkan's algorithm - keeps 1 upper bound and K lower bounds per obs. */
+    ALGORITHM_ELKAN
+} algorithm_t;
+
 /*=============================== STRUCTS ==================================*/
 
 /* A struct that holds data related to the clusters */
@@ -42,12 +76,12 @@ typedef struct cluster_s
 {
     /*
      * mu - point to the d-vector represents the mu of the cluster
-     * obs_array - each element of the array points to an observation BELONGS 
-     *             to the cluster
-     * len - keeps track of the length of the array (mentioned above)
+     * mu32 - float32 copy of mu, that the distances of float32 observations
+     *        are calculated with (NULL for float64 observations)
+     * len - keeps track of the amount of observations BELONGS to the cluster
      */
     double * mu;
-    double ** obs_array;
+    float * mu32;
     int len;
 } cluster_t;
 
@@ -56,12 +90,127 @@ typedef struct obs_s
 {
     /*
      * data - points to the actual observation's d-vector
+     * data32 - the same, for float32 observations (the clusters' mu32 tells
+     *          which one of them is used)
      * cluster_index - index of the cluster the observation belongs to
      */
-    double * data;
+    union
+    {
+        double * data;
+        float * data32;
+    };
     int cluster_index;
 } obs_t;
 
+/* A struct that holds the distance bounds of the accelerated algorithms */
+typedef struct bounds_s
+{
+    /*
+     * upper - N-sized, upper bound of the distance of each observation from 
+     *         the mu of its cluster
+     * lower - lower bounds of the distance of each observation from the mu of
+     *         the other clusters: N-sized for Hamerly (bound of the second 
+     *         closest mu), N*K-sized for Elkan (a bound for each cluster)
+     * centers_dist - K*K-sized, the distance between every 2 mu (Elkan only)
+     * half_min_dist - K-sized, half of the distance of each mu from the 
+     *                 closest other mu
+     * drift - K-sized, the distance that each mu moved in the last update
+     * max_drift, second_max_drift - the 2 biggest drifts (Hamerly only)
+     * max_drift_cluster - the cluster that drifted the most (Hamerly only)
+     * Note: unlike everywhere else, these are *not* squared distances
+     */
+    double * upper;
+    double * lower;
+    double * centers_dist;
+    double * half_min_dist;
+    double * drift;
+    double max_drift;
+    double second_max_drift;
+    int max_drift_cluster;
+} bounds_t;
+
+/* A struct that holds the work of a single thread - a range of observations */
+typedef struct worker_s
+{
+    /*
+     * observations, clusters, bounds - shared by all of the workers, each 
+     *                                  worker writes only to its own range
+     * K, d, algorithm - K-Means algorithm arguments
+     * is_first_iter - 1 iff the bounds should be initialized (and not updated)
+     * start, end - the range [start, end) of the observations of this worker
+     * lens - K-sized, the amount of observations of each cluster in the range
+     * sums - K*d-sized, the share of the range in the new mu of each cluster
+     * mu32_t - shared, d*K-sized, the float32 mu of the clusters transposed
+     *          (see transpose_mu32), NULL unless Lloyd on float32 observations
+     * distances32 - K-sized, the distances of an observation (with mu32_t)
+     * thread, is_threaded - the thread that runs the worker, if there is one
+     */
+    obs_t * observations;
+    cluster_t * clusters;
+    bounds_t * bounds;
+    int K;
+    int d;
+    algorithm_t algorithm;
+    int is_first_iter;
+    int start;
+    int end;
+    int * lens;
+    double * sums;
+    const float * mu32_t;
+    float * distances32;
+#ifndef _WIN32
+    pthread_t thread;
+    int is_threaded;
+#endif
+} worker_t;
+
+/* A struct that holds the restarts run by a single thread, and the best one */
+typedef struct restart_s
+{
+    /*
+     * observations - shared by all of the restarts (read only), each thread 
+     *                clusters its own copy of the array
+     * clusters_indices - n_init*K-sized, the initial mu of each restart
+     * K, N, d, MAX_ITER, algorithm - K-Means algorithm arguments
+     * is_float32 - 1 iff the observations are float32 (see build_clusters)
+     * n_threads - number of threads each restart splits the observations 
+     *             between
+     * first, step, n_init - the thread runs the restarts first, first + step,
+     *                       ... (up to n_init)
+     * inertias - n_init-sized, shared by all of the threads, will contain the
+     *            inertia of each restart
+     * best - the restart of the smallest inertia (the first one on equal 
+     *        inertias), or -1 if none of them was done
+     * best_labels - N-sized, the cluster of each observation in the best one
+     * best_mu - K*d-sized, the final mu of each cluster in the best one
+     * best_iterations - number of iterations of the best one
+     * rc - the result of the restarts
+     * thread, is_threaded - the thread that runs the restarts, if there is one
+     */
+    const obs_t * observations;
+    const size_t * clusters_indices;
+    int K;
+    int N;
+    int d;
+    int MAX_ITER;
+    algorithm_t algorithm;
+    int is_float32;
+    int n_threads;
+    int first;
+    int step;
+    int n_init;
+    double * inertias;
+    int best;
+    int * best_labels;
+    double * best_mu;
+    int best_iterations;
+    errors_t rc;
+#ifndef _WIN32
+    pthread_t thread;
+    int is_threaded;
+#endif
+} restart_t;
+
 /*======================== FUNCTION DECLARATIONS ===========================*/
 
 /*
@@ -74,13 +223,233 @@ typedef struct obs_s
 static double euclidean_distance(const double * p, const double * q, int d);
 
 /*
- * Calculates MU and changes it in-place.
+ * Calculates the squared euclidean distance between 2 float32 points, in 
+ * float (the same as assign_lloyd32 does).
+ * @param p: First point
+ * @param q: Second point
+ * @param d: Dimension of points
+ * @returns: the squared euclidean distance between the points.
+ */
+static double euclidean_distance32(const float * p, const float * q, int d);
+
+/*
+ * Calculates the squared euclidean distance between an observation and the
+ * mu of a cluster, in the precision of the observations.
+ * @param obs: The observation
+ * @param cluster: The cluster
+ * @param d: Dimension of points
+ * @returns: the squared euclidean distance between them.
+ */
+static double obs_distance(const obs_t * obs, const cluster_t * cluster, 
+                           int d);
+
+/*
+ * Calculates the squared euclidean distance between the mu of 2 clusters, the
+ * one that the observations are measured with (mu32, for float32 ones).
+ * @param p: First cluster
+ * @param q: Second cluster
+ * @param d: Dimension of points
+ * @returns: the squared euclidean distance between them.
+ */
+static double mu_distance(const cluster_t * p, const cluster_t * q, int d);
+
+/*
+ * Calculates MU and changes it in-place, by merging the shares the workers
+ * summed (always in the same order, so the result is deterministic).
  * @param cluster: The cluster that we want to calculate its new MU
+ * @param cluster_index: The index of the cluster
+ * @param workers: The workers array, after running sum_worker
+ * @param n_workers: Number of workers
  * @param d: Dimension of points in the cluster
- * @param did_cluster_change: Will be 1 if MU changed, 0 otherwise.
+ * @param mu_shift: Will contain the squared distance between the old and the
+ *                  new MU (the cluster changed iff it's bigger than EPSILON)
+ * @param drift: Will contain the distance between the old and the new mu that
+ *               the observations are measured with (mu32, for float32 ones)
+ * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ */
+static errors_t calc_mu(cluster_t * cluster, int cluster_index, 
+                        const worker_t * workers, int n_workers, int d, 
+                        double * mu_shift, double * drift);
+
+/*
+ * The assignment step of a worker: assigns each observation in its range to
+ * the closest cluster (updating its bounds first, if needed), and counts the
+ * observations of each cluster in the range.
+ * @param arg: The worker (worker_t *)
+ * @returns: Always NULL.
+ */
+static void * assign_worker(void * arg);
+
+/*
+ * The update step of a worker: sums the share of each observation in its 
+ * range in the new mu of its cluster (for float32 observations, the 
+ * observations themselves - calc_mu divides their sum once).
+ * @param arg: The worker (worker_t *), the clusters' len should be updated
+ * @returns: Always NULL.
+ */
+static void * sum_worker(void * arg);
+
+/*
+ * Runs a step on all of the workers, each of them on its own thread (the 
+ * first one on the calling thread), and waits for all of them to finish.
+ * @param work: The step to run (assign_worker / sum_worker)
+ * @param workers: The workers array
+ * @param n_workers: Number of workers
+ */
+static void run_workers(void * (*work)(void *), worker_t * workers, 
+                        int n_workers);
+
+/*
+ * Allocates the workers and splits the observations between them.
+ * @param workers: Will contain the workers array
+ * @param n_workers: Number of workers, at most N
+ * @param observations: The observations array
+ * @param clusters: The clusters array
+ * @param bounds: The bounds of the observations
+ * @param N: Number of observations
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @param algorithm: The algorithm of the assignment step
+ * @param mu32_t: see worker_t, NULL unless Lloyd on float32 observations
+ * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ *           On failure, the user should still free the workers.
+ */
+static errors_t init_workers(worker_t ** workers, int n_workers, 
+                             obs_t * observations, cluster_t * clusters,
+                             bounds_t * bounds, int N, int K, int d, 
+                             algorithm_t algorithm, const float * mu32_t);
+
+/*
+ * Frees the memory of the workers.
+ * @param workers: The workers array
+ * @param n_workers: Number of workers
+ */
+static void free_workers(worker_t * workers, int n_workers);
+
+/*
+ * Finds the closest cluster to an observation, by comparing it with every
+ * cluster (Lloyd). On equal distances, the lowest index wins.
+ * @param obs: The observation
+ * @param clusters: The clusters array
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @returns: The index of the closest cluster.
+ */
+static int assign_lloyd(const obs_t * obs, const cluster_t * clusters, int K,
+                        int d);
+
+/*
+ * Same as assign_lloyd, for a float32 observation - the distances from all of
+ * the clusters are calculated together, dimension by dimension, so the loop
+ * over the clusters is vectorized. They are the same as euclidean_distance32.
+ * @param obs: The observation's d-vector
+ * @param mu32_t: The float32 mu of the clusters, transposed (see 
+ *                transpose_mu32)
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @param distances: K-sized, used for the distances
+ * @returns: The index of the closest cluster.
+ */
+static int assign_lloyd32(const float * obs, const float * mu32_t, int K, 
+                          int d, float * distances);
+
+/*
+ * Copies the float32 mu of the clusters into a d*K-sized array, so the j-th
+ * coordinate of the mu of the k-th cluster is at mu32_t[j * K + k].
+ * @param clusters: The clusters array, with mu32
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @param mu32_t: d*K-sized, will contain the transposed mu
+ */
+static void transpose_mu32(const cluster_t * clusters, int K, int d, 
+                           float * mu32_t);
+
+/*
+ * Finds the closest cluster to an observation using Hamerly's bounds. The 
+ * result is always the same as the one of assign_lloyd.
+ * @param obs: The observation
+ * @param clusters: The clusters array
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @param current: The current cluster of the observation, or INVALID_CLUSTER
+ *                 for a full scan that initializes the bounds
+ * @param upper: The upper bound of the observation, updated in-place
+ * @param lower: The lower bound of the observation, updated in-place
+ * @param half_min_dist: see bounds_t
+ * @returns: The index of the closest cluster.
+ */
+static int assign_hamerly(const obs_t * obs, const cluster_t * clusters, 
+                          int K, int d, int current, double * upper, 
+                          double * lower, const double * half_min_dist);
+
+/*
+ * Finds the closest cluster to an observation using Elkan's bounds. The 
+ * result is always the same as the one of assign_lloyd.
+ * @param obs: The observation
+ * @param clusters: The clusters array
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ * @param current: The current cluster of the observation, or INVALID_CLUSTER
+ *                 for a full scan that initializes the bounds
+ * @param upper: The upper bound of the observation, updated in-place
+ * @param lower: The K lower bounds of the observation, updated in-place
+ * @param centers_dist: see bounds_t
+ * @param half_min_dist: see bounds_t
+ * @returns: The index of the closest cluster.
+ */
+static int assign_elkan(const obs_t * obs, const cluster_t * clusters, 
+                        int K, int d, int current, double * upper, 
+                        double * lower, const double * centers_dist, 
+                        const double * half_min_dist);
+
+/*
+ * Allocates the bounds needed by the given algorithm (none for Lloyd).
+ * @param bounds: The bounds to allocate, all of its pointers should be NULL
+ * @param algorithm: The algorithm of the assignment step
+ * @param N: Number of observations
+ * @param K: Number of clusters
  * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ *           On failure, the user should still free the bounds.
+ */
+static errors_t init_bounds(bounds_t * bounds, algorithm_t algorithm, int N, 
+                            int K);
+
+/*
+ * Updates the bounds after the clusters' mu were updated: finds the biggest
+ * drifts, and recalculates the distances between the clusters.
+ * @param bounds: The bounds, its drift should contain the last drift of each mu
+ * @param algorithm: The algorithm of the assignment step (not Lloyd)
+ * @param clusters: The clusters array
+ * @param K: Number of clusters
+ * @param d: Dimension of points
+ */
+static void update_bounds(bounds_t * bounds, algorithm_t algorithm,
+                          const cluster_t * clusters, int K, int d);
+
+/*
+ * Loosens the bounds of an observation by the drift of the clusters' mu.
+ * @param bounds: The bounds, after update_bounds
+ * @param algorithm: The algorithm of the assignment step (not Lloyd)
+ * @param i: The index of the observation
+ * @param cluster_index: The current cluster of the observation
+ * @param K: Number of clusters
+ */
+static void loosen_bounds(bounds_t * bounds, algorithm_t algorithm, int i,
+                          int cluster_index, int K);
+
+/*
+ * Frees the memory of the bounds.
+ * @param bounds: The bounds to free
+ */
+static void free_bounds(bounds_t * bounds);
+
+/*
+ * Converts the name of an algorithm to its enum value.
+ * @param name: The name of the algorithm: "lloyd", "hamerly" or "elkan"
+ * @param algorithm: Will contain the algorithm
+ * @returns: E_SUCCESS on success, E_INVALID_INPUT for an unknown name.
  */
-static errors_t calc_mu(cluster_t * cluster, int d, int * did_cluster_change);
+static errors_t parse_algorithm(const char * name, algorithm_t * algorithm);
                                
 /*
  * Initializes the observations array, passed from Python.
@@ -98,6 +467,27 @@ static errors_t init_observations(PyObject * obs_lst, int N, int d,
                                   double ** observations_mem_region, 
                                   obs_t ** observations);
 
+/*
+ * Initializes the observations array from an object that exposes the buffer
+ * protocol (e.g. a C-contiguous float64 / float32 numpy array) - no Python
+ * objects are created on the way. Both are read in place - float32 data isn't
+ * widened, the distances to it are calculated in single precision.
+ * @param obs_view: C-contiguous view of the observations, with N*d elements
+ * @param N: Number of observations
+ * @param d: Dimension of each point in the observations
+ * @param observations: will contain the observations array
+ * @param is_float32: will contain 1 iff the observations are float32 (data32)
+ * @return E_SUCCESS on success, otherwise return the relevant error code. Also,
+ *  both on success and on failure, the observations array can be allocated,
+ *  so the user should free it in the calling function.
+ * @note: the observations array points into obs_view, so the view must be
+ *        kept until the observations are no longer used.
+ */
+static errors_t init_observations_from_buffer(const Py_buffer * obs_view, 
+                                              int N, int d, 
+                                              obs_t ** observations,
+                                              int * is_float32);
+
 /*
  * Initializes the cluster indices array, passed from Python.
  * @param indices_lst: Python's list of clusters indices
@@ -110,6 +500,72 @@ static errors_t init_observations(PyObject * obs_lst, int N, int d,
 static errors_t init_cluster_indices(PyObject * indices_lst, int K, 
                                      size_t ** clusters_indices);
 
+/*
+ * Initializes the cluster indices array from an object that exposes the buffer
+ * protocol (e.g. a 1-D numpy array of integers).
+ * @param indices_view: C-contiguous view of the K clusters indices
+ * @param K: Number of clusters
+ * @param N: Number of observations, every index must be in the range [0, N)
+ * @param clusters_indices: will contain the array of clusters indices
+ * @return E_SUCCESS on success, otherwise return the relevant error code. Also,
+ *  both on success and on failure, clusters_indices can be allocated, so the 
+ *  user should free it in the calling function.
+ */
+static errors_t init_cluster_indices_from_buffer(const Py_buffer * indices_view,
+                                                 int K, int N, 
+                                                 size_t ** clusters_indices);
+
+/*
+ * Returns the struct-module type code of the elements of a buffer, ignoring
+ * a native byte-order prefix.
+ * @param view: The buffer view (requested with PyBUF_FORMAT)
+ * @returns: The type code (e.g. 'd' for double), or '\0' if the format is not
+ *           a single native element.
+ */
+static char buffer_type_code(const Py_buffer * view);
+
+/*
+ * Initializes the observations and the cluster indices passed from Python,
+ * each of them given either as a list or as a buffer (see the functions above).
+ * @param obs_obj: Python's observations - list or buffer
+ * @param indices_obj: Python's clusters indices - list or buffer
+ * @param K: Number of clusters
+ * @param N: Number of observations
+ * @param d: Dimension of each point in the observations
+ * @param obs_view: will contain the view of obs_obj, if it is a buffer
+ * @param indices_view: will contain the view of indices_obj, if it is a buffer
+ * @param observations_mem_region: see init_observations
+ * @param observations: will contain the observations array
+ * @param is_float32: will contain 1 iff the observations are float32 (a
+ *                    float32 buffer, see init_observations_from_buffer)
+ * @param clusters_indices: will contain the array of clusters indices
+ * @return E_SUCCESS on success, otherwise return the relevant error code. Also,
+ *  both on success and on failure, the memory and the views can be allocated,
+ *  so the user should free / release them in the calling function.
+ */
+static errors_t init_inputs(PyObject * obs_obj, PyObject * indices_obj, 
+                            int K, int N, int d, 
+                            Py_buffer * obs_view, Py_buffer * indices_view,
+                            double ** observations_mem_region,
+                            obs_t ** observations, int * is_float32,
+                            size_t ** clusters_indices);
+
+/*
+ * Gets a writable, C-contiguous view of a Python object that will hold an
+ * output of this module.
+ * @param obj: The object to get the view of (e.g. a numpy array)
+ * @param view: will contain the view of obj
+ * @param type_code: The expected type code of the buffer's elements
+ * @param itemsize: The expected size of each element
+ * @param n_items: The expected amount of elements in the buffer
+ * @return E_SUCCESS on success, otherwise return the relevant error code. Also,
+ *  both on success and on failure, the view can be taken, so the user should
+ *  release it in the calling function.
+ */
+static errors_t get_output_buffer(PyObject * obj, Py_buffer * view, 
+                                  char type_code, Py_ssize_t itemsize, 
+                                  Py_ssize_t n_items);
+
 /*
  * Allocates memory for the clusters and initialize them.
  * @param observations: The observations array
@@ -118,6 +574,8 @@ static errors_t init_cluster_indices(PyObject * indices_lst, int K,
  * @param N: Number of observations
  * @param K: Number of clusters
  * @param d: Dimension of points in the clusters
+ * @param is_float32: 1 iff the observations are float32 (data32), then the
+ *                    clusters keep a float32 copy of their mu as well
  * @param clusters: Will contain the new clusters array
  * @returns: E_SUCCESS on success, otherwise return the relevant error code.
  * @note: If an error occurred, there is no need to free the clusters, the
@@ -125,7 +583,8 @@ static errors_t init_cluster_indices(PyObject * indices_lst, int K,
  */
 static errors_t build_clusters(obs_t * observations, 
                                const size_t * clusters_indices, int N, 
-                               int K, int d, cluster_t ** clusters);
+                               int K, int d, int is_float32, 
+                               cluster_t ** clusters);
 
 /*
  * Implementation of the KMeans algorithm.
@@ -135,10 +594,17 @@ static errors_t build_clusters(obs_t * observations,
  * @param K: Number of clusters
  * @param N: Number of observations
  * @param MAX_ITER: Maximum times the algorithm will iterate over the clusters
+ * @param algorithm: The algorithm of the assignment step. Hamerly and Elkan
+ *                   skip most distance calculations using triangle-inequality
+ *                   bounds, and give exactly the same results as Lloyd.
+ * @param n_threads: Number of threads to split the observations between
+ * @param iterations: will contain the number of iterations that were done
  * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ * @note: Doesn't use the Python API, so it can run without holding the GIL.
  */
 static errors_t kmeans_impl(obs_t * observations, cluster_t * clusters, int d, 
-                            int K, int N, int MAX_ITER);
+                            int K, int N, int MAX_ITER, algorithm_t algorithm,
+                            int n_threads, int * iterations);
 
 /*
  * Convert the results from a C array to Python's list
@@ -150,6 +616,57 @@ static errors_t kmeans_impl(obs_t * observations, cluster_t * clusters, int d,
 static errors_t convert_result_clusters(PyObject ** clusters_lst, int N, 
                                         obs_t * observations);
 
+/*
+ * Calculates the inertia of a clustering - the sum of the squared distances
+ * of the observations from the mu of their clusters.
+ * @param observations: The observations and their cluster indices
+ * @param clusters: The clusters array
+ * @param N: Number of observations
+ * @param d: Dimension of points
+ * @returns: The inertia.
+ */
+static double calc_inertia(const obs_t * observations, 
+                           const cluster_t * clusters, int N, int d);
+
+/*
+ * Runs the restarts of a thread one after the other, keeping the best one.
+ * @param arg: The restarts of the thread (restart_t *)
+ * @returns: Always NULL.
+ */
+static void * restart_worker(void * arg);
+
+/*
+ * Runs K-Means from each of n_init initializations, and keeps the result of
+ * the smallest inertia (the first one on equal inertias). The restarts run in
+ * parallel (up to n_threads of them at once), and each restart splits the 
+ * observations between its share of the rest of the threads - so the 
+ * results are deterministic for given n_init and n_threads, and a single
+ * restart is the same as kmeans_impl.
+ * @param observations: The observations array
+ * @param clusters_indices: n_init*K-sized, the indices of the observations to
+ *                          be the initial mu of each restart
+ * @param K: Number of clusters
+ * @param N: Number of observations
+ * @param d: Dimension of points
+ * @param MAX_ITER: Maximum iterations of each restart
+ * @param algorithm: The algorithm of the assignment step
+ * @param is_float32: 1 iff the observations are float32 (see build_clusters)
+ * @param n_init: Number of restarts
+ * @param n_threads: Number of threads
+ * @param labels: N-sized, will contain the cluster index of each observation
+ * @param centroids: K*d-sized, will contain the final mu of each cluster
+ * @param inertias: n_init-sized, will contain the inertia of each restart
+ * @param iterations: will contain the number of iterations of the best one
+ * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ * @note: Doesn't use the Python API, so it can run without holding the GIL.
+ */
+static errors_t run_restarts(const obs_t * observations, 
+                             const size_t * clusters_indices, int K, int N, 
+                             int d, int MAX_ITER, algorithm_t algorithm, 
+                             int is_float32, int n_init, int n_threads, int * labels, 
+                             double * centroids, double * inertias, 
+                             int * iterations);
+
 /*
  * Convert the error code to the relevant error message in Python.
  * @param rc: The C error code
@@ -172,9 +689,12 @@ static void free_memory(obs_t * observations,
 /*
  * K-Means(observations, centroids_indices, K, N, d, MAX_ITER)
  * gets 6 positional arguments:
- * @param 1: observations: N-sized List with D-sized tuples (with float values)
+ * @param 1: observations: N-sized List with D-sized tuples (with float values),
+ *                         or a C-contiguous float64 / float32 buffer of N*d
+ *                         elements (read in place, without conversion)
  * @param 2: centroids_indices: K-sized List of indices (integer) indicates the 
- *                              chosen observations from the list above
+ *                              chosen observations from the list above, or a
+ *                              C-contiguous buffer of K integers
  * @params 3-6: K,N,d,MAX_ITER: k-means algorithm arguments
  * @precondition: input is valid
  * @return N-sized list, where each element maps between the observation and its
@@ -182,6 +702,32 @@ static void free_memory(obs_t * observations,
  */
 static PyObject * kmeans_api(PyObject * self, PyObject * args);
 
+/*
+ * K-Means-Fit(observations, centroids_indices, K, N, d, MAX_ITER, labels,
+ *             centroids, *, algorithm="lloyd", n_threads=1, n_init=1, 
+ *             inertias=None)
+ * Same as K-Means, but writes its results into buffers allocated by the caller
+ * instead of creating a Python object for each observation.
+ * @params 1-6: same as K-Means, but centroids_indices has n_init*K indices -
+ *              the initialization of each restart
+ * @param 7: labels: writable N-sized int32 buffer, will contain the cluster
+ *                   index of each observation
+ * @param 8: centroids: writable C-contiguous float64 buffer of K*d elements,
+ *                      will contain the final centroid of each cluster
+ * @param algorithm: optional keyword, "lloyd", "hamerly" or "elkan"
+ * @param n_threads: optional keyword, number of threads to split the 
+ *                   observations between (the GIL is released while running)
+ * @param n_init: optional keyword, number of restarts - all of them use the
+ *                same parsed observations, and the one of the smallest 
+ *                inertia is kept
+ * @param inertias: optional keyword, writable float64 buffer of n_init 
+ *                  elements, will contain the inertia of each restart
+ * @precondition: input is valid
+ * @return The number of iterations of the kept restart. On error, return NULL
+ */
+static PyObject * kmeans_fit_api(PyObject * self, PyObject * args, 
+                                 PyObject * kwargs);
+
 /*=============================== FUNCTIONS ================================*/
 
 static double euclidean_distance(const double * p, const double * q, int d)
@@ -196,9 +742,52 @@ static double euclidean_distance(const double * p, const double * q, int d)
     return dis;
 }
 
-static errors_t calc_mu(cluster_t * cluster, int d, int * did_cluster_change)
+static double euclidean_distance32(const float * p, const float * q, int d)
+{
+    float dis = 0;
+    int i = 0;
+
+    for (i = 0; i < d; i++)
+    {
+        float diff = p[i] - q[i];
+        dis += diff * diff;
+    }
+    return dis;
+}
+
+static double obs_distance(const obs_t * obs, const cluster_t * cluster, 
+                           int d)
+{
+    if (NULL != cluster->mu32)
+    {
+        return euclidean_distance32(obs->data32, cluster->mu32, d);
+    }
+    return euclidean_distance(obs->data, cluster->mu, d);
+}
+
+static double mu_distance(const cluster_t * p, const cluster_t * q, int d)
+{
+    double dis = 0;
+    int i = 0;
+
+    if (NULL == p->mu32)
+    {
+        return euclidean_distance(p->mu, q->mu, d);
+    }
+    for (i = 0; i < d; i++)
+    {
+        double diff = (double)p->mu32[i] - q->mu32[i];
+        dis += diff * diff;
+    }
+    return dis;
+}
+
+static errors_t calc_mu(cluster_t * cluster, int cluster_index, 
+                        const worker_t * workers, int n_workers, int d, 
+                        double * mu_shift, double * drift)
 {
     double * new_mu = NULL;
+    const double * share = NULL;
     int i = 0;
     int j = 0;
 
@@ -208,24 +797,44 @@ static errors_t calc_mu(cluster_t * cluster, int d, int * did_cluster_change)
         return E_NO_MEMORY;
     }
 
-
-    for (i = 0; i < cluster->len; i++)
+    for (i = 0; i < n_workers; i++)
     {
+        share = workers[i].sums + (size_t)cluster_index * d;
         for (j = 0; j < d; j++)
         {
-            new_mu[j] += (cluster->obs_array[i][j]) / (cluster->len);
+            new_mu[j] += share[j];
         }
     }
-
-    /* Checks if change has happened */
-    *did_cluster_change = 0;
-    if (euclidean_distance(new_mu, cluster->mu, d) > EPSILON)
+    /* The shares of float32 observations are sums (see sum_worker) */
+    if (NULL != cluster->mu32 && 0 < cluster->len)
     {
-        *did_cluster_change = 1;
+        for (j = 0; j < d; j++)
+        {
+            new_mu[j] /= cluster->len;
+        }
     }
 
+    /* Keeps how much MU moved, to check if change has happened */
+    *mu_shift = euclidean_distance(new_mu, cluster->mu, d);
+    *drift = sqrt(*mu_shift);
+
     free(cluster->mu);
     cluster->mu = new_mu;
+    if (NULL != cluster->mu32)
+    {
+        /* 
+         * Far from the origin, rounding mu to float32 moves it by as much as
+         * the distances, so the bounds drift by mu32's own move (in double)
+         */
+        double drift32 = 0;
+        for (j = 0; j < d; j++)
+        {
+            double diff = (double)(float)new_mu[j] - cluster->mu32[j];
+            drift32 += diff * diff;
+            cluster->mu32[j] = (float)new_mu[j];
+        }
+        *drift = sqrt(drift32);
+    }
     return E_SUCCESS;
 }
 
@@ -276,6 +885,59 @@ static errors_t init_observations(PyObject * obs_lst, int N, int d,
     return E_SUCCESS;
 }
 
+static errors_t init_observations_from_buffer(const Py_buffer * obs_view, 
+                                              int N, int d, 
+                                              obs_t ** observations,
+                                              int * is_float32)
+{
+    int i = 0;
+    char type_code = buffer_type_code(obs_view);
+
+    if ((Py_ssize_t)N * d * obs_view->itemsize != obs_view->len)
+    {
+        return E_INVALID_INPUT;
+    }
+    if (2 == obs_view->ndim && 
+        (N != obs_view->shape[0] || d != obs_view->shape[1]))
+    {
+        return E_INVALID_INPUT;
+    }
+    if ('d' == type_code && sizeof(double) == obs_view->itemsize)
+    {
+        *is_float32 = 0;
+    }
+    else if ('f' == type_code && sizeof(float) == obs_view->itemsize)
+    {
+        *is_float32 = 1;
+    }
+    else
+    {
+        return E_BAD_VALUE;
+    }
+
+    *observations = malloc(N * sizeof(**observations));
+    if (NULL == *observations)
+    {
+        return E_NO_MEMORY;
+    }
+
+    /* Same layout as ours - read it in place */
+    for (i = 0; i < N; i++)
+    {
+        if (*is_float32)
+        {
+            (*observations)[i].data32 = (float *)obs_view->buf + (size_t)i * d;
+        }
+        else
+        {
+            (*observations)[i].data = (double *)obs_view->buf + (size_t)i * d;
+        }
+        /* Set the initial cluster to be invalid */
+        (*observations)[i].cluster_index = INVALID_CLUSTER;
+    }
+    return E_SUCCESS;
+}
+
 static errors_t init_cluster_indices(PyObject * indices_lst, int K, 
                                      size_t ** clusters_indices)
 {
@@ -305,110 +967,818 @@ static errors_t init_cluster_indices(PyObject * indices_lst, int K,
     return E_SUCCESS;
 }
 
-static errors_t build_clusters(obs_t * observations, 
-                               const size_t * clusters_indices, int N, 
-                               int K, int d, cluster_t ** clusters)
+static errors_t init_cluster_indices_from_buffer(const Py_buffer * indices_view,
+                                                 int K, int N, 
+                                                 size_t ** clusters_indices)
 {
     int i = 0;
-    int j = 0;
+    char type_code = buffer_type_code(indices_view);
+    const char * item = indices_view->buf;
 
-    /* Allocate memory for the clusters array */
-    cluster_t * temp_clust = calloc(K, sizeof(*temp_clust));
-    if (NULL == clusters)
+    if ((Py_ssize_t)K * indices_view->itemsize != indices_view->len)
+    {
+        return E_INVALID_INPUT;
+    }
+    if ('\0' == type_code || NULL == strchr("ilqn", type_code))
+    {
+        return E_BAD_VALUE;
+    }
+
+    *clusters_indices = malloc(sizeof(**clusters_indices) * K);
+    if (NULL == *clusters_indices)
     {
         return E_NO_MEMORY;
     }
 
-    for (i = 0; i < K; i++)
+    for (i = 0; i < K; i++, item += indices_view->itemsize)
     {
-        temp_clust[i].mu = calloc(d, sizeof(*temp_clust[i].mu));
-        temp_clust[i].obs_array = calloc(N, sizeof(*temp_clust[i].obs_array));
-        if (NULL == temp_clust[i].mu || NULL == temp_clust[i].obs_array)
+        long long index = 0;
+        switch (indices_view->itemsize)
         {
-            /* Free memory in case of an error */
-            for (j = 0; j < i; j++)
-            {
-                FREE_MEM(temp_clust[j].mu);
-                FREE_MEM(temp_clust[i].obs_array);
-            }
-            FREE_MEM(temp_clust);
-            return E_NO_MEMORY;
+        case sizeof(int):
+            index = *(const int *)item;
+            break;
+        case sizeof(long long):
+            index = *(const long long *)item;
+            break;
+        default:
+            return E_BAD_VALUE;
         }
-
-        for (j = 0; j < d; j++)
+        if (index < 0 || index >= N)
         {
-            /* Copy the clusters_indices[i] observation to be MU */
-            temp_clust[i].mu[j] = observations[clusters_indices[i]].data[j];
+            return E_INVALID_INDEX;
         }
+        (*clusters_indices)[i] = (size_t)index;
     }
 
-    /* Success - return the new clusters array */
-    *clusters = temp_clust;
     return E_SUCCESS;
 }
 
-static errors_t kmeans_impl(obs_t * observations, cluster_t * clusters, int d, 
-                            int K, int N, int MAX_ITER)
+static char buffer_type_code(const Py_buffer * view)
+{
+    const char * format = view->format;
+
+    if (NULL == format)
+    {
+        /* NULL format implies unsigned bytes */
+        return 'B';
+    }
+    if ('@' == format[0] || '=' == format[0])
+    {
+        format++;
+    }
+    if ('\0' == format[0] || '\0' != format[1])
+    {
+        return '\0';
+    }
+    return format[0];
+}
+
+static errors_t init_inputs(PyObject * obs_obj, PyObject * indices_obj, 
+                            int K, int N, int d, 
+                            Py_buffer * obs_view, Py_buffer * indices_view,
+                            double ** observations_mem_region,
+                            obs_t ** observations, int * is_float32,
+                            size_t ** clusters_indices)
 {
-    int did_cluster_change = 1;
-    int cluster_change_status = 0;
-    int iter_count = 0;
-    int i = 0;
-    int j = 0;
     errors_t rc = E_UNINITIALIZED;
 
-    while ((1 == did_cluster_change) && (iter_count < MAX_ITER))
+    /*
+     * Process Observations: python's obs_obj ---> observations_mem_region
+     * observations_mem_region - keeps observations in a contiguous memory block
+     *                           (not needed when given a buffer, which is 
+     *                           used in place)
+     * observations - an array of pointers; each pointer, points to the 
+     *                correspondent observation in the memory
+     */
+    *is_float32 = 0;
+    if (PyList_Check(obs_obj))
     {
-        /* Reset clusters */
-        for (i = 0; i < K; i++)
+        rc = init_observations(obs_obj, N, d, observations_mem_region, 
+                               observations);
+    }
+    else if (0 == PyObject_GetBuffer(obs_obj, obs_view, 
+                                     PyBUF_C_CONTIGUOUS | PyBUF_FORMAT))
+    {
+        rc = init_observations_from_buffer(obs_view, N, d, observations, 
+                                           is_float32);
+    }
+    else
+    {
+        rc = E_INVALID_INPUT;
+    }
+    if (E_SUCCESS != rc)
+    {
+        return rc;
+    }
+    
+    /* Process Indices: python's indices_obj ---> clusters_indices */
+    if (PyList_Check(indices_obj))
+    {
+        rc = init_cluster_indices(indices_obj, K, clusters_indices);
+    }
+    else if (0 == PyObject_GetBuffer(indices_obj, indices_view, 
+                                     PyBUF_C_CONTIGUOUS | PyBUF_FORMAT))
+    {
+        rc = init_cluster_indices_from_buffer(indices_view, K, N, 
+                                              clusters_indices);
+    }
+    else
+    {
+        rc = E_INVALID_INPUT;
+    }
+
+    return rc;
+}
+
+static errors_t get_output_buffer(PyObject * obj, Py_buffer * view, 
+                                  char type_code, Py_ssize_t itemsize, 
+                                  Py_ssize_t n_items)
+{
+    if (0 != PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | 
+                                           PyBUF_FORMAT | PyBUF_WRITABLE))
+    {
+        return E_INVALID_INPUT;
+    }
+    if (type_code != buffer_type_code(view) || itemsize != view->itemsize)
+    {
+        return E_BAD_VALUE;
+    }
+    if (n_items * itemsize != view->len)
+    {
+        return E_INVALID_INPUT;
+    }
+
+    return E_SUCCESS;
+}
+
+static errors_t build_clusters(obs_t * observations, 
+                               const size_t * clusters_indices, int N, 
+                               int K, int d, int is_float32, 
+                               cluster_t ** clusters)
+{
+    int i = 0;
+    int j = 0;
+
+    /* Allocate memory for the clusters array */
+    cluster_t * temp_clust = calloc(K, sizeof(*temp_clust));
+    if (NULL == temp_clust)
+    {
+        return E_NO_MEMORY;
+    }
+
+    for (i = 0; i < K; i++)
+    {
+        const obs_t * obs = &observations[clusters_indices[i]];
+
+        temp_clust[i].mu = calloc(d, sizeof(*temp_clust[i].mu));
+        if (is_float32)
         {
-            clusters[i].len = 0;
+            temp_clust[i].mu32 = calloc(d, sizeof(*temp_clust[i].mu32));
+        }
+        if (NULL == temp_clust[i].mu || 
+            (is_float32 && NULL == temp_clust[i].mu32))
+        {
+            /* Free memory in case of an error */
+            for (j = 0; j <= i; j++)
+            {
+                FREE_MEM(temp_clust[j].mu);
+                FREE_MEM(temp_clust[j].mu32);
+            }
+            FREE_MEM(temp_clust);
+            return E_NO_MEMORY;
+        }
+
+        for (j = 0; j < d; j++)
+        {
+            /* Copy the clusters_indices[i] observation to be MU */
+            if (is_float32)
+            {
+                temp_clust[i].mu32[j] = obs->data32[j];
+                temp_clust[i].mu[j] = obs->data32[j];
+            }
+            else
+            {
+                temp_clust[i].mu[j] = obs->data[j];
+            }
+        }
+    }
+
+    /* Success - return the new clusters array */
+    *clusters = temp_clust;
+    return E_SUCCESS;
+}
+
+static int assign_lloyd(const obs_t * obs, const cluster_t * clusters, int K,
+                        int d)
+{
+    int closest_cluster = 0;
+    int j = 0;
+    double closest_distance = obs_distance(obs, &clusters[0], d);
+
+    for (j = 1; j < K; j++)
+    {
+        double curr_distance = obs_distance(obs, &clusters[j], d);
+        if (curr_distance < closest_distance)
+        {
+            closest_cluster = j;
+            closest_distance = curr_distance;
+        }
+    }
+
+    return closest_cluster;
+}
+
+static int assign_lloyd32(const float * obs, const float * mu32_t, int K, 
+                          int d, float * distances)
+{
+    int closest_cluster = 0;
+    int j = 0;
+    int k = 0;
+    float closest_distance = 0;
+
+    for (k = 0; k < K; k++)
+    {
+        distances[k] = 0;
+    }
+    for (j = 0; j < d; j++)
+    {
+        const float coordinate = obs[j];
+        const float * mu_j = mu32_t + (size_t)j * K;
+        for (k = 0; k < K; k++)
+        {
+            float diff = coordinate - mu_j[k];
+            distances[k] += diff * diff;
+        }
+    }
+    /* Without branches, as the closest cluster is hard to predict */
+    closest_distance = distances[0];
+    for (k = 1; k < K; k++)
+    {
+        int is_closer = distances[k] < closest_distance;
+        closest_distance = is_closer ? distances[k] : closest_distance;
+        closest_cluster = is_closer ? k : closest_cluster;
+    }
+
+    return closest_cluster;
+}
+
+static void transpose_mu32(const cluster_t * clusters, int K, int d, 
+                           float * mu32_t)
+{
+    int j = 0;
+    int k = 0;
+
+    for (k = 0; k < K; k++)
+    {
+        for (j = 0; j < d; j++)
+        {
+            mu32_t[(size_t)j * K + k] = clusters[k].mu32[j];
         }
+    }
+}
 
-        /* Running over all observations */
-        for (i = 0; i < N; i++)
+static int assign_hamerly(const obs_t * obs, const cluster_t * clusters, 
+                          int K, int d, int current, double * upper, 
+                          double * lower, const double * half_min_dist)
+{
+    int closest_cluster = 0;
+    int j = 0;
+    double closest_distance = 0;
+    double second_distance = HUGE_VAL;
+    double tolerance = (NULL == clusters[0].mu32) ? BOUNDS_TOLERANCE : 
+                                                    BOUNDS_TOLERANCE32;
+
+    if (INVALID_CLUSTER != current)
+    {
+        /* Every other mu is farther than this bound, so nothing changed */
+        double bound = fmax(half_min_dist[current], *lower);
+        if (*upper * (1 + tolerance) < bound * (1 - tolerance))
         {
-            int closest_cluster = 0;
-            int pos;
-            double closest_distance = euclidean_distance(observations[i].data, 
-                                                         clusters[0].mu, d);
+            return current;
+        }
+        /* Tightens the upper bound and checks again */
+        *upper = sqrt(obs_distance(obs, &clusters[current], d));
+        if (*upper * (1 + tolerance) < bound * (1 - tolerance))
+        {
+            return current;
+        }
+    }
 
-            for (j = 1; j < K; j++)
+    /* Full scan, the same as Lloyd's, that also finds the second closest mu */
+    closest_distance = obs_distance(obs, &clusters[0], d);
+    for (j = 1; j < K; j++)
+    {
+        double curr_distance = obs_distance(obs, &clusters[j], d);
+        if (curr_distance < closest_distance)
+        {
+            second_distance = closest_distance;
+            closest_cluster = j;
+            closest_distance = curr_distance;
+        }
+        else if (curr_distance < second_distance)
+        {
+            second_distance = curr_distance;
+        }
+    }
+
+    *upper = sqrt(closest_distance);
+    *lower = sqrt(second_distance);
+    return closest_cluster;
+}
+
+static int assign_elkan(const obs_t * obs, const cluster_t * clusters, 
+                        int K, int d, int current, double * upper, 
+                        double * lower, const double * centers_dist, 
+                        const double * half_min_dist)
+{
+    int j = 0;
+    int is_tight = 0;
+    double closest_distance = 0;
+    double tolerance = (NULL == clusters[0].mu32) ? BOUNDS_TOLERANCE : 
+                                                    BOUNDS_TOLERANCE32;
+
+    if (INVALID_CLUSTER == current)
+    {
+        /* Full scan, the same as Lloyd's, that initializes all the bounds */
+        current = 0;
+        closest_distance = obs_distance(obs, &clusters[0], d);
+        lower[0] = sqrt(closest_distance);
+        for (j = 1; j < K; j++)
+        {
+            double curr_distance = obs_distance(obs, &clusters[j], d);
+            lower[j] = sqrt(curr_distance);
+            if (curr_distance < closest_distance)
             {
-                double curr_distance = euclidean_distance(observations[i].data, 
-                                                          clusters[j].mu, d);
-                if (curr_distance < closest_distance)
-                {
-                    closest_cluster = j;
-                    closest_distance = curr_distance;
-                }
+                current = j;
+                closest_distance = curr_distance;
             }
+        }
+        *upper = sqrt(closest_distance);
+        return current;
+    }
 
-            /* Append observation pointer to the closest cluster */
-            pos = clusters[closest_cluster].len;
-            clusters[closest_cluster].obs_array[pos] = observations[i].data;
-            clusters[closest_cluster].len++;
-            observations[i].cluster_index = closest_cluster;
+    /* Every other mu is farther than this bound, so nothing changed */
+    if (*upper * (1 + tolerance) < 
+        half_min_dist[current] * (1 - tolerance))
+    {
+        return current;
+    }
+
+    for (j = 0; j < K; j++)
+    {
+        double curr_distance = 0;
+        if (j == current)
+        {
+            continue;
+        }
+        /* Skips the clusters that are surely farther than the current one */
+        if (*upper * (1 + tolerance) < 
+            fmax(lower[j], centers_dist[current * K + j] / 2) * 
+            (1 - tolerance))
+        {
+            continue;
+        }
+        if (!is_tight)
+        {
+            closest_distance = obs_distance(obs, &clusters[current], d);
+            *upper = sqrt(closest_distance);
+            lower[current] = *upper;
+            is_tight = 1;
+            if (*upper * (1 + tolerance) < 
+                fmax(lower[j], centers_dist[current * K + j] / 2) * 
+                (1 - tolerance))
+            {
+                continue;
+            }
+        }
+        curr_distance = obs_distance(obs, &clusters[j], d);
+        lower[j] = sqrt(curr_distance);
+        /* On equal distances the lowest index wins, as in Lloyd's scan */
+        if (curr_distance < closest_distance || 
+            (curr_distance == closest_distance && j < current))
+        {
+            current = j;
+            closest_distance = curr_distance;
+            *upper = lower[j];
+        }
+    }
+
+    return current;
+}
+
+static errors_t init_bounds(bounds_t * bounds, algorithm_t algorithm, int N, 
+                            int K)
+{
+    if (ALGORITHM_LLOYD == algorithm)
+    {
+        return E_SUCCESS;
+    }
+
+    bounds->upper = malloc(N * sizeof(*bounds->upper));
+    bounds->half_min_dist = malloc(K * sizeof(*bounds->half_min_dist));
+    bounds->drift = malloc(K * sizeof(*bounds->drift));
+    if (ALGORITHM_ELKAN == algorithm)
+    {
+        bounds->lower = malloc((size_t)N * K * sizeof(*bounds->lower));
+        bounds->centers_dist = malloc((size_t)K * K * 
+                                      sizeof(*bounds->centers_dist));
+    }
+    else
+    {
+        bounds->lower = malloc(N * sizeof(*bounds->lower));
+        bounds->centers_dist = malloc(sizeof(*bounds->centers_dist));
+    }
+    if (NULL == bounds->upper || NULL == bounds->lower || 
+        NULL == bounds->centers_dist || NULL == bounds->half_min_dist || 
+        NULL == bounds->drift)
+    {
+        return E_NO_MEMORY;
+    }
+
+    return E_SUCCESS;
+}
+
+static void update_bounds(bounds_t * bounds, algorithm_t algorithm,
+                          const cluster_t * clusters, int K, int d)
+{
+    int i = 0;
+    int j = 0;
+
+    /* Finds the 2 biggest drifts */
+    bounds->max_drift = 0;
+    bounds->second_max_drift = 0;
+    bounds->max_drift_cluster = 0;
+    for (j = 0; j < K; j++)
+    {
+        if (bounds->drift[j] > bounds->max_drift)
+        {
+            bounds->second_max_drift = bounds->max_drift;
+            bounds->max_drift = bounds->drift[j];
+            bounds->max_drift_cluster = j;
+        }
+        else if (bounds->drift[j] > bounds->second_max_drift)
+        {
+            bounds->second_max_drift = bounds->drift[j];
+        }
+    }
+
+    /* Recalculates the distances between the clusters */
+    for (j = 0; j < K; j++)
+    {
+        bounds->half_min_dist[j] = HUGE_VAL;
+    }
+    for (i = 0; i < K; i++)
+    {
+        for (j = i + 1; j < K; j++)
+        {
+            double dist = sqrt(mu_distance(&clusters[i], &clusters[j], d));
+            if (ALGORITHM_ELKAN == algorithm)
+            {
+                bounds->centers_dist[i * K + j] = dist;
+                bounds->centers_dist[j * K + i] = dist;
+            }
+            bounds->half_min_dist[i] = fmin(bounds->half_min_dist[i], dist / 2);
+            bounds->half_min_dist[j] = fmin(bounds->half_min_dist[j], dist / 2);
+        }
+    }
+}
+
+static void loosen_bounds(bounds_t * bounds, algorithm_t algorithm, int i,
+                          int cluster_index, int K)
+{
+    int j = 0;
+
+    bounds->upper[i] += bounds->drift[cluster_index];
+    if (ALGORITHM_ELKAN == algorithm)
+    {
+        double * lower = bounds->lower + (size_t)i * K;
+        for (j = 0; j < K; j++)
+        {
+            lower[j] -= bounds->drift[j];
+        }
+    }
+    else
+    {
+        /* The second closest mu could have moved at most this much */
+        bounds->lower[i] -= (cluster_index == bounds->max_drift_cluster) ? 
+                            bounds->second_max_drift : bounds->max_drift;
+    }
+}
+
+static void free_bounds(bounds_t * bounds)
+{
+    FREE_MEM(bounds->upper);
+    FREE_MEM(bounds->lower);
+    FREE_MEM(bounds->centers_dist);
+    FREE_MEM(bounds->half_min_dist);
+    FREE_MEM(bounds->drift);
+}
+
+static errors_t parse_algorithm(const char * name, algorithm_t * algorithm)
+{
+    if (0 == strcmp(name, "lloyd"))
+    {
+        *algorithm = ALGORITHM_LLOYD;
+    }
+    else if (0 == strcmp(name, "hamerly"))
+    {
+        *algorithm = ALGORITHM_HAMERLY;
+    }
+    else if (0 == strcmp(name, "elkan"))
+    {
+        *algorithm = ALGORITHM_ELKAN;
+    }
+    else
+    {
+        return E_INVALID_INPUT;
+    }
+
+    return E_SUCCESS;
+}
+
+static void * assign_worker(void * arg)
+{
+    worker_t * worker = arg;
+    obs_t * observations = worker->observations;
+    bounds_t * bounds = worker->bounds;
+    int K = worker->K;
+    int d = worker->d;
+    int i = 0;
+
+    memset(worker->lens, 0, K * sizeof(*worker->lens));
+
+    for (i = worker->start; i < worker->end; i++)
+    {
+        int closest_cluster = 0;
+        /* The bounds are initialized by a full scan in the 1st iteration */
+        int current = worker->is_first_iter ? INVALID_CLUSTER : 
+                                              observations[i].cluster_index;
+
+        if (INVALID_CLUSTER != current && ALGORITHM_LLOYD != worker->algorithm)
+        {
+            loosen_bounds(bounds, worker->algorithm, i, current, K);
+        }
+
+        switch (worker->algorithm)
+        {
+        case ALGORITHM_HAMERLY:
+            closest_cluster = assign_hamerly(&observations[i], 
+                                             worker->clusters, K, d, current,
+                                             &bounds->upper[i], 
+                                             &bounds->lower[i], 
+                                             bounds->half_min_dist);
+            break;
+        case ALGORITHM_ELKAN:
+            closest_cluster = assign_elkan(&observations[i], 
+                                           worker->clusters, K, d, current, 
+                                           &bounds->upper[i],
+                                           &bounds->lower[(size_t)i * K],
+                                           bounds->centers_dist, 
+                                           bounds->half_min_dist);
+            break;
+        default:
+            if (NULL != worker->mu32_t)
+            {
+                closest_cluster = assign_lloyd32(observations[i].data32, 
+                                                 worker->mu32_t, K, d,
+                                                 worker->distances32);
+                break;
+            }
+            closest_cluster = assign_lloyd(&observations[i], 
+                                           worker->clusters, K, d);
+        }
+
+        observations[i].cluster_index = closest_cluster;
+        worker->lens[closest_cluster]++;
+    }
+
+    return NULL;
+}
+
+static void * sum_worker(void * arg)
+{
+    worker_t * worker = arg;
+    const obs_t * observations = worker->observations;
+    const cluster_t * clusters = worker->clusters;
+    int d = worker->d;
+    int i = 0;
+    int j = 0;
+
+    memset(worker->sums, 0, (size_t)worker->K * d * sizeof(*worker->sums));
+
+    for (i = worker->start; i < worker->end; i++)
+    {
+        int cluster_index = observations[i].cluster_index;
+        double * share = worker->sums + (size_t)cluster_index * d;
+        /* float32 observations are summed in double, and divided by the 
+         * len once (in calc_mu) */
+        if (NULL != clusters[cluster_index].mu32)
+        {
+            for (j = 0; j < d; j++)
+            {
+                share[j] += observations[i].data32[j];
+            }
+            continue;
+        }
+        for (j = 0; j < d; j++)
+        {
+            share[j] += (observations[i].data[j]) / 
+                        (clusters[cluster_index].len);
+        }
+    }
+
+    return NULL;
+}
+
+static void run_workers(void * (*work)(void *), worker_t * workers, 
+                        int n_workers)
+{
+    int i = 0;
+
+#ifndef _WIN32
+    for (i = 1; i < n_workers; i++)
+    {
+        workers[i].is_threaded = (0 == pthread_create(&workers[i].thread, NULL,
+                                                      work, &workers[i]));
+        if (!workers[i].is_threaded)
+        {
+            /* Couldn't create a thread, so the work is done right here */
+            work(&workers[i]);
+        }
+    }
+    work(&workers[0]);
+    for (i = 1; i < n_workers; i++)
+    {
+        if (workers[i].is_threaded)
+        {
+            pthread_join(workers[i].thread, NULL);
+        }
+    }
+#else
+    /* No threads support - the workers run one after the other */
+    for (i = 0; i < n_workers; i++)
+    {
+        work(&workers[i]);
+    }
+#endif
+}
+
+static errors_t init_workers(worker_t ** workers, int n_workers, 
+                             obs_t * observations, cluster_t * clusters,
+                             bounds_t * bounds, int N, int K, int d, 
+                             algorithm_t algorithm, const float * mu32_t)
+{
+    int i = 0;
+
+    *workers = calloc(n_workers, sizeof(**workers));
+    if (NULL == *workers)
+    {
+        return E_NO_MEMORY;
+    }
+
+    for (i = 0; i < n_workers; i++)
+    {
+        worker_t * worker = &(*workers)[i];
+        worker->observations = observations;
+        worker->clusters = clusters;
+        worker->bounds = bounds;
+        worker->K = K;
+        worker->d = d;
+        worker->algorithm = algorithm;
+        /* Splits the observations to (almost) equal contiguous ranges */
+        worker->start = (int)((long long)N * i / n_workers);
+        worker->end = (int)((long long)N * (i + 1) / n_workers);
+        worker->lens = malloc(K * sizeof(*worker->lens));
+        worker->sums = malloc((size_t)K * d * sizeof(*worker->sums));
+        if (NULL == worker->lens || NULL == worker->sums)
+        {
+            return E_NO_MEMORY;
+        }
+        worker->mu32_t = mu32_t;
+        if (NULL != mu32_t)
+        {
+            worker->distances32 = malloc(K * sizeof(*worker->distances32));
+            if (NULL == worker->distances32)
+            {
+                return E_NO_MEMORY;
+            }
+        }
+    }
+
+    return E_SUCCESS;
+}
+
+static void free_workers(worker_t * workers, int n_workers)
+{
+    int i = 0;
+
+    if (NULL == workers)
+    {
+        return;
+    }
+    for (i = 0; i < n_workers; i++)
+    {
+        FREE_MEM(workers[i].lens);
+        FREE_MEM(workers[i].sums);
+        FREE_MEM(workers[i].distances32);
+    }
+    free(workers);
+}
+
+static errors_t kmeans_impl(obs_t * observations, cluster_t * clusters, int d, 
+                            int K, int N, int MAX_ITER, algorithm_t algorithm,
+                            int n_threads, int * iterations)
+{
+    int did_cluster_change = 1;
+    double mu_shift = 0;
+    double drift = 0;
+    int iter_count = 0;
+    int i = 0;
+    int j = 0;
+    bounds_t bounds = {0};
+    worker_t * workers = NULL;
+    float * mu32_t = NULL;
+    errors_t rc = E_UNINITIALIZED;
+
+    /* Every thread should have at least 1 observation */
+    n_threads = (n_threads > N) ? N : n_threads;
+
+    rc = init_bounds(&bounds, algorithm, N, K);
+    if (E_SUCCESS == rc && ALGORITHM_LLOYD == algorithm && 
+        NULL != clusters[0].mu32)
+    {
+        mu32_t = malloc((size_t)K * d * sizeof(*mu32_t));
+        rc = (NULL == mu32_t) ? E_NO_MEMORY : E_SUCCESS;
+    }
+    if (E_SUCCESS == rc)
+    {
+        rc = init_workers(&workers, n_threads, observations, clusters, &bounds,
+                          N, K, d, algorithm, mu32_t);
+    }
+    if (E_SUCCESS != rc)
+    {
+        free_workers(workers, n_threads);
+        free_bounds(&bounds);
+        FREE_MEM(mu32_t);
+        return rc;
+    }
+
+    while ((1 == did_cluster_change) && (iter_count < MAX_ITER))
+    {
+        /* Assigns all observations, and counts the clusters' len */
+        for (i = 0; i < n_threads; i++)
+        {
+            workers[i].is_first_iter = (0 == iter_count);
+        }
+        if (NULL != mu32_t)
+        {
+            transpose_mu32(clusters, K, d, mu32_t);
+        }
+        run_workers(assign_worker, workers, n_threads);
+        for (i = 0; i < K; i++)
+        {
+            clusters[i].len = 0;
+            for (j = 0; j < n_threads; j++)
+            {
+                clusters[i].len += workers[j].lens[i];
+            }
         }
 
         /* Recalculating each mu and checks if a change happened */
+        run_workers(sum_worker, workers, n_threads);
         did_cluster_change = 0;
         for (i = 0; i < K; i++)
         {
-            cluster_change_status = 0;
-            rc = calc_mu(&clusters[i], d, &cluster_change_status);
+            rc = calc_mu(&clusters[i], i, workers, n_threads, d, &mu_shift, 
+                         &drift);
             if (E_SUCCESS != rc)
             {
+                free_workers(workers, n_threads);
+                free_bounds(&bounds);
+                FREE_MEM(mu32_t);
                 return rc;
             }
-            else if (1 == cluster_change_status)
+            if (mu_shift > EPSILON)
             {
                 did_cluster_change = 1;
             }
+            if (ALGORITHM_LLOYD != algorithm)
+            {
+                bounds.drift[i] = drift;
+            }
+        }
+        if (ALGORITHM_LLOYD != algorithm)
+        {
+            update_bounds(&bounds, algorithm, clusters, K, d);
         }
         iter_count += 1;
     }
 
+    free_workers(workers, n_threads);
+    free_bounds(&bounds);
+    FREE_MEM(mu32_t);
+    *iterations = iter_count;
     return E_SUCCESS;
 }
 
@@ -442,6 +1812,209 @@ static errors_t convert_result_clusters(PyObject ** clusters_lst, int N,
     return E_SUCCESS;
 }
 
+static double calc_inertia(const obs_t * observations, 
+                           const cluster_t * clusters, int N, int d)
+{
+    double inertia = 0;
+    int i = 0;
+    int j = 0;
+
+    for (i = 0; i < N; i++)
+    {
+        const cluster_t * cluster = &clusters[observations[i].cluster_index];
+        if (NULL == cluster->mu32)
+        {
+            inertia += euclidean_distance(observations[i].data, cluster->mu, d);
+            continue;
+        }
+        /* In double, against the accurate mu */
+        for (j = 0; j < d; j++)
+        {
+            double diff = observations[i].data32[j] - cluster->mu[j];
+            inertia += diff * diff;
+        }
+    }
+    return inertia;
+}
+
+static void * restart_worker(void * arg)
+{
+    restart_t * restart = arg;
+    int K = restart->K;
+    int N = restart->N;
+    int d = restart->d;
+    int r = 0;
+    int i = 0;
+    obs_t * observations = NULL;
+    cluster_t * clusters = NULL;
+
+    restart->best = -1;
+    restart->rc = E_SUCCESS;
+
+    /* The restarts change the cluster of each observation, so the thread 
+     * clusters its own copy of the observations (of the pointers only) */
+    observations = malloc(N * sizeof(*observations));
+    if (NULL == observations)
+    {
+        restart->rc = E_NO_MEMORY;
+        return NULL;
+    }
+    memcpy(observations, restart->observations, N * sizeof(*observations));
+
+    for (r = restart->first; r < restart->n_init; r += restart->step)
+    {
+        int iterations = 0;
+
+        restart->rc = build_clusters(observations, 
+                                     restart->clusters_indices + (size_t)r * K,
+                                     N, K, d, restart->is_float32, &clusters);
+        if (E_SUCCESS != restart->rc)
+        {
+            break;
+        }
+        restart->rc = kmeans_impl(observations, clusters, d, K, N, 
+                                  restart->MAX_ITER, restart->algorithm, 
+                                  restart->n_threads, &iterations);
+        if (E_SUCCESS == restart->rc)
+        {
+            restart->inertias[r] = calc_inertia(observations, clusters, N, d);
+            /* The restarts run in order, so the first one wins on equality */
+            if (-1 == restart->best || 
+                restart->inertias[r] < restart->inertias[restart->best])
+            {
+                restart->best = r;
+                restart->best_iterations = iterations;
+                for (i = 0; i < N; i++)
+                {
+                    restart->best_labels[i] = observations[i].cluster_index;
+                }
+                for (i = 0; i < K; i++)
+                {
+                    memcpy(restart->best_mu + (size_t)i * d, clusters[i].mu, 
+                           d * sizeof(*restart->best_mu));
+                }
+            }
+        }
+        free_memory(NULL, NULL, clusters, NULL, K);
+        clusters = NULL;
+        if (E_SUCCESS != restart->rc)
+        {
+            break;
+        }
+    }
+
+    free(observations);
+    return NULL;
+}
+
+static errors_t run_restarts(const obs_t * observations, 
+                             const size_t * clusters_indices, int K, int N, 
+                             int d, int MAX_ITER, algorithm_t algorithm, 
+                             int is_float32, int n_init, int n_threads, int * labels, 
+                             double * centroids, double * inertias, 
+                             int * iterations)
+{
+    /* Up to n_threads restarts run at once, each with its share of threads */
+    int n_parallel = (n_threads < n_init) ? n_threads : n_init;
+    restart_t * restarts = NULL;
+    const restart_t * best = NULL;
+    errors_t rc = E_SUCCESS;
+    int i = 0;
+
+    restarts = calloc(n_parallel, sizeof(*restarts));
+    if (NULL == restarts)
+    {
+        return E_NO_MEMORY;
+    }
+    for (i = 0; i < n_parallel; i++)
+    {
+        restart_t * restart = &restarts[i];
+        restart->observations = observations;
+        restart->clusters_indices = clusters_indices;
+        restart->K = K;
+        restart->N = N;
+        restart->d = d;
+        restart->MAX_ITER = MAX_ITER;
+        restart->algorithm = algorithm;
+        restart->is_float32 = is_float32;
+        restart->n_threads = n_threads / n_parallel + 
+                             (i < n_threads % n_parallel);
+        restart->first = i;
+        restart->step = n_parallel;
+        restart->n_init = n_init;
+        restart->inertias = inertias;
+        restart->best = -1;
+        restart->rc = E_UNINITIALIZED;
+        restart->best_labels = malloc(N * sizeof(*restart->best_labels));
+        restart->best_mu = malloc((size_t)K * d * sizeof(*restart->best_mu));
+        if (NULL == restart->best_labels || NULL == restart->best_mu)
+        {
+            rc = E_NO_MEMORY;
+        }
+    }
+
+    if (E_SUCCESS == rc)
+    {
+#ifndef _WIN32
+        for (i = 1; i < n_parallel; i++)
+        {
+            restarts[i].is_threaded = (0 == pthread_create(&restarts[i].thread,
+                                                           NULL, restart_worker,
+                                                           &restarts[i]));
+            if (!restarts[i].is_threaded)
+            {
+                /* Couldn't create a thread, so the work is done right here */
+                restart_worker(&restarts[i]);
+            }
+        }
+        restart_worker(&restarts[0]);
+        for (i = 1; i < n_parallel; i++)
+        {
+            if (restarts[i].is_threaded)
+            {
+                pthread_join(restarts[i].thread, NULL);
+            }
+        }
+#else
+        /* No threads support - the restarts run one after the other */
+        for (i = 0; i < n_parallel; i++)
+        {
+            restart_worker(&restarts[i]);
+        }
+#endif
+        /* Picks the best of the threads, the first restart on equality */
+        for (i = 0; i < n_parallel; i++)
+        {
+            if (E_SUCCESS != restarts[i].rc)
+            {
+                rc = restarts[i].rc;
+                break;
+            }
+            if (NULL == best || 
+                inertias[restarts[i].best] < inertias[best->best] ||
+                (inertias[restarts[i].best] == inertias[best->best] &&
+                 restarts[i].best < best->best))
+            {
+                best = &restarts[i];
+            }
+        }
+    }
+
+    if (E_SUCCESS == rc)
+    {
+        memcpy(labels, best->best_labels, N * sizeof(*labels));
+        memcpy(centroids, best->best_mu, (size_t)K * d * sizeof(*centroids));
+        *iterations = best->best_iterations;
+    }
+    for (i = 0; i < n_parallel; i++)
+    {
+        FREE_MEM(restarts[i].best_labels);
+        FREE_MEM(restarts[i].best_mu);
+    }
+    free(restarts);
+    return rc;
+}
+
 static PyObject * error_msg(errors_t rc)
 {
     switch (rc)
@@ -475,7 +2048,7 @@ static void free_memory(obs_t * observations,
         for (i = 0; i < K; ++i)
         {
             FREE_MEM(clusters[i].mu);
-            FREE_MEM(clusters[i].obs_array);
+            FREE_MEM(clusters[i].mu32);
         }
         FREE_MEM(clusters);
     }
@@ -488,7 +2061,11 @@ static PyObject * kmeans_api(PyObject * self, PyObject * args)
     PyObject * obs_lst = NULL;
     PyObject * indices_lst = NULL;
     PyObject * clusters_lst = NULL;
+    Py_buffer obs_view = {0};
+    Py_buffer indices_view = {0};
     int K, N, d, MAX_ITER;
+    int iterations = 0;
+    int is_float32 = 0;
     double * observations_mem_region = NULL;
     obs_t * observations = NULL;
     size_t * clusters_indices = NULL;
@@ -502,33 +2079,34 @@ static PyObject * kmeans_api(PyObject * self, PyObject * args)
         rc = E_INVALID_INPUT;
         return error_msg(rc);
     }
-    if (!PyList_Check(obs_lst) || !PyList_Check(indices_lst))
+    if (!PyList_Check(obs_lst) && !PyObject_CheckBuffer(obs_lst))
+    {
+        rc = E_INVALID_INPUT;
+        return error_msg(rc);
+    }
+    if (!PyList_Check(indices_lst) && !PyObject_CheckBuffer(indices_lst))
     {
         rc = E_INVALID_INPUT;
         return error_msg(rc);
     }
 
-    /*
-     * Process Observations: python's obs_lst ---> observations_mem_region
-     * observations_mem_region - keeps observations in a contiguous memory block
-     * observations - an array of pointers; each pointer, points to the 
-     *                correspondent observation in the memory
-     */
-    rc = init_observations(obs_lst, N, d, &observations_mem_region, 
-                           &observations);
-    FAIL_IF(E_SUCCESS != rc);
-    
-    /* Process Indices: python's indices_lst ---> clusters_indices */
-    rc = init_cluster_indices(indices_lst, K, &clusters_indices);
+    /* Process Observations and Indices */
+    rc = init_inputs(obs_lst, indices_lst, K, N, d, &obs_view, &indices_view,
+                     &observations_mem_region, &observations, &is_float32,
+                     &clusters_indices);
     FAIL_IF(E_SUCCESS != rc);
 
     /* Build Clusters from given indices */
-    rc = build_clusters(observations, clusters_indices, N, K, d, &clusters);
+    rc = build_clusters(observations, clusters_indices, N, K, d, is_float32, 
+                        &clusters);
     FAIL_IF(E_SUCCESS != rc);
 
     /* Runs K-Means Implementation, it will mutate 'clusters' array 
      * (breaks program if it raised an error */
-    rc = kmeans_impl(observations, clusters, d, K, N, MAX_ITER);
+    Py_BEGIN_ALLOW_THREADS
+    rc = kmeans_impl(observations, clusters, d, K, N, MAX_ITER, 
+                     ALGORITHM_LLOYD, 1, &iterations);
+    Py_END_ALLOW_THREADS
     FAIL_IF(E_SUCCESS != rc);
 
     /* pack clusters_lst to python-list */
@@ -536,21 +2114,131 @@ static PyObject * kmeans_api(PyObject * self, PyObject * args)
     FAIL_IF(E_SUCCESS != rc);
 
     /* Free all memory */
-    free_memory(observations, observations_mem_region, clusters, 
-                clusters_indices, K);
+    FREE_ALL_MEM();
     return clusters_lst;
 }
 
+static PyObject * kmeans_fit_api(PyObject * self, PyObject * args, 
+                                 PyObject * kwargs)
+{
+    static char * kwlist[] = {"observations", "centroids_indices", "K", "N", 
+                              "d", "MAX_ITER", "labels", "centroids", 
+                              "algorithm", "n_threads", "n_init", "inertias",
+                              NULL};
+    const char * algorithm_name = "lloyd";
+    algorithm_t algorithm = ALGORITHM_LLOYD;
+    int n_threads = 1;
+    int n_init = 1;
+    PyObject * obs_obj = NULL;
+    PyObject * indices_obj = NULL;
+    PyObject * labels_obj = NULL;
+    PyObject * centroids_obj = NULL;
+    PyObject * inertias_obj = Py_None;
+    Py_buffer obs_view = {0};
+    Py_buffer indices_view = {0};
+    Py_buffer labels_view = {0};
+    Py_buffer centroids_view = {0};
+    Py_buffer inertias_view = {0};
+    int K, N, d, MAX_ITER;
+    int iterations = 0;
+    int is_float32 = 0;
+    double * inertias = NULL;
+    double * observations_mem_region = NULL;
+    obs_t * observations = NULL;
+    size_t * clusters_indices = NULL;
+    cluster_t * clusters = NULL;
+    errors_t rc = E_UNINITIALIZED;
+
+    /* Processing Arguments */
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOiiiiOO|$siiO", kwlist,
+                                     &obs_obj, &indices_obj, &K, &N, &d, 
+                                     &MAX_ITER, &labels_obj, &centroids_obj,
+                                     &algorithm_name, &n_threads, &n_init,
+                                     &inertias_obj))
+    {
+        rc = E_INVALID_INPUT;
+        return error_msg(rc);
+    }
+    if (n_threads < 1 || n_init < 1)
+    {
+        rc = E_INVALID_INPUT;
+        return error_msg(rc);
+    }
+    rc = parse_algorithm(algorithm_name, &algorithm);
+    if (E_SUCCESS != rc)
+    {
+        return error_msg(rc);
+    }
+
+    /* Validate the output buffers before doing any work */
+    rc = get_output_buffer(labels_obj, &labels_view, 'i', sizeof(int), N);
+    FIT_FAIL_IF(E_SUCCESS != rc);
+    rc = get_output_buffer(centroids_obj, &centroids_view, 'd', sizeof(double),
+                           (Py_ssize_t)K * d);
+    FIT_FAIL_IF(E_SUCCESS != rc);
+    if (Py_None == inertias_obj)
+    {
+        inertias = malloc(n_init * sizeof(*inertias));
+        rc = (NULL == inertias) ? E_NO_MEMORY : E_SUCCESS;
+    }
+    else
+    {
+        rc = get_output_buffer(inertias_obj, &inertias_view, 'd', 
+                               sizeof(double), n_init);
+        inertias = inertias_view.buf;
+    }
+    FIT_FAIL_IF(E_SUCCESS != rc);
+
+    /* Process Observations (once, for all of the restarts) and Indices */
+    rc = init_inputs(obs_obj, indices_obj, K * n_init, N, d, &obs_view, 
+                     &indices_view, &observations_mem_region, &observations, 
+                     &is_float32, &clusters_indices);
+    FIT_FAIL_IF(E_SUCCESS != rc);
+
+    /* Runs the restarts of K-Means, and writes the best one into the given 
+     * labels and centroids buffers */
+    Py_BEGIN_ALLOW_THREADS
+    rc = run_restarts(observations, clusters_indices, K, N, d, MAX_ITER, 
+                      algorithm, is_float32, n_init, n_threads, labels_view.buf, 
+                      centroids_view.buf, inertias, &iterations);
+    Py_END_ALLOW_THREADS
+    FIT_FAIL_IF(E_SUCCESS != rc);
+
+    /* Free all memory */
+    PyBuffer_Release(&labels_view);
+    PyBuffer_Release(&centroids_view);
+    FIT_RELEASE_INERTIAS();
+    FREE_ALL_MEM();
+    return PyLong_FromLong(iterations);
+}
+
 /*========================= Module Configuration ============================*/
 PyDoc_STRVAR(kmeans_doc, "kmeans(observations, centroids_indices, K, N, d, MAX_ITER)\n"
                          "--\n\n"
-                         " :param observations: N-sized List with D-sized tuples (with float values)\n"
-                         " :param centroids_indices: K-sized List of indices (integer) indicates the chosen observations from the list above\n"
+                         " :param observations: N-sized List with D-sized tuples (with float values),\n"
+                         "                      or a C-contiguous float64 / float32 array of shape (N, d), read in place\n"
+                         " :param centroids_indices: K-sized List (or integer array) of indices indicates the chosen observations from the above\n"
                          " :params 3-6: K, N, d, MAX_ITER: K-Means algorithm arguments\n"
                          " :precondition: Input is valid \n"
                          " :returns: N-sized List, each element represents the cluster of its index");
+PyDoc_STRVAR(kmeans_fit_doc, "kmeans_fit(observations, centroids_indices, K, N, d, MAX_ITER, labels, centroids, *, algorithm='lloyd', n_threads=1, n_init=1, inertias=None)\n"
+                             "--\n\n"
+                             " Same as kmeans, but writes its results into the given (preallocated) buffers\n"
+                             " :params 1-6: Same as kmeans, but with n_init*K centroids_indices - the initialization of each restart\n"
+                             " :param labels: Writable N-sized int32 array, will contain the cluster of each observation\n"
+                             " :param centroids: Writable C-contiguous float64 array of shape (K, d), will contain the final centroids\n"
+                             " :param algorithm: 'lloyd', 'hamerly' or 'elkan' - the last 2 skip most of the distance calculations\n"
+                             "                   using triangle-inequality bounds, and give exactly the same results as 'lloyd'\n"
+                             " :param n_threads: Number of threads to split the observations between (the GIL is released while running)\n"
+                             " :param n_init: Number of restarts, run (in parallel) on the same parsed observations,\n"
+                             "                the one of the smallest inertia is kept\n"
+                             " :param inertias: Writable float64 array of n_init elements, will contain the inertia of each restart\n"
+                             " :precondition: Input is valid \n"
+                             " :returns: The number of iterations of the kept restart");
 static PyMethodDef capiMethods[] = {
         {"kmeans", (PyCFunction) kmeans_api, METH_VARARGS, kmeans_doc},
+        {"kmeans_fit", (PyCFunction)(void (*)(void)) kmeans_fit_api, 
+         METH_VARARGS | METH_KEYWORDS, kmeans_fit_doc},
         {NULL, NULL, 0, NULL}
 };
 
@@ -3,47 +3,277 @@
 K-MEANS-PP Algorithm Implementation and a wrapper for Kmeans CAPI extension.
 """
 
+import os
+from math import log
 import numpy as np
 import mykmeanssp as km
+import metrics
 
 # Seed to be used casting indices in kmeans-init, a module constant
 KMEANS_INIT_RANDOM_SEED = 0
+# The supported initialization methods of kmeans_fit
+INIT_METHODS = ("k-means++", "greedy-k-means++", "k-means||")
 
 
-def k_means_pp(k, obs_arr):
+def _squared_distances(obs_arr, sq_norms, index, out):
+    """
+    Calculates the squared distances of all observations from a single one,
+    using ||x - c||^2 = ||x||^2 - 2x.c + ||c||^2 (a single matrix-vector product,
+    with no (N,d) temporaries).
+    :param obs_arr: Observations array
+    :param sq_norms: The squared norm of each observation
+    :param index: The index of the observation to calculate the distances from
+    :param out: N-sized array, will contain the squared distances
+    :return: out
+    """
+    np.dot(obs_arr, obs_arr[index], out=out)
+    out *= -2
+    out += sq_norms
+    out += sq_norms[index]
+    # rounding errors might make the distances of close points negative
+    np.maximum(out, 0, out=out)
+    out[index] = 0
+    return out
+
+
+def default_rng():
+    """
+    :return: a new random generator, seeded with KMEANS_INIT_RANDOM_SEED.
+             It produces the same stream the module used to get by seeding
+             numpy's global random state, without touching that global state.
+    """
+    return np.random.RandomState(KMEANS_INIT_RANDOM_SEED)
+
+
+def _sample(rng, cumulative, size):
+    """
+    Samples indices with probabilities proportional to the increments of a
+    cumulative sum (the same as rng.choice(N, size, p=increments / total)).
+    :param rng: The random generator
+    :param cumulative: N-sized cumulative sum of the (non-negative) weights
+    :param size: Number of indices to sample
+    :return: size-sized array of the sampled indices
+    """
+    samples = rng.random(size) * cumulative[-1]
+    return np.minimum(cumulative.searchsorted(samples, side='right'),
+                      len(cumulative) - 1)
+
+
+def k_means_pp(k, obs_arr, n_local_trials=1, rng=None, weights=None):
     """
     The initialization part of the KMeans++ algorithm.
     :param k: Number of clusters
     :param obs_arr: Observations array
+    :param n_local_trials: Number of candidates sampled on each step. When
+                           bigger than 1, this is the 'greedy k-means++' - the
+                           candidate that reduces the total squared distance
+                           the most is chosen (2 + log(k) is a common choice).
+    :param rng: The random generator (np.random.Generator, or RandomState) to
+                sample with. None means `default_rng()`.
+    :param weights: optional - the weight of each observation, as if it
+                    appeared this many times
     :return: The indices of the observations to initialize the KMeans clusters
     with.
     """
-    np.random.seed(KMEANS_INIT_RANDOM_SEED)
+    if rng is None:
+        rng = default_rng()
 
+    if obs_arr.dtype != np.float64:
+        obs_arr = obs_arr.astype(np.float64)
     N = len(obs_arr)
     initial_indices = np.empty(k, dtype=int)
+    sq_norms = np.einsum('ij,ij->i', obs_arr, obs_arr)
+    cumulative = np.empty(N)
 
-    chosen_index = np.random.choice(N)
+    if weights is None:
+        chosen_index = rng.choice(N)
+    else:
+        chosen_index = _sample(rng, np.cumsum(weights, out=cumulative), 1)[0]
     initial_indices[0] = chosen_index
-    minimal_distances = np.linalg.norm(obs_arr - obs_arr[chosen_index], axis=1) ** 2
-    probs = np.empty_like(minimal_distances)
+    minimal_distances = _squared_distances(obs_arr, sq_norms, chosen_index,
+                                           np.empty(N))
+    if n_local_trials > 1:
+        candidates_distances = np.empty((n_local_trials, N))
+    else:
+        new_distances = np.empty(N)
     for i in range(1, k):
-        # Calculate probabilities
-        np.divide(minimal_distances, minimal_distances.sum(), out=probs)
-        chosen_index = np.random.choice(N, p=probs)
+        # Samples with probabilities proportional to the minimal distances
+        # (the same as rng.choice(N, p=minimal_distances / sum))
+        if weights is None:
+            np.cumsum(minimal_distances, out=cumulative)
+        else:
+            np.cumsum(minimal_distances * weights, out=cumulative)
+        candidates = _sample(rng, cumulative, n_local_trials)
+        if n_local_trials > 1:
+            # Scores all of the candidates with a single matrix product
+            np.dot(obs_arr[candidates], obs_arr.T, out=candidates_distances)
+            candidates_distances *= -2
+            candidates_distances += sq_norms
+            candidates_distances += sq_norms[candidates, None]
+            np.maximum(candidates_distances, 0, out=candidates_distances)
+            np.minimum(candidates_distances, minimal_distances,
+                       out=candidates_distances)
+            if weights is None:
+                potentials = candidates_distances.sum(axis=1)
+            else:
+                potentials = candidates_distances @ weights
+            best = np.argmin(potentials)
+            chosen_index = candidates[best]
+            minimal_distances[:] = candidates_distances[best]
+            minimal_distances[chosen_index] = 0
+        else:
+            chosen_index = candidates[0]
+            # Calculate new minimal distances by calculating the distance from
+            # the newly chosen centroid, and getting the minimum from the
+            # previous distances and this calculated distance
+            _squared_distances(obs_arr, sq_norms, chosen_index, new_distances)
+            np.minimum(minimal_distances, new_distances, out=minimal_distances)
         initial_indices[i] = chosen_index
-        # Calculate new minimal distances by calculating the distance from the
-        # newly chosen centroid, and getting the minimum from the previous
-        # distances and this calculated distance
-        new_distances = np.linalg.norm(obs_arr - obs_arr[chosen_index], axis=1) ** 2
-        np.minimum(minimal_distances, new_distances, out=minimal_distances)
-
-    # Resetting numpy's random seed
-    np.random.seed(None)
+
     return initial_indices
 
 
-def kmeans(points, K, N, d, MAX_ITER):
+def _update_min_distances(obs_arr, sq_norms, new_indices, offset,
+                          minimal_distances, closest, executor, chunk_size):
+    """
+    Updates (in-place) the minimal squared distance of each observation from a
+    growing set of centers, given the newly added centers. The observations are
+    processed in chunks, in parallel when given an executor.
+    :param obs_arr: Observations array
+    :param sq_norms: The squared norm of each observation
+    :param new_indices: The indices of the newly added centers
+    :param offset: Number of centers in the set before adding the new ones
+    :param minimal_distances: N-sized, the minimal distances so far
+    :param closest: N-sized, the index (in the centers set) of the closest center
+    :param executor: a concurrent.futures executor, or None to run serially
+    :param chunk_size: Number of observations in each chunk
+    """
+    new_centers = obs_arr[new_indices]
+    new_sq_norms = sq_norms[new_indices]
+
+    def process(start):
+        end = min(start + chunk_size, len(obs_arr))
+        distances = obs_arr[start:end] @ new_centers.T
+        distances *= -2
+        distances += sq_norms[start:end, None]
+        distances += new_sq_norms
+        nearest = np.argmin(distances, axis=1)
+        nearest_distances = np.maximum(
+            distances[np.arange(end - start), nearest], 0)
+        improved = nearest_distances < minimal_distances[start:end]
+        minimal_distances[start:end][improved] = nearest_distances[improved]
+        closest[start:end][improved] = nearest[improved] + offset
+
+    starts = range(0, len(obs_arr), chunk_size)
+    if executor is None:
+        for start in starts:
+            process(start)
+    else:
+        # each chunk writes only to its own slice, so the result is the same
+        list(executor.map(process, starts))
+
+
+def k_means_parallel(k, obs_arr, rng=None, oversampling_factor=2, n_rounds=5,
+                     n_jobs=1, chunk_size=8192):
+    """
+    The scalable KMeans++ initialization, k-means|| (Bahmani et al., 2012).
+    Instead of k sequential passes over the observations, it makes n_rounds
+    passes (O(log N) are enough in theory, ~5 in practice), each one samples
+    about oversampling_factor * k candidates at once. The candidates are then
+    weighted by the amount of observations closest to them, and reduced to k
+    centers using the weighted k-means++.
+    :param k: Number of clusters
+    :param obs_arr: Observations array
+    :param rng: The random generator (np.random.Generator, or RandomState) to
+                sample with. None means `default_rng()`.
+    :param oversampling_factor: Expected number of candidates per round, as a
+                                multiple of k
+    :param n_rounds: Number of sampling rounds (passes over the observations)
+    :param n_jobs: Number of threads to process the chunks of the observations
+    :param chunk_size: Number of observations in each chunk
+    :return: The indices of the observations to initialize the KMeans clusters
+    with.
+    """
+    if rng is None:
+        rng = default_rng()
+
+    if obs_arr.dtype != np.float64:
+        obs_arr = obs_arr.astype(np.float64)
+    N = len(obs_arr)
+    sq_norms = np.einsum('ij,ij->i', obs_arr, obs_arr)
+    minimal_distances = np.full(N, np.inf)
+    closest = np.full(N, -1, dtype=np.intp)
+    executor = None
+    if n_jobs > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ThreadPoolExecutor(n_jobs)
+
+    try:
+        candidates = [np.array([rng.choice(N)])]
+        n_candidates = 1
+        _update_min_distances(obs_arr, sq_norms, candidates[0], 0,
+                              minimal_distances, closest, executor, chunk_size)
+        for _ in range(n_rounds):
+            potential = minimal_distances.sum()
+            if potential == 0:
+                # every observation is already a candidate
+                break
+            # samples each observation independently, with probability
+            # proportional to its squared distance from the candidates
+            probs = minimal_distances * (oversampling_factor * k / potential)
+            new_indices = np.flatnonzero(rng.random(N) < probs)
+            if len(new_indices) == 0:
+                continue
+            candidates.append(new_indices)
+            _update_min_distances(obs_arr, sq_norms, new_indices, n_candidates,
+                                  minimal_distances, closest, executor,
+                                  chunk_size)
+            n_candidates += len(new_indices)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    candidates = np.concatenate(candidates)
+    if len(candidates) <= k:
+        # too few candidates - tops them up with random observations
+        others = np.setdiff1d(np.arange(N), candidates)
+        extra = rng.choice(others, min(k - len(candidates), len(others)),
+                           replace=False)
+        return np.concatenate([candidates, extra]).astype(int)[:k]
+
+    # weights each candidate by the amount of observations closest to it
+    weights = np.bincount(closest, minlength=len(candidates)).astype(float)
+    chosen = k_means_pp(k, obs_arr[candidates], rng=rng, weights=weights)
+    return candidates[chosen]
+
+
+def _as_c_points(points):
+    """
+    :param points: Observation points
+    :return: the points as a C-contiguous float32 / float64 array, that the C
+             extension can read in place (other dtypes are converted to float64).
+             float32 points are clustered in single precision - half of the
+             memory, and faster distances (the means are summed in double).
+    """
+    if points.dtype not in (np.float32, np.float64):
+        points = points.astype(np.float64)
+    return np.ascontiguousarray(points)
+
+
+def _init_indices(K, obs_arr, init, rng, n_threads):
+    """
+    :param init: The initialization method, see `kmeans_fit`
+    :return: The indices of the observations to initialize the KMeans clusters
+    with, by the given method.
+    """
+    if init == "k-means||":
+        return k_means_parallel(K, obs_arr, rng=rng, n_jobs=n_threads)
+    n_local_trials = 2 + int(log(K)) if init == "greedy-k-means++" else 1
+    return k_means_pp(K, obs_arr, n_local_trials, rng=rng)
+
+
+def kmeans(points, K, N, d, MAX_ITER, algorithm="lloyd", n_threads=1,
+           init="k-means++", rng=None, n_init=1):
     """
     Run the KMeans algorithm (wrapper for the C extension module).
     :param points: Observation points
@@ -51,10 +281,84 @@ def kmeans(points, K, N, d, MAX_ITER):
     :param N: Number of observations
     :param d: Dimensions of points
     :param MAX_ITER: Maximum iterations for the KMeans algorithm
+    :param algorithm: The assignment step's algorithm, see `kmeans_fit`
+    :param n_threads: Number of threads, see `kmeans_fit`
+    :param init: The initialization method, see `kmeans_fit`
+    :param rng: The random generator of the initialization, see `kmeans_fit`
+    :param n_init: Number of restarts, see `kmeans_fit`
     :return: The cluster of each observation, as a list.
     """
-    indices = k_means_pp(K, points)
-    c_points = points.tolist()
-    indices = indices.tolist()
-    clusters = km.kmeans(c_points, indices, K, N, d, MAX_ITER)
-    return clusters
+    labels, _ = kmeans_fit(points, K, N, d, MAX_ITER, algorithm=algorithm,
+                           n_threads=n_threads, init=init, rng=rng,
+                           n_init=n_init)
+    return labels.tolist()
+
+
+def kmeans_fit(points, K, N, d, MAX_ITER, algorithm="lloyd", n_threads=1,
+               init="k-means++", rng=None, n_init=1):
+    """
+    Run the KMeans algorithm (wrapper for the C extension module), the results
+    are written by the C extension directly into numpy arrays.
+    :param points: Observation points
+    :param K: Number of clusters
+    :param N: Number of observations
+    :param d: Dimensions of points
+    :param MAX_ITER: Maximum iterations for the KMeans algorithm
+    :param algorithm: The assignment step's algorithm -
+                      'lloyd' - compares every observation with every centroid
+                      'hamerly' / 'elkan' - skip most of these comparisons using
+                      triangle-inequality bounds ('elkan' keeps K bounds per
+                      observation, so it prunes more but takes N*K memory).
+                      All of them give exactly the same results.
+    :param n_threads: Number of threads the C extension splits the observations
+                      between (it releases the GIL while running). None means
+                      a thread per CPU. The results are deterministic for a
+                      given n_threads.
+    :param init: The initialization method - 'k-means++',
+                 'greedy-k-means++' which samples 2 + log(K) candidates on
+                 each step and keeps the best one (slower, better seeds), or
+                 'k-means||' which needs only a few passes over the points,
+                 each of them split between n_threads threads
+    :param rng: The random generator (np.random.Generator) of the
+                initialization. None means `default_rng()`, which gives the
+                same results on every run.
+    :param n_init: Number of restarts, each from its own initialization - the
+                   first one samples with rng, the others with independent
+                   generators seeded from it. The C extension runs all of them
+                   on the same parsed points (in parallel, when n_threads > 1)
+                   and keeps the one of the smallest inertia.
+    :return: labels - N-sized int32 array, the cluster of each observation
+             centroids - array of shape (K, d), the final centroid of each cluster
+    """
+    if init not in INIT_METHODS:
+        raise ValueError(f"Unknown init method {init}, expected one of "
+                         f"{INIT_METHODS}")
+    if n_init < 1:
+        raise ValueError("n_init must be positive")
+    if n_threads is None:
+        n_threads = os.cpu_count() or 1
+    if rng is None:
+        rng = default_rng()
+    # the initializations compute in float64, so the points are converted once
+    obs_arr = points if points.dtype == np.float64 else \
+        points.astype(np.float64)
+    indices = [_init_indices(K, obs_arr, init, rng, n_threads)]
+    if n_init > 1:
+        seed = np.random.SeedSequence(int.from_bytes(rng.bytes(16), "little"))
+        indices += [_init_indices(K, obs_arr, init, np.random.default_rng(s),
+                                  n_threads) for s in seed.spawn(n_init - 1)]
+    # the C extension reads the points in their own precision
+    del obs_arr
+    labels = np.empty(N, dtype=np.int32)
+    centroids = np.empty((K, d), dtype=np.float64)
+    inertias = np.empty(n_init, dtype=np.float64)
+    iterations = km.kmeans_fit(_as_c_points(points), np.concatenate(indices),
+                               K, N, d, MAX_ITER, labels, centroids,
+                               algorithm=algorithm, n_threads=n_threads,
+                               n_init=n_init, inertias=inertias)
+    metrics.count("kmeans_iterations", iterations)
+    metrics.record("kmeans_max_iter_reached", iterations >= MAX_ITER)
+    metrics.record("kmeans_inertia", float(inertias.min()))
+    if n_init > 1:
+        metrics.record("kmeans_n_init", n_init)
+    return labels, centroids
@@ -0,0 +1,529 @@
+#include <Python.h>
+#include <math.h>
+#include <float.h>
+
+/*================================ MACROS ==================================*/
+
+/* Frees a given pointer iff it's not NULL */
+#define FREE_MEM(mem) if (NULL != (mem)) { free((mem)); }
+/* Releases the buffers and fails the program if condition `cond` happens */
+#define FAIL_IF(cond) if ((cond)) { \
+        PyBuffer_Release(&matrix_view); \
+        PyBuffer_Release(&values_view); \
+        return error_msg(rc); }
+/*
+ * Maximal amount of QR sweeps, per row of the matrix (the same bound LAPACK
+ * uses). In practice, about 2 sweeps are needed for each eigenvalue.
+ */
+#define MAX_SWEEPS_PER_ROW (30)
+
+/*================================ ENUMS ===================================*/
+
+/* An enum that describes the different errors of this program */
+typedef enum errors_e
+{
+    /* Success */
+    E_SUCCESS = 0,
+    /* Failed to allocate memory */
+    E_NO_MEMORY,
+    /* Trying to parse a bad value */
+    E_BAD_VALUE,
+    /* Invalid input from the caller of this module */
+    E_INVALID_INPUT,
+    /* The QR iterations didn't converge within the sweeps bound */
+    E_NO_CONVERGENCE,
+    /* Internal value, used to represent an uninitialized result variables */
+    E_UNINITIALIZED = -1
+} errors_t;
+
+/*======================== FUNCTION DECLARATIONS ===========================*/
+
+/*
+ * Reduces a symmetric matrix to a tridiagonal one using Householder
+ * reflections: H_{n-3} * ... * H_0 * A * H_0 * ... * H_{n-3} = T.
+ * @param a: n*n row-major symmetric matrix, changed in-place. On return, row k
+ *           holds the (unit) vector of H_k in its columns k+1..n-1
+ *           (H_k = I - 2 * v * v^T), the rest of the matrix is garbage.
+ * @param n: Order of the matrix
+ * @param diag: n-sized, will contain the diagonal of T
+ * @param off: (n-1)-sized, will contain the sub-diagonal of T
+ * @param work: 2n-sized work space
+ */
+static void tridiagonalize(double * a, int n, double * diag, double * off,
+                           double * work);
+
+/*
+ * Forms Q = H_0 * ... * H_{n-3} in-place, from the vectors tridiagonalize left
+ * in the matrix, by applying the reflections backwards (so each of them only
+ * touches the trailing block it acts on).
+ * @param a: n*n row-major matrix, as returned from tridiagonalize. On return,
+ *           contains Q.
+ * @param n: Order of the matrix
+ * @param work: 2n-sized work space
+ */
+static void accumulate_reflections(double * a, int n, double * work);
+
+/*
+ * Transposes a square matrix in-place.
+ * @param a: n*n row-major matrix
+ * @param n: Order of the matrix
+ */
+static void transpose(double * a, int n);
+
+/*
+ * A single implicit QR step with Wilkinson shift on the unreduced block
+ * [lo, hi] of a symmetric tridiagonal matrix - chases the bulge down the
+ * block using Givens rotations, and applies them to the eigenvectors.
+ * @param diag: The diagonal of the tridiagonal matrix, changed in-place
+ * @param off: The sub-diagonal of the tridiagonal matrix, changed in-place
+ * @param lo: First row of the block
+ * @param hi: Last row of the block (lo < hi)
+ * @param zt: n*n row-major matrix, each row is an approximated eigenvector
+ * @param n: Order of the matrix
+ */
+static void qr_step(double * diag, double * off, int lo, int hi, double * zt,
+                    int n);
+
+/*
+ * Checks whether a sub-diagonal element is negligible, compared to its
+ * neighbours on the diagonal.
+ * @param off: The sub-diagonal element, between rows i and i+1
+ * @param diag_i, diag_i1: The diagonal elements of rows i and i+1
+ * @returns: 1 iff the element can be treated as 0.
+ */
+static int is_negligible(double off, double diag_i, double diag_i1);
+
+/*
+ * Implementation of the eigen decomposition of a symmetric matrix: reduction
+ * to a tridiagonal matrix, then implicitly shifted QR iterations on it, with
+ * deflation - each time a sub-diagonal element becomes negligible the matrix
+ * is split, and the iterations continue on the unreduced blocks only.
+ * @param a: n*n row-major symmetric matrix. On return, each column is an
+ *           eigenvector of the original matrix.
+ * @param n: Order of the matrix
+ * @param values: n-sized, will contain the eigenvalues (in the order of the
+ *                eigenvectors)
+ * @param sweeps: will contain the number of QR steps that were done
+ * @returns: E_SUCCESS on success, otherwise return the relevant error code.
+ * @note: Doesn't use the Python API, so it can run without holding the GIL.
+ */
+static errors_t eigh_impl(double * a, int n, double * values, int * sweeps);
+
+/*
+ * Gets a writable C-contiguous float64 buffer of a given size.
+ * @param obj: The Python object to get the buffer of
+ * @param view: Will contain the buffer
+ * @param n_items: The expected amount of elements in the buffer, or -1 for
+ *                 any amount
+ * @return E_SUCCESS on success, otherwise return the relevant error code. Also,
+ *  both on success and on failure, the view can be taken, so the user should
+ *  release it in the calling function.
+ */
+static errors_t get_output_buffer(PyObject * obj, Py_buffer * view,
+                                  Py_ssize_t n_items);
+
+/*
+ * Convert the error code to the relevant error message in Python.
+ * @param rc: The C error code
+ * @returns: Always NULL.
+ */
+static PyObject * error_msg(errors_t rc);
+
+/*
+ * Eigh-Tridiagonal-QR(matrix, values)
+ * gets 2 positional arguments:
+ * @param 1: matrix: writable C-contiguous float64 buffer of n*n elements, a
+ *                   symmetric matrix. Will contain the eigenvectors, as its
+ *                   columns.
+ * @param 2: values: writable n-sized float64 buffer, will contain the
+ *                   eigenvalues
+ * @precondition: input is valid
+ * @return The number of QR steps that were done. On error, return NULL
+ */
+static PyObject * eigh_tridiagonal_qr_api(PyObject * self, PyObject * args);
+
+/*=============================== FUNCTIONS ================================*/
+
+static void tridiagonalize(double * a, int n, double * diag, double * off,
+                           double * work)
+{
+    double * p = work;
+    double * w = work + n;
+    int i, j, k;
+
+    for (k = 0; k < n - 2; k++)
+    {
+        /* x - the column under the diagonal, which is also the row to the
+         * right of the diagonal (the matrix is symmetric) */
+        double * v = a + (size_t)k * n + k + 1;
+        int m = n - k - 1;
+        double norm = 0, alpha = 0, v_norm = 0, vp = 0;
+
+        diag[k] = a[(size_t)k * n + k];
+        for (i = 0; i < m; i++)
+        {
+            norm += v[i] * v[i];
+        }
+        norm = sqrt(norm);
+        if (0 == norm)
+        {
+            /* already tridiagonal in this column, H_k = I */
+            off[k] = 0;
+            continue;
+        }
+
+        /* v = x - alpha * e_1, with the sign that avoids cancellation */
+        alpha = (v[0] > 0) ? -norm : norm;
+        off[k] = alpha;
+        v[0] -= alpha;
+        for (i = 0; i < m; i++)
+        {
+            v_norm += v[i] * v[i];
+        }
+        v_norm = sqrt(v_norm);
+        for (i = 0; i < m; i++)
+        {
+            v[i] /= v_norm;
+        }
+
+        /* The trailing block B = H * B * H = B - v * w^T - w * v^T,
+         * for p = 2 * B * v and w = p - (v^T * p) * v */
+        for (i = 0; i < m; i++)
+        {
+            const double * b_row = a + (size_t)(k + 1 + i) * n + k + 1;
+            double sum = 0;
+            for (j = 0; j < m; j++)
+            {
+                sum += b_row[j] * v[j];
+            }
+            p[i] = 2 * sum;
+            vp += v[i] * p[i];
+        }
+        for (i = 0; i < m; i++)
+        {
+            w[i] = p[i] - vp * v[i];
+        }
+        for (i = 0; i < m; i++)
+        {
+            double * b_row = a + (size_t)(k + 1 + i) * n + k + 1;
+            for (j = 0; j < m; j++)
+            {
+                b_row[j] -= v[i] * w[j] + w[i] * v[j];
+            }
+        }
+    }
+
+    /* The last 2*2 block is already tridiagonal */
+    if (n >= 2)
+    {
+        diag[n - 2] = a[(size_t)(n - 2) * n + n - 2];
+        off[n - 2] = a[(size_t)(n - 1) * n + n - 2];
+    }
+    diag[n - 1] = a[(size_t)(n - 1) * n + n - 1];
+}
+
+static void accumulate_reflections(double * a, int n, double * work)
+{
+    double * v = work;
+    double * s = work + n;
+    int i, j, r;
+    int last = n - 3;
+
+    /* The rows after the last reflection are rows of the identity */
+    for (i = (last < 0 ? 0 : last + 1); i < n; i++)
+    {
+        for (j = 0; j < n; j++)
+        {
+            a[(size_t)i * n + j] = (i == j);
+        }
+    }
+
+    /* Q = H_0 * (H_1 * (... * H_{n-3})), when applying H_k the matrix is the
+     * identity outside of the trailing block [k+1:, k+1:] */
+    for (i = last; i >= 0; i--)
+    {
+        double * a_row = a + (size_t)i * n;
+        int m = n - i - 1;
+
+        for (j = 0; j < m; j++)
+        {
+            v[j] = a_row[i + 1 + j];
+            s[j] = 0;
+        }
+        /* s = v^T * M, then M = M - 2 * v * s */
+        for (r = 0; r < m; r++)
+        {
+            const double * m_row = a + (size_t)(i + 1 + r) * n + i + 1;
+            for (j = 0; j < m; j++)
+            {
+                s[j] += v[r] * m_row[j];
+            }
+        }
+        for (r = 0; r < m; r++)
+        {
+            double * m_row = a + (size_t)(i + 1 + r) * n + i + 1;
+            double factor = 2 * v[r];
+            for (j = 0; j < m; j++)
+            {
+                m_row[j] -= factor * s[j];
+            }
+        }
+
+        /* row i and column i are now the ones of the identity */
+        for (j = 0; j < n; j++)
+        {
+            a_row[j] = (i == j);
+        }
+        for (r = i + 1; r < n; r++)
+        {
+            a[(size_t)r * n + i] = 0;
+        }
+    }
+}
+
+static void transpose(double * a, int n)
+{
+    int i, j;
+
+    for (i = 0; i < n; i++)
+    {
+        for (j = i + 1; j < n; j++)
+        {
+            double temp = a[(size_t)i * n + j];
+            a[(size_t)i * n + j] = a[(size_t)j * n + i];
+            a[(size_t)j * n + i] = temp;
+        }
+    }
+}
+
+static void qr_step(double * diag, double * off, int lo, int hi, double * zt,
+                    int n)
+{
+    /* Wilkinson shift - the eigenvalue of the trailing 2*2 block that is
+     * closer to its last diagonal element */
+    double t = (diag[hi - 1] - diag[hi]) / 2;
+    double mu = diag[hi] - off[hi - 1] * off[hi - 1] /
+                           (t + copysign(hypot(t, off[hi - 1]), t));
+    double x = diag[lo] - mu;
+    double z = off[lo];
+    int k, j;
+
+    for (k = lo; k < hi; k++)
+    {
+        /* Givens rotation G = [c s; -s c] that zeros z in G * [x; z] */
+        double r = hypot(x, z);
+        double c = 1, s = 0;
+        double d_k = diag[k], d_k1 = diag[k + 1], e_k = off[k];
+        double * z_k = zt + (size_t)k * n;
+        double * z_k1 = z_k + n;
+
+        if (0 != r)
+        {
+            c = x / r;
+            s = z / r;
+        }
+        if (k > lo)
+        {
+            /* the bulge is gone from row k-1 */
+            off[k - 1] = r;
+        }
+
+        /* T = G * T * G^T on rows and columns k, k+1 */
+        diag[k] = c * c * d_k + 2 * c * s * e_k + s * s * d_k1;
+        diag[k + 1] = s * s * d_k - 2 * c * s * e_k + c * c * d_k1;
+        off[k] = c * s * (d_k1 - d_k) + (c * c - s * s) * e_k;
+        if (k + 1 < hi)
+        {
+            /* the rotation creates a bulge at (k, k+2) */
+            x = off[k];
+            z = s * off[k + 1];
+            off[k + 1] *= c;
+        }
+
+        /* The eigenvectors Z = Z * G^T, i.e. rotates the rows of Z^T */
+        for (j = 0; j < n; j++)
+        {
+            double temp = z_k[j];
+            z_k[j] = c * temp + s * z_k1[j];
+            z_k1[j] = c * z_k1[j] - s * temp;
+        }
+    }
+}
+
+static int is_negligible(double off, double diag_i, double diag_i1)
+{
+    off = fabs(off);
+    return (off <= DBL_EPSILON * (fabs(diag_i) + fabs(diag_i1))) ||
+           (off < DBL_MIN);
+}
+
+static errors_t eigh_impl(double * a, int n, double * values, int * sweeps)
+{
+    double * off = NULL;
+    double * work = NULL;
+    int lo = 0, hi = n - 1;
+
+    *sweeps = 0;
+    off = calloc(n, sizeof(double));
+    work = calloc(2 * (size_t)n, sizeof(double));
+    if (NULL == off || NULL == work)
+    {
+        FREE_MEM(off);
+        FREE_MEM(work);
+        return E_NO_MEMORY;
+    }
+
+    tridiagonalize(a, n, values, off, work);
+    accumulate_reflections(a, n, work);
+    /* the rotations are applied on the rows of Q^T, which are contiguous */
+    transpose(a, n);
+
+    while (hi > 0)
+    {
+        /* Deflation - the last row is split from the rest of the matrix */
+        if (is_negligible(off[hi - 1], values[hi - 1], values[hi]))
+        {
+            off[hi - 1] = 0;
+            hi--;
+            continue;
+        }
+        /* Finds the unreduced block that ends at hi */
+        lo = hi - 1;
+        while (lo > 0 && !is_negligible(off[lo - 1], values[lo - 1],
+                                        values[lo]))
+        {
+            lo--;
+        }
+        if (lo > 0)
+        {
+            off[lo - 1] = 0;
+        }
+
+        if (*sweeps >= MAX_SWEEPS_PER_ROW * n)
+        {
+            FREE_MEM(off);
+            FREE_MEM(work);
+            return E_NO_CONVERGENCE;
+        }
+        qr_step(values, off, lo, hi, a, n);
+        (*sweeps)++;
+    }
+
+    /* back to the eigenvectors as columns */
+    transpose(a, n);
+    FREE_MEM(off);
+    FREE_MEM(work);
+    return E_SUCCESS;
+}
+
+static errors_t get_output_buffer(PyObject * obj, Py_buffer * view,
+                                  Py_ssize_t n_items)
+{
+    if (0 != PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS |
+                                           PyBUF_FORMAT | PyBUF_WRITABLE))
+    {
+        return E_INVALID_INPUT;
+    }
+    if (sizeof(double) != view->itemsize || NULL == view->format ||
+        ('d' != view->format[0] &&
+         !(('@' == view->format[0] || '=' == view->format[0]) &&
+           'd' == view->format[1])))
+    {
+        return E_BAD_VALUE;
+    }
+    if (n_items >= 0 && n_items * (Py_ssize_t)sizeof(double) != view->len)
+    {
+        return E_INVALID_INPUT;
+    }
+
+    return E_SUCCESS;
+}
+
+static PyObject * error_msg(errors_t rc)
+{
+    switch (rc)
+    {
+    case E_NO_MEMORY:
+        return PyErr_Format(PyExc_MemoryError, "Memory allocation error");
+        break;
+    case E_BAD_VALUE:
+        return PyErr_Format(PyExc_ValueError, "Couldn't parse given value");
+        break;
+    case E_INVALID_INPUT:
+        return PyErr_Format(PyExc_ValueError, "Invalid input from the user");
+        break;
+    case E_NO_CONVERGENCE:
+        return PyErr_Format(PyExc_ArithmeticError,
+                            "QR iterations didn't converge");
+        break;
+    default:
+        return PyErr_Format(PyExc_Exception, "Unknown error");
+    }
+}
+
+static PyObject * eigh_tridiagonal_qr_api(PyObject * self, PyObject * args)
+{
+    PyObject * matrix_obj = NULL;
+    PyObject * values_obj = NULL;
+    Py_buffer matrix_view = {0};
+    Py_buffer values_view = {0};
+    int n = 0;
+    int sweeps = 0;
+    errors_t rc = E_UNINITIALIZED;
+
+    /* Processing Arguments */
+    if (!PyArg_ParseTuple(args, "OO; Expected args are: matrix, values",
+                          &matrix_obj, &values_obj))
+    {
+        rc = E_INVALID_INPUT;
+        return error_msg(rc);
+    }
+
+    /* The order of the matrix is the size of the values buffer */
+    rc = get_output_buffer(values_obj, &values_view, -1);
+    FAIL_IF(E_SUCCESS != rc);
+    n = (int)(values_view.len / sizeof(double));
+    rc = (n > 0) ? E_SUCCESS : E_INVALID_INPUT;
+    FAIL_IF(E_SUCCESS != rc);
+    rc = get_output_buffer(matrix_obj, &matrix_view, (Py_ssize_t)n * n);
+    FAIL_IF(E_SUCCESS != rc);
+
+    Py_BEGIN_ALLOW_THREADS
+    rc = eigh_impl(matrix_view.buf, n, values_view.buf, &sweeps);
+    Py_END_ALLOW_THREADS
+    FAIL_IF(E_SUCCESS != rc);
+
+    PyBuffer_Release(&matrix_view);
+    PyBuffer_Release(&values_view);
+    return PyLong_FromLong(sweeps);
+}
+
+/*========================= Module Configuration ============================*/
+PyDoc_STRVAR(eigh_tridiagonal_qr_doc, "eigh_tridiagonal_qr(matrix, values)\n"
+                                      "--\n\n"
+                                      " Eigen decomposition of a symmetric matrix - Householder reduction to a tridiagonal matrix,\n"
+                                      " then implicitly shifted (Wilkinson) QR iterations with deflation\n"
+                                      " :param matrix: Writable C-contiguous float64 array of shape (n, n), a symmetric matrix.\n"
+                                      "                Will contain the eigenvectors, as its columns\n"
+                                      " :param values: Writable n-sized float64 array, will contain the eigenvalues\n"
+                                      " :precondition: Input is valid \n"
+                                      " :returns: The number of QR steps that were done");
+static PyMethodDef capiMethods[] = {
+        {"eigh_tridiagonal_qr", (PyCFunction) eigh_tridiagonal_qr_api,
+         METH_VARARGS, eigh_tridiagonal_qr_doc},
+        {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef moduledef = {
+        PyModuleDef_HEAD_INIT,
+        "mylinalgsp",
+        NULL,
+        -1,
+        capiMethods
+};
+
+PyMODINIT_FUNC
+PyInit_mylinalgsp(void)
+{
+    return PyModule_Create(&moduledef);
+}
@@ -2,9 +2,98 @@
 ----- Linear Algebra Module -----
 Contains implementation to all algorithms related with Linear Alg.
 """
+from dataclasses import dataclass
 import numpy as np
 from math import ceil
 from config import EPSILON
+import mylinalgsp
+import metrics
+
+# Amount of eigenpairs smallest_eigenpairs starts from, when k isn't forced
+PARTIAL_EIGEN_INITIAL_M = 8
+# smallest_eigenpairs uses the full decomposition instead, once the block of
+# vectors it iterates on is bigger than this fraction of the matrix's order
+PARTIAL_EIGEN_MAX_FRACTION = 0.2
+# LOBPCG stops once the residual norm of every wanted eigenpair is below this
+LOBPCG_TOL = 1e-8
+LOBPCG_MAX_ITER = 1000
+
+
+@dataclass
+class CSRMatrix:
+    """
+    A sparse matrix, in the Compressed Sparse Row format: the non-zero values
+    of row i are data[indptr[i]:indptr[i + 1]], and their columns are
+    indices[indptr[i]:indptr[i + 1]] (sorted).
+    Supports just what the spectral clustering needs - products with blocks of
+    vectors (`a @ block`), scaling, and the diagonal.
+    """
+    data: np.ndarray
+    indices: np.ndarray
+    indptr: np.ndarray
+    shape: tuple
+
+    @classmethod
+    def from_coo(cls, rows, cols, values, shape):
+        """
+        :param rows, cols, values: the non-zero values, and their coordinates
+                                   (each coordinate may appear only once)
+        :param shape: shape of the matrix
+        :return: the CSRMatrix with these values
+        """
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+        return cls(np.asarray(values, dtype=np.float64)[order],
+                   np.asarray(cols, dtype=np.int64)[order], indptr, shape)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    def row_indices(self):
+        """
+        :return: nnz-sized array, the row of each of the non-zero values
+        """
+        return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+    def __matmul__(self, other):
+        """
+        :param other: array of shape (shape[1],) or (shape[1],b)
+        :return: the product of the matrix with other, a dense array
+        """
+        rows = self.row_indices()
+        if other.ndim == 1:
+            return np.bincount(rows, weights=self.data * other[self.indices],
+                               minlength=self.shape[0])
+        result = np.empty((self.shape[0], other.shape[1]))
+        # a column at a time, so the temporaries are only nnz-sized
+        for j in range(other.shape[1]):
+            result[:, j] = np.bincount(
+                rows, weights=self.data * other[self.indices, j],
+                minlength=self.shape[0])
+        return result
+
+    def scale(self, left, right):
+        """
+        :param left: shape[0]-sized array
+        :param right: shape[1]-sized array
+        :return: diag(left) * self * diag(right), as a new CSRMatrix
+        """
+        data = self.data * left[self.row_indices()] * right[self.indices]
+        return CSRMatrix(data, self.indices, self.indptr, self.shape)
+
+    def diagonal(self):
+        diagonal = np.zeros(min(self.shape))
+        rows = self.row_indices()
+        on_diagonal = rows == self.indices
+        diagonal[rows[on_diagonal]] = self.data[on_diagonal]
+        return diagonal
+
+    def toarray(self):
+        dense = np.zeros(self.shape)
+        dense[self.row_indices(), self.indices] = self.data
+        return dense
 
 
 def gram_schmidt(mat_a):
@@ -57,17 +146,208 @@ def qr_iteration(a):
         np.subtract(np.abs(q_), np.abs(temp_q), out=delta_matrix)
         if np.all(np.abs(delta_matrix, out=delta_matrix) <= EPSILON):
             # reached convergence
+            metrics.record("qr_iterations", i + 1)
+            metrics.record("qr_converged", True)
             return a_, q_
         q_, temp_q = temp_q, q_
 
     # reached iterations bound (n)
+    metrics.record("qr_iterations", n)
+    metrics.record("qr_converged", False)
     return a_, q_
 
 
+def tridiagonal_qr(a):
+    """
+    Finds the EigenValues and EigenVectors of a symmetric matrix, using the
+    'mylinalgsp' CAPI extension: a is reduced to a tridiagonal matrix with
+    Householder reflections, then implicitly shifted (Wilkinson) QR iterations
+    run on it with deflation. Takes O(n^3), instead of the O(n^4) of
+    qr_iteration, and converges to the machine's precision.
+    :param a: symmetric 2-D ndarray, with shape (n,n)
+    :precondition: input is valid
+    :return: a_ - diagonal matrix with a's eigenvalues
+             q_ - orthogonal matrix, each column is an eigenvector of a
+    """
+    # the extension works in-place, and overwrites the copy with the vectors
+    q_ = np.array(a, dtype=np.float64, order='C')
+    eigen_values = np.empty(q_.shape[0])
+    mylinalgsp.eigh_tridiagonal_qr(q_, eigen_values)
+    return np.diag(eigen_values), q_
+
+
+def _orthonormalize(s, drop_tol=1e-10):
+    """
+    Orthonormalizes the columns of s (SVQB) - by the eigen decomposition of
+    their (scaled) gram matrix, dropping the directions that are (almost)
+    linearly dependent on the others.
+    :param s: array of shape (n,b)
+    :param drop_tol: directions whose relative eigenvalue in the gram matrix is
+                     below it are dropped
+    :return: array of shape (n,b') for b' <= b, with orthonormal columns that
+             span (almost) the same space as s's columns
+    """
+    norms = np.linalg.norm(s, axis=0)
+    s = s[:, norms > 0] / norms[norms > 0]
+    if s.shape[1] == 0:
+        return s
+    gram_values, gram_vectors = tridiagonal_qr(s.T @ s)
+    gram_values = np.diagonal(gram_values)
+    keep = gram_values > drop_tol * gram_values.max()
+    return s @ (gram_vectors[:, keep] / np.sqrt(gram_values[keep]))
+
+
+def _rayleigh_ritz(s, as_):
+    """
+    :param s: array of shape (n,b), with orthonormal columns
+    :param as_: the operator applied to s, A @ s
+    :return: the eigenvalues (sorted ascending) and the eigenvectors of the
+             projection of A on s's columns, s^T A s
+    """
+    projection = s.T @ as_
+    # symmetrizes away the rounding errors
+    projection += projection.T
+    projection /= 2
+    values, vectors = tridiagonal_qr(projection)
+    values = np.diagonal(values)
+    order = np.argsort(values)
+    return values[order], vectors[:, order]
+
+
+def lobpcg(a, x, n_wanted=None, tol=LOBPCG_TOL, max_iter=LOBPCG_MAX_ITER):
+    """
+    LOBPCG (Knyazev, 2001) - finds the smallest eigenpairs of a symmetric
+    matrix iteratively, using only products of the matrix with blocks of
+    vectors. Each iteration searches for the eigenvectors in the space of the
+    current approximation X, its residual R = AX - X*values, and the previous
+    search direction P, using the Rayleigh-Ritz method.
+    :param a: symmetric (n,n) matrix, anything that supports `a @ block`
+    :param x: array of shape (n,b), the initial guess of the eigenvectors
+    :param n_wanted: amount of the smallest eigenpairs that have to converge,
+                     the rest of the block just accelerates the convergence.
+                     None means all of the block.
+    :param tol: stops once the residual norm of all wanted eigenpairs is
+                below it
+    :param max_iter: maximum amount of iterations
+    :return: values - b-sized array, the approximated eigenvalues (ascending)
+             vectors - array of shape (n,b), the approximated eigenvectors
+    """
+    n_wanted = x.shape[1] if n_wanted is None else n_wanted
+    x = _orthonormalize(x)
+    values, coefficients = _rayleigh_ritz(x, a @ x)
+    x = x @ coefficients
+    ax = a @ x
+    p = ap = None
+
+    metrics.count("lobpcg_calls")
+    for i in range(max_iter):
+        r = ax - x * values
+        if np.all(np.linalg.norm(r[:, :n_wanted], axis=0) <= tol):
+            # reached convergence
+            metrics.count("lobpcg_iterations", i)
+            break
+
+        # the new directions, orthonormalized against x (twice is enough)
+        s = r if p is None else np.hstack([r, p])
+        s -= x @ (x.T @ s)
+        s -= x @ (x.T @ s)
+        s = _orthonormalize(s)
+        as_ = a @ s
+
+        basis = np.hstack([x, s])
+        values, coefficients = _rayleigh_ritz(basis, np.hstack([ax, as_]))
+        values = values[:x.shape[1]]
+        x_part = coefficients[:x.shape[1], :x.shape[1]]
+        s_part = coefficients[x.shape[1]:, :x.shape[1]]
+        p, ap = s @ s_part, as_ @ s_part
+        x, ax = x @ x_part + p, ax @ x_part + ap
+    else:
+        # reached iterations bound
+        metrics.count("lobpcg_iterations", max_iter)
+        metrics.count("lobpcg_max_iter_reached")
+
+    return values, x
+
+
+def _is_eigengap_certain(eigen_values, n, trace):
+    """
+    Checks whether the eigengap method's choice is already determined by the
+    smallest m eigenvalues. The rest of the eigenvalues sum to
+    trace - sum(eigen_values), and all of them are at least the m-th one, which
+    bounds the ceil(n/2)-th eigenvalue, and so every gap after the m-th one.
+    :param eigen_values: the smallest m eigenvalues, sorted
+    :param n: order of the matrix
+    :param trace: trace of the matrix, i.e. the sum of all of its eigenvalues
+    :return: True iff the biggest gap between the given eigenvalues is bigger
+             than any gap after them could be
+    """
+    m = len(eigen_values)
+    half = ceil(n / 2)
+    if m >= half:
+        return True
+    last = eigen_values[-1]
+    rest_sum = trace - eigen_values.sum()
+    half_bound = (rest_sum - (half - m - 1) * last) / (n - half + 1)
+    best_gap = np.max(np.diff(eigen_values), initial=0)
+    return best_gap - (half_bound - last) > EPSILON
+
+
+def smallest_eigenpairs(a, k=None, m=PARTIAL_EIGEN_INITIAL_M, rng=None,
+                        max_m=None):
+    """
+    Finds only the smallest eigenpairs that the eigengap method needs, using
+    LOBPCG. When k is forced, these are exactly the k smallest ones. Otherwise,
+    m grows (doubles) until the eigengap method's choice is certain (see
+    _is_eigengap_certain), up to the first half of the eigenvalues.
+    Falls back to tridiagonal_qr when the needed part isn't small.
+    :param a: symmetric (n,n) ndarray or CSRMatrix (anything that supports
+              `a @ block`, `a.diagonal()` and `a.toarray()`)
+    :param k: optional - the amount of eigenpairs to find
+    :param m: the amount of eigenpairs to start from, when k is None
+    :param rng: random generator of the initial vectors, None means a
+                generator seeded with 0 (so the results are reproducible)
+    :param max_m: optional - the maximum amount of eigenpairs to find when k
+                  is None, even if the eigengap method's choice isn't certain
+                  yet (by default, the first half of the eigenvalues)
+    :return: values - m-sized array, the smallest eigenvalues (ascending)
+             vectors - array of shape (n,m), the corresponding eigenvectors
+             Note: eigengap_method accepts values as is
+    """
+    n = a.shape[0]
+    half = ceil(n / 2) if max_m is None else min(max_m, ceil(n / 2))
+    m = k if k is not None else min(m, half)
+    trace = a.diagonal().sum()
+    rng = np.random.default_rng(0) if rng is None else rng
+    x = rng.standard_normal((n, 0))
+
+    while True:
+        # a few extra vectors accelerate the convergence of the m-th pair
+        block_size = min(n, m + max(2, m // 4))
+        if block_size > PARTIAL_EIGEN_MAX_FRACTION * n:
+            metrics.record("dense_fallback", True)
+            dense = a if isinstance(a, np.ndarray) else a.toarray()
+            values, vectors = tridiagonal_qr(dense)
+            values = np.diagonal(values)
+            order = np.argsort(values)[:half if k is None else k]
+            metrics.record("m", len(order))
+            return values[order], vectors[:, order]
+
+        # warm start from the vectors of the previous m
+        x = np.hstack([x, rng.standard_normal((n, block_size - x.shape[1]))])
+        values, x = lobpcg(a, x, n_wanted=m)
+        if (k is not None or m >= half or
+                _is_eigengap_certain(values[:m], n, trace)):
+            metrics.record("m", m)
+            return values[:m], x[:, :m]
+        m = min(2 * m, half)
+
+
 def eigengap_method(a_, k=None):
     """
     EigenGap Method - a heuristic for finding the amount of clusters
-    :param a_: (ndarray) matrix contains the eigenvalues on its diagonal line
+    :param a_: (ndarray) matrix contains the eigenvalues on its diagonal line,
+               or a 1-D array of eigenvalues - then all of them are considered,
+               e.g. the first half of the eigenvalues, from smallest_eigenpairs
     :param k: if k is not None - skips k-calculation and forces it to be the given k
               Note: this option effectively cancels the eigengap method.
     :return: array of the 'first' K *indices* of the appropriate eigenvectors
@@ -76,14 +356,17 @@ def eigengap_method(a_, k=None):
              Note 2: assumption is that the original order is valuable, hence
                      its indices are to be returned
     """
-    n = a_.shape[0]
-
-    eigen_values = np.diagonal(a_)
+    if a_.ndim == 1:
+        eigen_values = a_
+        considered = len(a_)
+    else:
+        eigen_values = np.diagonal(a_)
+        considered = ceil(a_.shape[0] / 2)
     # sorts eigen-values, and keeps the *indices* of the sorted array
     sorted_indices = np.argsort(eigen_values)
     if k is None:
         # calculates the abs difference array for the first half of the eigen-values
-        delta_arr = np.diff(eigen_values[sorted_indices][:ceil(n / 2)])
+        delta_arr = np.diff(eigen_values[sorted_indices][:considered])
         np.abs(delta_arr, out=delta_arr)
         # gets the first appearance of the maximum difference
         k = np.argmax(delta_arr) + 1
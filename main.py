@@ -2,37 +2,147 @@
 ----- Main Module -----
 Glues all modules together to provide the desired finished products
 """
+import contextvars
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import nullcontext
 import numpy as np
 import initialization
-from spectral_clustering import run_nsc as nsc
-from kmeans_pp import kmeans
+from spectral_clustering import run_nsc as nsc, N_LANDMARKS
+from kmeans_pp import kmeans_fit
 from output_data import print_data_txt, print_clusters_txt, \
                         visualization_pdf, calc_jaccard, print_message
-from config import MAX_ITER
+from binary_data import save_binary
+import metrics
+from config import MAX_ITER, FNAME_DATA_TXT, FNAME_DATA_BIN, \
+    FNAME_CLUSTERS_TXT, FNAME_VIS_PDF, FNAME_METRICS_JSON
 
 
-def run_clustering(params, points, centers):
+def run_clustering(params, points, centers, approx=None,
+                   n_landmarks=N_LANDMARKS, binary=False,
+                   skip_visualization=False, record_metrics=False,
+                   concurrent=False, output_dir=None):
     """
     Runs the clustering algorithms on a given data {params, points, centers}.
     Can be used as an imported module.
+    :param approx: None for the exact spectral clustering, or 'nystrom' to
+                   approximate it from n_landmarks random points (for big n),
+                   see spectral_clustering.run_nsc
+    :param n_landmarks: amount of landmark points, for approx='nystrom'
+    :param binary: True to save the data and both clusterings to `data.bin`
+                   (see binary_data), instead of the data to `data.txt`
+    :param skip_visualization: True to skip `clusters.pdf` (and the Jaccard
+                               measures it shows), e.g. for headless runs
+    :param record_metrics: True to save the wall time, peak memory and
+                           counters of each phase to `metrics.json` (see
+                           metrics.MetricsRecorder)
+    :param concurrent: True to run the spectral clustering in a background
+                       thread, while K-means (when k is given, i.e. not
+                       params.random), and the outputs that don't depend on
+                       the spectral clustering, run in the calling thread -
+                       the C extensions and numpy release the GIL. The results
+                       are the same.
+    :param output_dir: directory to save the output files to, None means the
+                       paths of config (the working directory)
     :return: saves data to `data.txt`, results to `clusters.txt`
              and visualization to `clusters.pdf`
     """
+    if not record_metrics:
+        _run_clustering(params, points, centers, approx, n_landmarks, binary,
+                        skip_visualization, concurrent, output_dir)
+        return
+    with metrics.MetricsRecorder() as recorder:
+        metrics.record("n", params.n)
+        metrics.record("d", params.dim)
+        _run_clustering(params, points, centers, approx, n_landmarks, binary,
+                        skip_visualization, concurrent, output_dir)
+    recorder.save(_output_path(FNAME_METRICS_JSON, output_dir))
+
+
+def _output_path(fname, output_dir):
+    """
+    :param fname: path of an output file in config
+    :param output_dir: directory to save the output to, or None
+    :return: the path of the output file in output_dir, or fname for None
+    """
+    if output_dir is None:
+        return fname
+    return os.path.join(output_dir, os.path.basename(fname))
+
+
+def _submit(executor, fn, *args):
+    """
+    :param executor: concurrent.futures.Executor, or None to run fn right away
+    :return: Future of fn(*args), which runs in a copy of the current context
+             (so its metrics phases are recorded)
+    """
+    if executor is not None:
+        return executor.submit(contextvars.copy_context().run, fn, *args)
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _nsc_phase(points, k, approx, n_landmarks):
+    """
+    run_nsc, as the 'nsc' phase of the metrics
+    """
+    with metrics.phase("nsc"):
+        return nsc(points, k, approx=approx, n_landmarks=n_landmarks)
+
+
+def _run_clustering(params, points, centers, approx, n_landmarks, binary,
+                    skip_visualization, concurrent, output_dir):
+    """
+    run_clustering, with its phases marked for the metrics
+    """
+    def path(fname):
+        # None leaves the output functions to their default (config) path
+        return None if output_dir is None else _output_path(fname, output_dir)
+
     points = points.astype(np.float32, copy=False)
-    # NSC:
-    spectral_clusters, spectral_k = nsc(points,
-                                        None if params.random else params.k)
-    spectral_clusters = np.array(spectral_clusters, dtype=np.float32)
-    # KMEANS:
-    kmeans_clusters = kmeans(points, spectral_k, params.n, params.dim, MAX_ITER)
-    kmeans_clusters = np.array(kmeans_clusters, dtype=np.float32)
+    k = None if params.random else params.k
+    with ThreadPoolExecutor(max_workers=1) if concurrent else nullcontext() \
+            as executor:
+        # NSC:
+        spectral = _submit(executor, _nsc_phase, points, k, approx,
+                           n_landmarks)
+        if k is None:
+            # K-means needs the k of the eigengap method
+            k = spectral.result()[1]
+        # KMEANS:
+        with metrics.phase("kmeans"):
+            kmeans_clusters, _ = kmeans_fit(points, k, params.n, params.dim,
+                                            MAX_ITER)
+        # OUTPUT (the parts that don't depend on NSC):
+        if not binary:
+            with metrics.phase("data_output"):
+                print_data_txt(points, centers, path(FNAME_DATA_TXT))
+        if not skip_visualization:
+            with metrics.phase("kmeans_jaccard"):
+                kmeans_jaccard = calc_jaccard(centers, kmeans_clusters)
+                metrics.record("kmeans_jaccard", kmeans_jaccard)
+        spectral_clusters, spectral_k = spectral.result()
+    metrics.record("k", spectral_k)
     # OUTPUT:
-    print_data_txt(points, centers)
-    print_clusters_txt(spectral_k, spectral_clusters, kmeans_clusters)
-    spectral_jaccard = calc_jaccard(centers, spectral_clusters)
-    kmeans_jaccard = calc_jaccard(centers, kmeans_clusters)
-    visualization_pdf(params.k, points, kmeans_clusters, spectral_clusters,
-                      spectral_k, spectral_jaccard, kmeans_jaccard)
+    with metrics.phase("clusters_output"):
+        if binary:
+            save_binary(_output_path(FNAME_DATA_BIN, output_dir), points,
+                        centers, spectral_clusters, kmeans_clusters)
+        print_clusters_txt(spectral_k, spectral_clusters, kmeans_clusters,
+                           path(FNAME_CLUSTERS_TXT))
+    if skip_visualization:
+        return
+    with metrics.phase("spectral_jaccard"):
+        spectral_jaccard = calc_jaccard(centers, spectral_clusters)
+        metrics.record("spectral_jaccard", spectral_jaccard)
+    with metrics.phase("visualization"):
+        visualization_pdf(params.k, points, kmeans_clusters,
+                          spectral_clusters, spectral_k, spectral_jaccard,
+                          kmeans_jaccard, fname=path(FNAME_VIS_PDF))
 
 
 def main():
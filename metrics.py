@@ -0,0 +1,185 @@
+"""
+----- Metrics Module -----
+Opt-in instrumentation of a run - the wall time, the peak memory and the
+counters of the algorithms (e.g. iterations) of each phase.
+The modules mark their phases with `phase(name)` and their counters with
+`count` / `record`, which do nothing unless a MetricsRecorder is active (in the
+current context):
+    with MetricsRecorder() as recorder:
+        run_nsc(points)
+    recorder.save("metrics.json")
+"""
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+_RECORDER = ContextVar("metrics_recorder", default=None)
+# tracemalloc.reset_peak is new in Python 3.9 - on Python 3.8 the recorder
+# restarts its tracing instead, so only the outermost phases get a peak memory
+_CAN_RESET_PEAK = hasattr(tracemalloc, "reset_peak")
+
+
+def _max_rss():
+    """
+    :return: the peak resident set size of the process so far, in bytes
+             (None when unavailable)
+    """
+    if resource is None:
+        return None
+    # in kilobytes on Linux (in bytes on macOS, which isn't worth telling apart)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsRecorder:
+    """
+    Records the metrics of the phases that run within its context.
+    Phases can be nested, the name of a nested phase is prefixed by the names
+    of its enclosing phases ('nsc/eigenpairs'). The enclosing phases are
+    tracked per context, so phases can run concurrently in threads that run
+    in a copy of the context (contextvars.copy_context), but the peak memory
+    of concurrent phases is approximate (tracemalloc's peak is global).
+    """
+    def __init__(self, trace_memory=True):
+        """
+        :param trace_memory: True to record the peak memory of each phase using
+                             tracemalloc (memory allocated by Python and numpy,
+                             not by the C extensions), which slows down
+                             allocations
+        """
+        self.trace_memory = trace_memory
+        self.phases = []
+        self.counters = {}
+        self.wall_time = None
+        self._stack = ContextVar("metrics_phases", default=())
+        self._token = None
+        self._start_time = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        self._token = _RECORDER.set(self)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.wall_time = time.perf_counter() - self._start_time
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        _RECORDER.reset(self._token)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Records the wall time, the peak memory (above the memory allocated when
+        it started, see _CAN_RESET_PEAK) and the counters of the phase within
+        the context.
+        """
+        stack = self._stack.get()
+        entry = {"name": "/".join([f["entry"]["name"] for f in stack[-1:]]
+                                  + [name]),
+                 "counters": {}}
+        self.phases.append(entry)
+        frame = {"entry": entry, "start_memory": None, "peak": None}
+        if self.trace_memory and tracemalloc.is_tracing() and _CAN_RESET_PEAK:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack and stack[-1]["peak"] is not None:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["start_memory"] = frame["peak"] = current
+        elif self.trace_memory and self._started_tracing and not stack:
+            # resets the peak (the memory allocated earlier isn't traced then)
+            tracemalloc.stop()
+            tracemalloc.start()
+            frame["start_memory"] = frame["peak"] = 0
+        token = self._stack.set(stack + (frame,))
+        start_time = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["wall_time"] = time.perf_counter() - start_time
+            self._stack.reset(token)
+            if frame["start_memory"] is not None:
+                peak = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+                entry["peak_memory"] = max(0, peak - frame["start_memory"])
+                if stack and stack[-1]["peak"] is not None:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            entry["max_rss"] = _max_rss()
+
+    def _counters(self):
+        """
+        :return: the counters of the innermost active phase (or of the run)
+        """
+        stack = self._stack.get()
+        return stack[-1]["entry"]["counters"] if stack else self.counters
+
+    def count(self, name, value=1):
+        """
+        Adds value to the counter of the innermost active phase.
+        """
+        counters = self._counters()
+        counters[name] = counters.get(name, 0) + value
+
+    def record(self, name, value):
+        """
+        Sets the counter of the innermost active phase to value.
+        """
+        self._counters()[name] = value
+
+    def to_dict(self):
+        """
+        :return: the metrics, a JSON-serializable dict
+        """
+        return {"wall_time": self.wall_time,
+                "max_rss": _max_rss(),
+                "counters": self.counters,
+                "phases": self.phases}
+
+    def save(self, fname):
+        """
+        :param fname: path of the JSON file to write the metrics to
+        """
+        with open(fname, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def current_recorder():
+    """
+    :return: the active MetricsRecorder, None when there isn't any
+    """
+    return _RECORDER.get()
+
+
+def phase(name):
+    """
+    :return: context manager of a phase of the active recorder (see
+             MetricsRecorder.phase), which does nothing when there isn't any
+    """
+    recorder = _RECORDER.get()
+    return nullcontext() if recorder is None else recorder.phase(name)
+
+
+def count(name, value=1):
+    """
+    Adds value to the counter of the active recorder's phase, if any.
+    """
+    recorder = _RECORDER.get()
+    if recorder is not None:
+        recorder.count(name, value)
+
+
+def record(name, value):
+    """
+    Sets the counter of the active recorder's phase to value, if any.
+    """
+    recorder = _RECORDER.get()
+    if recorder is not None:
+        recorder.record(name, value)
@@ -0,0 +1,161 @@
+"""
+----- Mini-Batch KMeans Module -----
+Mini-Batch K-Means (Sculley, 2010) - updates the centroids from small random
+batches instead of sweeping all of the observations on every iteration, and a
+streaming variant that consumes the observations as an iterator of chunks, for
+data-sets that can't be held in memory at once.
+"""
+
+import numpy as np
+from kmeans_pp import k_means_pp, KMEANS_INIT_RANDOM_SEED
+from config import EPSILON, MAX_ITER
+
+# Default amount of observations in each mini-batch
+BATCH_SIZE = 1024
+# Default amount of observations the initial centroids are seeded from
+SEED_SAMPLE_SIZE = 10000
+
+
+def closest_centroids(points, centroids):
+    """
+    :param points: array of shape (n,d)
+    :param centroids: array of shape (K,d)
+    :return: n-sized int32 array, the index of the closest centroid to each point
+    """
+    # ||x - c||^2 = ||x||^2 - 2x.c + ||c||^2, and ||x||^2 doesn't affect the argmin
+    distances = points @ centroids.T
+    distances *= -2
+    distances += np.einsum('ij,ij->i', centroids, centroids)
+    return np.argmin(distances, axis=1).astype(np.int32)
+
+
+def minibatch_step(batch, centroids, counts):
+    """
+    Updates the centroids (in-place) from a single mini-batch.
+    Each centroid moves towards its batch's points with a learning rate of
+    1 / (amount of points it has seen so far), which makes it the running mean
+    of every point ever assigned to it.
+    :param batch: array of shape (b,d)
+    :param centroids: array of shape (K,d), updated in-place
+    :param counts: K-sized int array, amount of points each centroid has seen,
+                   updated in-place
+    :return: the maximal squared distance a centroid moved
+    """
+    k, d = centroids.shape
+    labels = closest_centroids(batch, centroids)
+    batch_counts = np.bincount(labels, minlength=k)
+    batch_sums = np.empty_like(centroids)
+    for j in range(d):
+        batch_sums[:, j] = np.bincount(labels, weights=batch[:, j], minlength=k)
+
+    counts += batch_counts
+    moved = batch_counts > 0
+    # c_new = c + (sum(x) - b*c) / v, for v the updated count of c
+    shift = batch_sums[moved] - batch_counts[moved, None] * centroids[moved]
+    shift /= counts[moved, None]
+    centroids[moved] += shift
+    return np.max(np.einsum('ij,ij->i', shift, shift), initial=0)
+
+
+def predict(points, centroids, chunk_size=BATCH_SIZE * 64):
+    """
+    :param points: array of shape (n,d), can be memory-mapped
+    :param centroids: array of shape (K,d)
+    :param chunk_size: amount of points to assign at once
+    :return: n-sized int32 array, the index of the closest centroid to each point
+    """
+    n = points.shape[0]
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        labels[start:end] = closest_centroids(
+            np.asarray(points[start:end], dtype=centroids.dtype), centroids)
+    return labels
+
+
+def minibatch_kmeans(points, K, batch_size=BATCH_SIZE, max_iter=MAX_ITER,
+                     seed_sample_size=SEED_SAMPLE_SIZE, random_state=None):
+    """
+    Mini-Batch K-Means algorithm.
+    :param points: Observation points, array of shape (N,d)
+    :param K: Number of clusters
+    :param batch_size: Amount of observations in each mini-batch
+    :param max_iter: Maximum amount of mini-batches
+    :param seed_sample_size: Amount of observations to seed the centroids from,
+                             using k-means++
+    :param random_state: seed for the seeding and the batches sampling,
+                         None means the module's KMEANS_INIT_RANDOM_SEED
+    :return: labels - N-sized int32 array, the cluster of each observation
+             centroids - array of shape (K, d), the final centroid of each cluster
+    """
+    rng = np.random.default_rng(KMEANS_INIT_RANDOM_SEED if random_state is None
+                                else random_state)
+    n = points.shape[0]
+
+    # seeds the centroids with k-means++, on a sample of the observations
+    sample = np.sort(rng.choice(n, min(n, max(seed_sample_size, K)),
+                                replace=False))
+    sample_points = np.asarray(points[sample], dtype=np.float64)
+    centroids = sample_points[k_means_pp(K, sample_points, rng=rng)]
+    counts = np.zeros(K, dtype=np.int64)
+
+    for _ in range(max_iter):
+        batch = np.sort(rng.integers(0, n, min(batch_size, n)))
+        shift = minibatch_step(np.asarray(points[batch], dtype=np.float64),
+                               centroids, counts)
+        if shift <= EPSILON:
+            # reached convergence
+            break
+
+    return predict(points, centroids), centroids
+
+
+def streaming_kmeans(chunks, K, batch_size=BATCH_SIZE,
+                     seed_sample_size=SEED_SAMPLE_SIZE):
+    """
+    Streaming Mini-Batch K-Means - a single pass over the observations, which
+    are given as an iterator of chunks (e.g. read from a file), so only
+    about seed_sample_size observations are held in memory at once.
+    The first chunks are buffered until seed_sample_size observations arrive,
+    they are used to seed the centroids with k-means++, then every chunk is
+    consumed as mini-batches.
+    :param chunks: iterable of arrays of shape (n_i,d)
+    :param K: Number of clusters
+    :param batch_size: Amount of observations in each mini-batch
+    :param seed_sample_size: Amount of observations to seed the centroids from
+    :return: centroids - array of shape (K, d), the final centroid of each cluster
+             counts - K-sized array, amount of observations of each cluster
+             Note: the labels of the observations can be computed using
+                   `predict` on each chunk
+    """
+    centroids = None
+    counts = np.zeros(K, dtype=np.int64)
+    buffered = []
+    buffered_count = 0
+
+    def consume(chunk):
+        for start in range(0, chunk.shape[0], batch_size):
+            minibatch_step(chunk[start:start + batch_size], centroids, counts)
+
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=np.float64)
+        if centroids is not None:
+            consume(chunk)
+            continue
+        buffered.append(chunk)
+        buffered_count += chunk.shape[0]
+        if buffered_count >= max(seed_sample_size, K):
+            sample = np.concatenate(buffered)
+            buffered = []
+            centroids = sample[k_means_pp(K, sample)]
+            consume(sample)
+
+    if centroids is None:
+        # the stream ended before the seeding sample was full
+        if buffered_count < K:
+            raise ValueError("The stream has less observations than K")
+        sample = np.concatenate(buffered)
+        centroids = sample[k_means_pp(K, sample)]
+        consume(sample)
+
+    return centroids, counts
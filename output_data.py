@@ -3,10 +3,24 @@
 module for post-processing and outputting the results of the run
 """
 
-import matplotlib.pyplot as plt
 import numpy as np
 import config
 
+# Integer labels are used as indices as is only if their range is at most
+# this many times their amount of distinct labels (otherwise compressed)
+LABELS_MAX_SPARSITY = 2
+# Amount of labels calc_jaccard_chunked reads at once
+JACCARD_CHUNK_SIZE = 2 ** 20
+# Amount of indices print_clusters_txt formats at once
+CLUSTERS_TXT_CHUNK_SIZE = 2 ** 16
+# Above this amount of points, the scatter layers of the visualization are
+# rasterized (instead of a vector glyph per point)
+VIS_RASTERIZE_THRESHOLD = 5000
+# Maximal amount of points drawn by the visualization, bigger data-sets are
+# drawn from a stratified sample
+VIS_MAX_POINTS = 50000
+VIS_SAMPLE_RANDOM_SEED = 0
+
 
 def print_message():
     """
@@ -18,10 +32,12 @@ def print_message():
           f"k = {config.MAX_K_3D_CAPACITY}")
 
 
-def print_data_txt(points, centers):
+def print_data_txt(points, centers, fname=None):
     """
         :param points: a numpy-array of points
         :param centers: The REAL center corresponding to each point
+        :param fname: path of the file to print to, None means 'data.txt'
+                      (config.FNAME_DATA_TXT)
         :return: prints formatted data to 'data.txt'
     """
     n, d = points.shape
@@ -31,68 +47,194 @@ def print_data_txt(points, centers):
     output_array[:, -1] = centers
     # saves the array as formatted-txt
     format_arr = ["%f"] * d + ["%d"]
-    np.savetxt(config.FNAME_DATA_TXT, output_array,
-               fmt=format_arr, delimiter=',')
+    np.savetxt(config.FNAME_DATA_TXT if fname is None else fname,
+               output_array, fmt=format_arr, delimiter=',')
 
 
-def print_clusters_txt(k, spectral_clusters, kmeans_spectral):
+def print_clusters_txt(k, spectral_clusters, kmeans_spectral, fname=None):
     """
     :param k: The k given by the user / generated randomly
     :param spectral_clusters: gets np-array, in which each index represent an obs
                             and each element is its cluster
     :param kmeans_spectral: same as above
+    :param fname: path of the file to print to, None means 'clusters.txt'
+                  (config.FNAME_CLUSTERS_TXT)
     :return: prints formatted data to 'clusters.txt'
+             (a line per cluster, with the indices of its observations, the
+             clusters are ordered by their first appearance)
+    """
+    with open(config.FNAME_CLUSTERS_TXT if fname is None else fname,
+              "w") as f:
+        f.write(f"{k}\n")
+        write_clusters(f, spectral_clusters)
+        write_clusters(f, kmeans_spectral)
+
+
+def write_clusters(f, clusters, chunk_size=CLUSTERS_TXT_CHUNK_SIZE):
+    """
+    Writes a line per cluster to f, with the indices of its observations
+    (ascending, separated by commas). The clusters are ordered by their first
+    appearance. The indices are grouped with a stable sort and written a chunk
+    at a time, so only chunk_size of them are formatted in memory at once.
+    :param f: text file object to write to
+    :param clusters: array, in which each index represent an obs and each
+                     element is its cluster
+    :param chunk_size: amount of indices to format at once
+    """
+    _, first_appearance, inverse = np.unique(clusters, return_index=True,
+                                             return_inverse=True)
+    # renames the clusters to their rank in the order of first appearance
+    rank = np.empty(len(first_appearance), dtype=np.int64)
+    rank[np.argsort(first_appearance)] = np.arange(len(first_appearance))
+    labels = rank[inverse.ravel()]
+    # the indices of each cluster are contiguous (and ascending) in the order
+    order = np.argsort(labels, kind='stable')
+    ends = np.cumsum(np.bincount(labels))
+    start = 0
+    for end in ends:
+        for chunk_start in range(start, end, chunk_size):
+            if chunk_start != start:
+                f.write(",")
+            chunk = order[chunk_start:min(chunk_start + chunk_size, end)]
+            f.write(",".join(map(str, chunk.tolist())))
+        f.write("\n")
+        start = end
+
+
+def _pairs_count(counts):
     """
+    :param counts: int64 array, amounts of points
+    :return: the total amount of pairs within each of the amounts
+    """
+    return np.sum(counts * (counts - 1) // 2)
+
+
+def _label_indices(labels):
+    """
+    :param labels: array of labels
+    :return: int64 array, the labels as indices in [0, n) - the labels as is,
+             if they are already such integers and (almost) dense, otherwise
+             the index of each label among the sorted distinct labels
+    """
+    labels = np.asarray(labels)
+    if labels.dtype.kind in "iu" and 0 <= labels.min() and \
+            labels.max() < len(labels):
+        labels = labels.astype(np.int64, copy=False)
+        # sparse ids (e.g. indices of points) would make the tables that are
+        # indexed by the labels as big as the points
+        n_distinct = np.count_nonzero(np.bincount(labels))
+        if labels.max() + 1 <= LABELS_MAX_SPARSITY * n_distinct:
+            return labels
+    return np.unique(labels, return_inverse=True)[1].astype(np.int64)
 
-    s = f"{k}\n"
-
-    def format_clusters(clusters):
-        """
-        inner helper method for formatting the clusters' string
-        finds the relevant indices for each cluster using a dictionary
-        """
-        _s = ""
-        # dict with each element representing -
-        # Key: cluster, Value: string of its indices
-        clusters_dict = {}
-        for i, cluster in enumerate(clusters):
-            if cluster not in clusters_dict:
-                clusters_dict[cluster] = f"{i},"
-            else:
-                clusters_dict[cluster] += f"{i},"
-        for line in clusters_dict.values():
-            _s += line[:-1] + "\n"
-        return _s
-
-    s += format_clusters(spectral_clusters)
-    s += format_clusters(kmeans_spectral)
-    with open(config.FNAME_CLUSTERS_TXT, "w") as f:
-        f.write(s)
+
+def _jaccard_from_contingency(table):
+    """
+    :param table: contingency table of shape (k1,k2) - table[i,j] is the amount
+                  of points labeled i by the centers and j by the clusters
+    :return: the 'Jaccard' distance (see calc_jaccard)
+    """
+    table = table.astype(np.int64, copy=False)
+    # pairs labeled the same in BOTH the centers and the clustering
+    intersect_count = _pairs_count(table)
+    # pairs labeled the same in either the centers OR the clustering
+    union_count = _pairs_count(table.sum(axis=1)) + \
+        _pairs_count(table.sum(axis=0)) - intersect_count
+    return intersect_count / union_count
 
 
 def calc_jaccard(centers, clusters):
     """
     Calculates the 'Jaccard' distance between original-centers to the
-    computed-clusters
+    computed-clusters, i.e. the amount of pairs of points labeled the same in
+    both, out of the pairs labeled the same in either of them.
+    The pairs are counted from the contingency table of the labels, in
+    O(n + k1 * k2) instead of comparing each of the n^2 pairs.
     :param centers: array of the *real* centers for each point
     :param clusters: array of the *computed* clusters for each point
     :return: the calculated 'Jaccard' distance (a float in [0,1])
     """
-    n = centers.shape[0]
-    tri0, tri1 = np.triu_indices(n, 1)
-    # for each pair of indices (i,j) s.t. i < j,
-    # marks True IFF i and j were labeled with the same cluster
-    centers_pairs = centers[tri0] == centers[tri1]
-    clusters_pairs = clusters[tri0] == clusters[tri1]
-    # counts amount of pairs labeled the same in either the centers OR the clustering
-    union_count = np.sum(centers_pairs | clusters_pairs)
-    # counts amount of pairs labeled the same in BOTH the centers and the clustering
-    intersect_count = np.sum(centers_pairs & clusters_pairs)
-    return intersect_count / union_count
+    centers = _label_indices(centers)
+    clusters = _label_indices(clusters)
+    k1, k2 = centers.max() + 1, clusters.max() + 1
+    table = np.bincount(centers * k2 + clusters, minlength=k1 * k2)
+    return _jaccard_from_contingency(table.reshape(k1, k2))
+
+
+def _chunk_label_indices(chunk, indices):
+    """
+    :param chunk: array of labels, a chunk of calc_jaccard_chunked's
+    :param indices: dict of the index of each label seen in earlier chunks
+                    (in the order of their appearance), the chunk's new labels
+                    are added to it
+    :return: int64 array of the index of each label of the chunk
+    """
+    labels, inverse = np.unique(chunk, return_inverse=True)
+    chunk_indices = [indices.setdefault(label, len(indices))
+                     for label in labels.tolist()]
+    return np.array(chunk_indices, dtype=np.int64)[inverse]
+
+
+def calc_jaccard_chunked(centers, clusters, chunk_size=JACCARD_CHUNK_SIZE):
+    """
+    Same as calc_jaccard, for labels that don't have to fit in memory - e.g.
+    memory-mapped arrays (np.load(..., mmap_mode='r')). Reads chunk_size
+    labels at a time, and accumulates their contingency table (whose size
+    depends on the amount of distinct labels, not on their values).
+    :param centers: array of the *real* centers for each point, non-negative
+                    integers
+    :param clusters: array of the *computed* clusters for each point,
+                     non-negative integers
+    :param chunk_size: amount of labels to read at once
+    :return: the calculated 'Jaccard' distance (a float in [0,1])
+    """
+    table = np.zeros((0, 0), dtype=np.int64)
+    centers_indices, clusters_indices = {}, {}
+    for start in range(0, len(centers), chunk_size):
+        chunk_centers = np.asarray(centers[start:start + chunk_size],
+                                   dtype=np.int64)
+        chunk_clusters = np.asarray(clusters[start:start + chunk_size],
+                                    dtype=np.int64)
+        if min(chunk_centers.min(), chunk_clusters.min()) < 0:
+            raise ValueError("Labels must be non-negative integers")
+        chunk_centers = _chunk_label_indices(chunk_centers, centers_indices)
+        chunk_clusters = _chunk_label_indices(chunk_clusters,
+                                              clusters_indices)
+        # grows the table to fit the labels of the chunk
+        k1, k2 = len(centers_indices), len(clusters_indices)
+        table = np.pad(table, ((0, k1 - table.shape[0]),
+                               (0, k2 - table.shape[1])))
+        table += np.bincount(chunk_centers * k2 + chunk_clusters,
+                             minlength=k1 * k2).reshape(k1, k2)
+    return _jaccard_from_contingency(table)
+
+
+def stratified_sample(labels, m, rng=None):
+    """
+    Samples about m indices, from each label proportionally to its amount of
+    points - and at least one index of each label, so small clusters are
+    still represented.
+    :param labels: n-sized array of labels
+    :param m: amount of indices to sample
+    :param rng: np.random.Generator, None means a fixed seed
+    :return: int64 array of the sampled indices, ascending
+    """
+    rng = np.random.default_rng(VIS_SAMPLE_RANDOM_SEED) if rng is None else rng
+    labels = _label_indices(labels)
+    n = len(labels)
+    counts = np.bincount(labels)
+    quotas = np.minimum(counts, np.maximum(1, counts * m // n))
+    # shuffles the indices within each label, and keeps the first of each
+    order = np.lexsort((rng.random(n), labels))
+    starts = np.cumsum(counts) - counts
+    sorted_labels = labels[order]
+    rank = np.arange(n) - starts[sorted_labels]
+    return np.sort(order[rank < quotas[sorted_labels]])
 
 
 def visualization_pdf(k, points, kmeans_clusters, spectral_clusters, spcetral_k,
-                      jaccard_spectral, jaccard_kmeans):
+                      jaccard_spectral, jaccard_kmeans,
+                      max_points=VIS_MAX_POINTS, fname=None):
     """
     :param k: The k given by the user / generated randomly
     :param points: the points generated
@@ -101,9 +243,26 @@ def visualization_pdf(k, points, kmeans_clusters, spectral_clusters, spcetral_k,
     :param spcetral_k: the k given by the user / (random case) calculated
     :param jaccard_kmeans: 'Jaccard' distance calculated relative to KMeans run
     :param jaccard_spectral: same as above, for Spectral Cl.
+    :param max_points: maximal amount of points to draw - above it, a sample
+                       stratified by both clusterings is drawn (the footer
+                       still describes all of the points)
+    :param fname: path of the file to save to, None means 'clusters.pdf'
+                  (config.FNAME_VIS_PDF)
     :return: 'prints' visualization and results summary to 'clusters.pdf'
     """
+    # imported here, as importing matplotlib takes most of the startup time
+    import matplotlib.pyplot as plt
     n, d = points.shape
+    rasterized = n > VIS_RASTERIZE_THRESHOLD
+    if n > max_points:
+        # stratified by the pairs of labels, to keep the small clusters of both
+        kmeans_labels = _label_indices(kmeans_clusters)
+        pairs = _label_indices(spectral_clusters) * (kmeans_labels.max() + 1) \
+            + kmeans_labels
+        sample = stratified_sample(pairs, max_points)
+        points = np.asarray(points[sample])
+        kmeans_clusters = np.asarray(kmeans_clusters)[sample]
+        spectral_clusters = np.asarray(spectral_clusters)[sample]
     # titles and text
     title_header = ' - Run Results - '
     title_spectral = 'Normalized Spectral Clustering'
@@ -121,18 +280,26 @@ def visualization_pdf(k, points, kmeans_clusters, spectral_clusters, spcetral_k,
     if d == 2:
         ax1 = fig.add_subplot(2, 2, 1)
         ax1.set(title=title_spectral, xlabel='X', ylabel='Y')
-        ax1.scatter(points[:, 0], points[:, 1], c=spectral_clusters)
+        ax1.scatter(points[:, 0], points[:, 1], c=spectral_clusters,
+                    rasterized=rasterized)
         ax2 = fig.add_subplot(2, 2, 2)
         ax2.set(title=title_kmeans, xlabel='X', ylabel='Y')
-        ax2.scatter(points[:, 0], points[:, 1], c=kmeans_clusters)
+        ax2.scatter(points[:, 0], points[:, 1], c=kmeans_clusters,
+                    rasterized=rasterized)
     else:  # d==3
         ax1 = fig.add_subplot(2, 2, 1, projection='3d')
         ax1.set(title=title_spectral, xlabel='X', ylabel='Y', zlabel='Z')
-        ax1.scatter(points[:, 0], points[:, 1], points[:, 2], c=spectral_clusters)
+        ax1.scatter(points[:, 0], points[:, 1], points[:, 2], c=spectral_clusters,
+                    rasterized=rasterized)
         ax2 = fig.add_subplot(2, 2, 2, projection='3d')
         ax2.set(title=title_kmeans, xlabel='X', ylabel='Y', zlabel='Z')
-        ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=kmeans_clusters)
+        ax2.scatter(points[:, 0], points[:, 1], points[:, 2], c=kmeans_clusters,
+                    rasterized=rasterized)
     # footer text
     fig.text(0.5, 0.15, text_footer, ha='center', size=17)
+    if points.shape[0] < n:
+        fig.text(0.5, 0.02, f"(showing a stratified sample of "
+                            f"{points.shape[0]} points)", ha='center', size=9)
     # figure's epilogue
-    fig.savefig(config.FNAME_VIS_PDF)
+    fig.savefig(config.FNAME_VIS_PDF if fname is None else fname)
+    plt.close(fig)
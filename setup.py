@@ -1,11 +1,16 @@
 """
 Setup for kmeans module written with CAPI
 """
+import os
 from setuptools import setup, Extension
 
+# The C extension splits its work between POSIX threads
+thread_args = [] if os.name == "nt" else ["-pthread"]
 
 setup(name="mykmeanssp",
         version="1.0",
         description="Calculate K-Means using a given initialization indices",
-        ext_modules=[Extension('mykmeanssp', sources=["kmeans.c"])])
-
+        ext_modules=[Extension('mykmeanssp', sources=["kmeans.c"],
+                               extra_compile_args=thread_args,
+                               extra_link_args=thread_args),
+                     Extension('mylinalgsp', sources=["linalg.c"])])
@@ -4,10 +4,32 @@ Implementation for the Norm. Spectral Clustering Algorithm, using 'linalg' modul
 Note: all functions assume correctness of the input; in particular an input of
       ndarray with type 'float64'
 """
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 import numpy as np
-from linalg import qr_iteration, eigengap_method
-from config import MAX_ITER
-from kmeans_pp import kmeans
+from math import ceil
+from linalg import CSRMatrix, smallest_eigenpairs, eigengap_method, \
+    tridiagonal_qr
+from config import MAX_ITER, AFFINITY_BLOCK_SIZE
+from kmeans_pp import kmeans_fit
+from eigen_cache import cache_key
+from output_data import calc_jaccard
+import metrics
+
+# The affinity graphs run_nsc supports
+AFFINITIES = ("dense", "knn", "radius")
+# The approximations run_nsc supports (None means exact)
+APPROXIMATIONS = (None, "nystrom")
+# Default amount of landmark points of the Nystrom approximation
+N_LANDMARKS = 300
+# Relative size below which eigenvalues of the landmarks' weights are dropped
+NYSTROM_RCOND = 1e-10
+# Default amount of neighbours of each point in the 'knn' affinity graph
+N_NEIGHBORS = 10
+# The eigengap method looks at most at this amount of eigenvalues, with the
+# sparse affinity graphs
+SPARSE_MAX_EIGENPAIRS = 32
 
 
 def form_weight(x):
@@ -29,11 +51,109 @@ def form_weight(x):
     return w
 
 
+def _distances(a, b, a_sq_norms, b_sq_norms, out=None):
+    """
+    :param a: array of shape (n_a,d)
+    :param b: array of shape (n_b,d)
+    :param a_sq_norms, b_sq_norms: the squared norm of each row of a, b
+    :param out: optional - a (n_a,n_b) float64 array to write the result into
+    :return: the euclidean distance between each row of a and each row of b,
+             array of shape (n_a,n_b)
+    """
+    # ||x - y||^2 = ||x||^2 - 2x.y + ||y||^2
+    distances = np.matmul(a, b.T, out=out)
+    distances *= -2
+    distances += a_sq_norms[:, None]
+    distances += b_sq_norms
+    np.maximum(distances, 0, out=distances)
+    return np.sqrt(distances, out=distances)
+
+
+def _neighbours(x, select, block_size=AFFINITY_BLOCK_SIZE):
+    """
+    Searches the neighbours of each point, a block of rows at a time, so only
+    a (block_size / n, n) block of distances is held in memory at once.
+    :param x: array of shape (n,d)
+    :param select: function of a block of distances of shape (b,n) (the
+                   distance of each point from itself is inf), returns the
+                   (rows, columns) of the chosen neighbours in the block
+    :param block_size: maximal amount of elements in each block of distances
+    :return: (i, j) - arrays of the pairs of neighbours, each pair appears
+             once with i < j
+    """
+    n = x.shape[0]
+    x = x.astype(np.float64, copy=False)
+    sq_norms = np.einsum('ij,ij->i', x, x)
+    chunk_size = max(1, block_size // n)
+    pairs_i, pairs_j = [], []
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        distances = _distances(x[start:end], x, sq_norms[start:end], sq_norms)
+        distances[np.arange(end - start), np.arange(start, end)] = np.inf
+        rows, cols = select(distances)
+        rows = rows + start
+        pairs_i.append(np.minimum(rows, cols))
+        pairs_j.append(np.maximum(rows, cols))
+    # the union of both directions of every pair
+    keys = np.unique(np.concatenate(pairs_i).astype(np.int64) * n +
+                     np.concatenate(pairs_j))
+    return keys // n, keys % n
+
+
+def _sparse_weight(x, i, j):
+    """
+    :param x: array of shape (n,d)
+    :param i, j: the pairs of neighbours, each pair once
+    :return: the symmetric connection-weight-matrix of x as a CSRMatrix, with
+             the weights of form_weight between the neighbours only
+    """
+    n = x.shape[0]
+    x = x.astype(np.float64, copy=False)
+    weights = np.exp(-0.5 * np.linalg.norm(x[i] - x[j], axis=1))
+    return CSRMatrix.from_coo(np.concatenate([i, j]), np.concatenate([j, i]),
+                              np.concatenate([weights, weights]), (n, n))
+
+
+def form_knn_weight(x, n_neighbors=N_NEIGHBORS, block_size=AFFINITY_BLOCK_SIZE):
+    """
+    :param x: an array of n vector from d-dimension; i.e. array of shape (n,d)
+    :param n_neighbors: amount of nearest neighbours of each point
+    :param block_size: see `_neighbours`
+    :return: the connection-weight-matrix of x as a (n,n) CSRMatrix - the
+             weights of form_weight, only between each point and its
+             n_neighbors nearest neighbours (and symmetric, so a point may
+             have more neighbours)
+    """
+    n_neighbors = min(n_neighbors, x.shape[0] - 1)
+
+    def select(distances):
+        nearest = np.argpartition(distances, n_neighbors - 1,
+                                  axis=1)[:, :n_neighbors]
+        return np.repeat(np.arange(len(distances)), n_neighbors), \
+            nearest.ravel()
+
+    return _sparse_weight(x, *_neighbours(x, select, block_size))
+
+
+def form_radius_weight(x, radius, block_size=AFFINITY_BLOCK_SIZE):
+    """
+    :param x: an array of n vector from d-dimension; i.e. array of shape (n,d)
+    :param radius: points are connected iff their distance is at most radius
+    :param block_size: see `_neighbours`
+    :return: the connection-weight-matrix of x as a (n,n) CSRMatrix - the
+             weights of form_weight, only between points within radius
+    """
+    return _sparse_weight(x, *_neighbours(
+        x, lambda distances: np.nonzero(distances <= radius), block_size))
+
+
 def form_laplacian(w):
     """
-    :param w: Positive weight-matrix of shape (n,n)
-    :return: the laplacian based on the weight-matrix
+    :param w: Positive weight-matrix of shape (n,n), an ndarray or CSRMatrix
+    :return: the laplacian based on the weight-matrix (of the same type)
     """
+    if isinstance(w, CSRMatrix):
+        return _form_sparse_laplacian(w)
 
     # form D^-0.5 as a row vector:
     d_diagonal = 1 / np.sqrt(np.sum(w, axis=0), dtype=float)
@@ -44,17 +164,84 @@ def form_laplacian(w):
     return l
 
 
-def form_u(l, k=None):
+def form_dense_laplacian(x, block_size=AFFINITY_BLOCK_SIZE):
     """
-    :param l: l_norm matrix, i.e. laplacian
+    Forms the laplacian of the (dense) connection-weight-matrix of x, the same
+    as form_laplacian(form_weight(x)), in a single (n,n) float64 buffer and
+    without any other temporary of that size.
+    The weights are computed a tile of rows at a time, in-place in the buffer,
+    and each tile's degrees are summed while it's still in the cache. Then the
+    buffer is scaled to - D * W * D + I in-place, again a tile at a time.
+    :param x: an array of n vector from d-dimension; i.e. array of shape (n,d)
+    :param block_size: maximal amount of elements in each tile
+    :return: the laplacian, array of shape (n,n)
+    """
+    n = x.shape[0]
+    # centering doesn't change the distances, and reduces the cancellation
+    x = x.astype(np.float64)
+    x -= x.mean(axis=0)
+    sq_norms = np.einsum('ij,ij->i', x, x)
+    l = np.empty((n, n))
+    degrees = np.empty(n)
+    tiles = [(start, min(start + max(1, block_size // n), n))
+             for start in range(0, n, max(1, block_size // n))]
+
+    for start, end in tiles:
+        tile = _distances(x[start:end], x, sq_norms[start:end], sq_norms,
+                          out=l[start:end])
+        # applies the desired weight function on the norms
+        tile *= -0.5
+        np.exp(tile, out=tile)
+        tile[np.arange(end - start), np.arange(start, end)] = 0
+        np.sum(tile, axis=1, out=degrees[start:end])
+
+    # form D^-0.5 as a row vector:
+    d_diagonal = 1 / np.sqrt(degrees)
+    for start, end in tiles:
+        tile = l[start:end]
+        # calculate (- D * W * D), considering D is diagonal matrix, adds I
+        tile *= d_diagonal
+        tile *= -d_diagonal[start:end, None]
+        tile[np.arange(end - start), np.arange(start, end)] = 1
+    return l
+
+
+def _form_sparse_laplacian(w):
+    """
+    :param w: Positive weight-matrix, CSRMatrix of shape (n,n) with an empty
+              diagonal
+    :return: the laplacian based on the weight-matrix, as a CSRMatrix
+    """
+    n = w.shape[0]
+    degrees = w @ np.ones(n)
+    if np.any(degrees == 0):
+        raise ValueError("Some points have no neighbours in the affinity "
+                         "graph (is the radius too small?)")
+    d_diagonal = 1 / np.sqrt(degrees)
+    # - D * W * D, considering D is diagonal matrix, plus I
+    l = w.scale(-d_diagonal, d_diagonal)
+    return CSRMatrix.from_coo(np.concatenate([l.row_indices(), np.arange(n)]),
+                              np.concatenate([l.indices, np.arange(n)]),
+                              np.concatenate([l.data, np.ones(n)]), (n, n))
+
+
+def form_u(l, k=None, max_m=None):
+    """
+    :param l: l_norm matrix, i.e. laplacian (ndarray or CSRMatrix)
     :param k: optional - choose k in advance and force it
+    :param max_m: optional - the maximum amount of eigenvalues the eigengap
+                  method looks at
     :return: forms U, the matrix contains the first K eigenvectors which
              determined by EigenGap
             (U is of shape (n,k), each column is a chosen eigen-vector)
+    Note: only the smallest eigenpairs EigenGap needs are calculated
     """
 
-    e_values, e_vectors = qr_iteration(l)
-    k_indices = eigengap_method(e_values, k)
+    with metrics.phase("eigenpairs"):
+        e_values, e_vectors = smallest_eigenpairs(l, k, max_m=max_m)
+    with metrics.phase("eigengap"):
+        k_indices = eigengap_method(e_values, k)
+        metrics.record("k", len(k_indices))
     u = e_vectors[:, k_indices]
     return u
 
@@ -68,24 +255,288 @@ def form_t(u):
     return t
 
 
-def run_nsc(points, k=None):
+def _sqrt_pinv(a, rcond=NYSTROM_RCOND, inverse=True):
+    """
+    :param a: symmetric positive semi-definite matrix
+    :param rcond: eigenvalues below rcond * (the largest one) are dropped
+    :param inverse: True for a^-0.5, False for a^-1
+    :return: the (pseudo) a^-0.5 or a^-1, using the eigen decomposition of a
+    """
+    values, vectors = tridiagonal_qr(a)
+    values = np.diagonal(values)
+    keep = values > rcond * values.max()
+    vectors = vectors[:, keep]
+    scale = values[keep] ** (-0.5 if inverse else -1)
+    return (vectors * scale) @ vectors.T
+
+
+def nystrom_eigenpairs(x, n_landmarks=N_LANDMARKS, rng=None,
+                       block_size=AFFINITY_BLOCK_SIZE):
+    """
+    Approximates the smallest eigenpairs of the laplacian of x, using the
+    Nystrom extension (Fowlkes et al., 2004): only the weights between every
+    point and m random landmark points are computed, C of shape (n,m), and
+    the weights are approximated by C * A^-1 * C^T, for A the (m,m) weights
+    between the landmarks. Takes O(n*m*(d + m)) time and O(n*m) memory.
+    Note: the approximation uses the weights with w_ii = 1 (positive
+          definite), the degrees are then corrected to exclude them, and the
+          eigenvalues are shifted down by about 1 / (the degrees).
+    :param x: an array of n vector from d-dimension; i.e. array of shape (n,d)
+    :param n_landmarks: m, the amount of landmark points
+    :param rng: random generator of the landmarks, None means a generator
+                seeded with 0 (so the results are reproducible)
+    :param block_size: maximal amount of elements in each block of weights
+    :return: values - the approximated smallest eigenvalues (ascending), of
+                      the first half of them (and at most m)
+             vectors - array of shape (n,len(values)), the corresponding
+                       approximated eigenvectors
+    """
+    n = x.shape[0]
+    m = min(n_landmarks, n)
+    rng = np.random.default_rng(0) if rng is None else rng
+    landmarks = np.sort(rng.choice(n, m, replace=False))
+    x = x.astype(np.float64)
+    x -= x.mean(axis=0)
+    sq_norms = np.einsum('ij,ij->i', x, x)
+
+    # C - the weights between every point and the landmarks
+    c = np.empty((n, m))
+    chunk_size = max(1, block_size // m)
+    for start in range(0, n, chunk_size):
+        end = min(start + chunk_size, n)
+        tile = _distances(x[start:end], x[landmarks], sq_norms[start:end],
+                          sq_norms[landmarks], out=c[start:end])
+        tile *= -0.5
+        np.exp(tile, out=tile)
+    a = c[landmarks]
+
+    # the degrees of C * A^-1 * C^T, without the weight of each point to itself
+    degrees = c @ (_sqrt_pinv(a, inverse=False) @ c.sum(axis=0)) - 1
+    np.maximum(degrees, np.finfo(float).tiny, out=degrees)
+    # D^-0.5 * C * A^-1 * C^T * D^-0.5 = G * G^T, for G = D^-0.5 * C * A^-0.5
+    g = (c / np.sqrt(degrees)[:, None]) @ _sqrt_pinv(a)
+    # the eigenvectors of G * G^T from the (m,m) G^T * G
+    sigma, v = tridiagonal_qr(g.T @ g)
+    sigma = np.diagonal(sigma)
+    order = np.argsort(sigma)[::-1][:ceil(n / 2)]
+    order = order[sigma[order] > NYSTROM_RCOND * sigma.max()]
+    vectors = (g @ v[:, order]) / np.sqrt(sigma[order])
+    # the eigenvalues of the laplacian, I - D^-0.5 * W * D^-0.5
+    return 1 - sigma[order], vectors
+
+
+def _eigenpairs(points, k, affinity, n_neighbors, radius, approx,
+                n_landmarks):
+    """
+    Phases 1-3 of run_nsc (see its parameters) - forms the laplacian of the
+    points, and finds its smallest eigenpairs.
+    :return: values - the smallest eigenvalues (ascending), the first k ones
+                      when k is given
+             vectors - the corresponding eigenvectors, as columns
+    """
+    if approx == "nystrom":
+        with metrics.phase("eigenpairs"):
+            return nystrom_eigenpairs(points, n_landmarks)
+    max_m = None
+    with metrics.phase("laplacian"):
+        if affinity == "knn":
+            l = form_laplacian(form_knn_weight(points, n_neighbors))
+            metrics.record("nnz", l.nnz)
+            max_m = SPARSE_MAX_EIGENPAIRS
+        elif affinity == "radius":
+            l = form_laplacian(form_radius_weight(points, radius))
+            metrics.record("nnz", l.nnz)
+            max_m = SPARSE_MAX_EIGENPAIRS
+        else:
+            # the weights are formed, and turned into the laplacian, in-place
+            l = form_dense_laplacian(points)
+    with metrics.phase("eigenpairs"):
+        return smallest_eigenpairs(l, k, max_m=max_m)
+
+
+def _cached_eigenpairs(points, k, affinity, n_neighbors, radius, approx,
+                       n_landmarks, cache):
+    """
+    _eigenpairs, reusing (and keeping) the eigenpairs in the cache - an
+    eigen_cache.EigenCache, or None for no cache.
+    """
+    if cache is None:
+        return _eigenpairs(points, k, affinity, n_neighbors, radius, approx,
+                           n_landmarks)
+    with metrics.phase("eigen_cache"):
+        key = cache_key(points, eigen_settings(affinity, n_neighbors, radius,
+                                               approx, n_landmarks))
+        cached = cache.get(key, k)
+        metrics.record("hit", cached is not None)
+    if cached is not None:
+        return cached
+    e_values, e_vectors = _eigenpairs(points, k, affinity, n_neighbors, radius,
+                                      approx, n_landmarks)
+    cache.put(key, e_values, e_vectors,
+              len(e_values) if k is None or approx == "nystrom" else None)
+    return e_values, e_vectors
+
+
+def eigen_settings(affinity="dense", n_neighbors=N_NEIGHBORS, radius=None,
+                   approx=None, n_landmarks=N_LANDMARKS):
+    """
+    :return: tuple of the settings of run_nsc that its eigenpairs depend on
+             (other than the points), for eigen_cache.cache_key
+    """
+    return (affinity,
+            n_neighbors if affinity == "knn" else None,
+            radius if affinity == "radius" else None,
+            approx,
+            n_landmarks if approx == "nystrom" else None)
+
+
+def _check_settings(affinity, radius, approx, k, n_landmarks):
+    """
+    Raises ValueError for settings of run_nsc / sweep_nsc that don't fit
+    (see run_nsc), k is the forced (or the biggest) k, or None.
+    """
+    if affinity not in AFFINITIES:
+        raise ValueError(f"Unknown affinity '{affinity}', expected one of "
+                         f"{AFFINITIES}")
+    if approx not in APPROXIMATIONS:
+        raise ValueError(f"Unknown approximation '{approx}', expected one of "
+                         f"{APPROXIMATIONS}")
+    if approx == "nystrom" and affinity != "dense":
+        raise ValueError("approx='nystrom' requires the 'dense' affinity")
+    if affinity == "radius" and radius is None:
+        raise ValueError("affinity='radius' requires a radius")
+    if approx == "nystrom" and k is not None and k > n_landmarks:
+        raise ValueError(f"approx='nystrom' finds at most n_landmarks "
+                         f"({n_landmarks}) eigenpairs, can't force k={k}")
+
+
+def run_nsc(points, k=None, affinity="dense", n_neighbors=N_NEIGHBORS,
+            radius=None, approx=None, n_landmarks=N_LANDMARKS, cache=None):
     """
     Normalized Spectral Clustering Algorithm
     :param points: a collection of n points in R^d, given via array of shape (n,d)
     :param k: optional - choose k in advance and force it
+    :param affinity: the connection-weight-matrix to use:
+                     'dense' - between all of the points (a single (n,n)
+                               buffer, see form_dense_laplacian)
+                     'knn' - only between each point and its n_neighbors
+                             nearest neighbours, stored as a sparse matrix
+                     'radius' - only between points within radius, stored as
+                                a sparse matrix
+                     With the sparse ones, memory scales with the amount of
+                     neighbours instead of n^2, and the eigengap method looks
+                     at most at the SPARSE_MAX_EIGENPAIRS smallest eigenvalues
+                     (their spectrum is less flat, so forcing k is advised).
+    :param n_neighbors: amount of neighbours, for affinity='knn'
+    :param radius: the radius, for affinity='radius'
+    :param approx: None for the exact algorithm, or 'nystrom' - approximates
+                   the eigenvectors from the weights to n_landmarks random
+                   points only (see nystrom_eigenpairs), with the 'dense'
+                   affinity
+    :param n_landmarks: amount of landmark points, for approx='nystrom'
+    :param cache: optional - eigen_cache.EigenCache, to reuse the eigenpairs
+                  of earlier runs on the same points and settings (and to keep
+                  the eigenpairs of this run). A forced k reuses the first k
+                  eigenpairs of a run that didn't force it.
     :return: the result of the Normalized Spectral Algorithm:
-             res - n-sized array, res[i]=j IFF x_i belongs to cluster c_j
+             res - n-sized int32 array, res[i]=j IFF x_i belongs to cluster c_j
              k - the calculated / given k (depends on the input k)
     """
-    # Phase 1:
-    w = form_weight(points)
-    # Phase 2:
-    l = form_laplacian(w)
-    # Phase 3&4:
-    u = form_u(l, k)
-    # Phase 5
-    t = form_t(u)
-    n, k = t.shape
-    # Phase 6&7
-    res = kmeans(points=t, K=k, N=n, d=k, MAX_ITER=MAX_ITER)
+    _check_settings(affinity, radius, approx, k, n_landmarks)
+    # Phase 1-3:
+    e_values, e_vectors = _cached_eigenpairs(points, k, affinity, n_neighbors,
+                                             radius, approx, n_landmarks,
+                                             cache)
+    if k is not None and k > len(e_values):
+        raise ValueError(f"Only {len(e_values)} eigenpairs are available, "
+                         f"can't force k={k}")
+    # Phase 4
+    with metrics.phase("eigengap"):
+        k_indices = eigengap_method(e_values, k)
+        metrics.record("k", len(k_indices))
+    u = e_vectors[:, k_indices]
+    with metrics.phase("kmeans"):
+        # Phase 5
+        t = form_t(u)
+        n, k = t.shape
+        # Phase 6&7
+        res, _ = kmeans_fit(points=t, K=k, N=n, d=k, MAX_ITER=MAX_ITER)
     return res, k
+
+
+@dataclass
+class SweepResult:
+    """
+    A data class to hold the spectral clustering of a single k of sweep_nsc.
+    """
+    k: int
+    # n-sized int32 array, the cluster of each point
+    labels: np.ndarray
+    # the gap between the k-th and the (k+1)-th smallest eigenvalues - the
+    # eigengap method chooses the k of the biggest one (nan when unknown)
+    eigengap: float
+    # sum of the squared distances of the rows of T to their centroids
+    inertia: float
+    # Jaccard measure relative to the real centers (None without them)
+    jaccard: float = None
+
+
+def _sweep_kmeans(e_vectors, k, centers):
+    """
+    Phases 5-7 of run_nsc for a single k of sweep_nsc.
+    :return: the labels, their inertia and their jaccard measure (or None)
+    """
+    with metrics.phase("kmeans"):
+        metrics.record("k", k)
+        t = form_t(e_vectors[:, :k])
+        n = t.shape[0]
+        labels, centroids = kmeans_fit(points=t, K=k, N=n, d=k,
+                                       MAX_ITER=MAX_ITER)
+        distances = t - centroids[labels]
+        inertia = float(np.einsum('ij,ij->', distances, distances))
+        jaccard = None if centers is None else calc_jaccard(centers, labels)
+    return labels, inertia, jaccard
+
+
+def sweep_nsc(points, ks, centers=None, n_jobs=1, affinity="dense",
+              n_neighbors=N_NEIGHBORS, radius=None, approx=None,
+              n_landmarks=N_LANDMARKS, cache=None):
+    """
+    Normalized Spectral Clustering for each of several k - the laplacian and
+    its eigenpairs are computed once (for the biggest k), and only the
+    selection of the eigenvectors and K-means are per k.
+    The labels of each k are the same as run_nsc(points, k) gives (for the
+    same eigenpairs - a forced k finds only k of them, so they can differ up
+    to the eigensolver's tolerance).
+    :param points: a collection of n points in R^d, given via array of shape (n,d)
+    :param ks: the values of k to cluster with
+    :param centers: optional - the real center of each point, to score the
+                    clusters of each k with the Jaccard measure
+    :param n_jobs: amount of threads K-means of the different k run in (the
+                   C extension releases the GIL)
+    :param affinity, n_neighbors, radius, approx, n_landmarks, cache: as in
+                   run_nsc
+    :return: list of SweepResult, one per k (in the order of ks)
+    """
+    ks = [int(k) for k in ks]
+    if not ks or min(ks) < 1 or max(ks) > points.shape[0]:
+        raise ValueError("Each k must be in [1, n]")
+    _check_settings(affinity, radius, approx, max(ks), n_landmarks)
+    # Phase 1-3, once - one more eigenvalue, for the eigengap of the biggest k
+    n_pairs = min(max(ks) + 1, points.shape[0])
+    e_values, e_vectors = _cached_eigenpairs(points, n_pairs, affinity,
+                                             n_neighbors, radius, approx,
+                                             n_landmarks, cache)
+    if max(ks) > len(e_values):
+        raise ValueError(f"Only {len(e_values)} eigenpairs are available")
+    gaps = np.append(np.abs(np.diff(e_values)), np.nan)
+
+    # Phase 4-7, per k
+    def job(k):
+        return contextvars.copy_context().run(_sweep_kmeans, e_vectors, k,
+                                              centers)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        results = list(executor.map(job, ks))
+    return [SweepResult(k, labels, float(gaps[k - 1]), inertia, jaccard)
+            for k, (labels, inertia, jaccard) in zip(ks, results)]
@@ -26,35 +26,131 @@ def build(c):
 
 @task(aliases=["del"])
 def delete(c):
-    c.run("rm *mykmeanssp*.so")
+    c.run("rm *mykmeanssp*.so *mylinalgsp*.so")
 
 
 @task
 def clean(c):
-    c.run("rm data.txt clusters.txt clusters.pdf")
+    c.run("rm -f data.txt data.bin clusters.txt clusters.pdf metrics.json")
 
 
-@task(help={'fname': "Path of the txt containing the data points and centers",
+@task(help={'fname': "Path of the txt (or binary, see binary_data) file "
+                     "containing the data points and centers",
             'k': "K used to create the data",
             'random': "Will use k from eigengap heuristic"})
 def run_from_txt(c, fname, k, random=True):
     """
     run the program and cluster the data-set given in 'fname'
     """
-    import numpy as np
     from main import run_clustering
+    from binary_data import load_data
     # parameters:
     _k = int(k)
     _random = bool(random)
-    # get data from txt:
-    data = np.genfromtxt(fname, delimiter=',', dtype=np.float64)
-    centers = data[:, -1].astype(np.int32)
-    points = data[:, :-1]
+    # get data from txt (or binary file, memory-mapped):
+    points, centers = load_data(fname)
 
     class args:
-        n = data.shape[0]
+        n = points.shape[0]
         dim = points.shape[1]
         k = _k
         random = _random
 
     run_clustering(args, points, centers)
+
+
+@task(help={'fname': "Path of the txt (or binary) file containing the data "
+                     "points and centers",
+            'ks': "Comma separated values of k, or a range 'first-last'",
+            'jobs': "Amount of threads to run K-means of the different k in"})
+def sweep(c, fname, ks="2-10", jobs=1):
+    """
+    cluster the data-set given in 'fname' with each k, computing the
+    spectrum once, and print the scores of each k
+    """
+    from spectral_clustering import sweep_nsc
+    from binary_data import load_data
+    if "-" in ks:
+        first, last = ks.split("-")
+        ks = range(int(first), int(last) + 1)
+    else:
+        ks = [int(k) for k in ks.split(",")]
+    points, centers = load_data(fname)
+    for r in sweep_nsc(points, ks, centers=centers, n_jobs=int(jobs)):
+        print(f"k = {r.k}: eigengap = {r.eigengap:.5f}, "
+              f"inertia = {r.inertia:.5f}, jaccard = {r.jaccard:.5f}")
+
+
+@task(help={'src': "Path of the file to convert, txt or binary",
+            'dst': "Path of the converted file"})
+def convert(c, src, dst):
+    """
+    converts a data-set between the txt format of 'data.txt' and the binary
+    format (see binary_data), according to the format of 'src'
+    """
+    from binary_data import is_binary, binary_to_txt, txt_to_binary
+    if is_binary(src):
+        binary_to_txt(src, dst)
+    else:
+        txt_to_binary(src, dst)
+
+
+@task(help={'output': "Path of the JSON file to save the results to",
+            'baseline': "Path of the results of an earlier benchmark, "
+                        "fails on regressions relative to it",
+            'ns': "Comma separated values of n to benchmark",
+            'ks': "Comma separated values of k to benchmark",
+            'repeat': "Amount of runs of each grid point",
+            'update_config': "Rewrite the Max Capacity constants of config.py"})
+def bench(c, output="benchmark.json", baseline=None, ns=None, ks=None,
+          repeat=1, update_config=False):
+    """
+    times each phase of the program over a grid of n, k and d, and
+    re-derives the Max Capacity constants for the current machine
+    """
+    from invoke.exceptions import Exit
+    import benchmark
+    grid = {}
+    if ns:
+        grid["ns"] = [int(n) for n in ns.split(",")]
+    if ks:
+        grid["ks"] = [int(k) for k in ks.split(",")]
+    results = benchmark.run_benchmark(repeat=int(repeat), **grid)
+    benchmark.save_results(results, output)
+    for name, value in results["capacities"].items():
+        print(f"{name} = {value}")
+    if update_config:
+        benchmark.update_config(results["capacities"])
+    if baseline:
+        regressions = benchmark.compare_results(
+            benchmark.load_results(baseline), results)
+        for r in regressions:
+            print(f"- regression, d = {r['d']}, n = {r['n']}, k = {r['k']}, "
+                  f"{r['phase']}: {r['before']:.3f} -> {r['after']:.3f} sec")
+        if regressions:
+            raise Exit(f"{len(regressions)} regressions", code=1)
+
+
+@task(help={'datasets': "Directory of data-sets files (txt or binary), or a "
+                        "manifest with a line per data-set: its path, and "
+                        "optionally its k",
+            'output_dir': "Directory to save the output files of each "
+                          "data-set to",
+            'k': "K of the data-sets that the manifest doesn't give, 0 for "
+                 "the eigengap heuristic's k",
+            'workers': "Amount of processes, 0 for a process per CPU",
+            'visualization': "Save clusters.pdf of each data-set"})
+def batch(c, datasets, output_dir="batch_output", k=0, workers=0,
+          visualization=False):
+    """
+    cluster many data-sets at once, in a pool of processes
+    """
+    from batch import run_batch
+    report = run_batch(datasets, output_dir, k=int(k) or None,
+                       n_workers=int(workers) or None,
+                       skip_visualization=not visualization)
+    print(f"{report.n_datasets} data-sets ({report.n_points} points) in "
+          f"{report.wall_time:.3f} sec: "
+          f"{report.datasets_per_second:.2f} data-sets/sec, "
+          f"{report.points_per_second:.0f} points/sec, "
+          f"{len(report.failures)} failed")
@@ -0,0 +1,120 @@
+import os
+from multiprocessing.shared_memory import SharedMemory
+from timeit import timeit
+import pytest
+import batch
+import binary_data as bd
+from initialization import make_blobs, ProgramParams
+from main import run_clustering
+from output_data import print_data_txt
+
+
+def _datasets(directory, count=4):
+    directory.mkdir(parents=True)
+    for i in range(count):
+        points, centers = make_blobs(100 + 20 * i, 2 + i % 2, centers=3,
+                                     random_state=i)
+        if i % 2:
+            bd.save_binary(str(directory / f"d{i}.bin"), points, centers)
+        else:
+            print_data_txt(points, centers, str(directory / f"d{i}.txt"))
+    return directory
+
+
+def test_read_manifest(tmp_path):
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("# comment\na.txt, 3\n\nsub/b.bin\n")
+    assert batch.read_manifest(str(manifest)) == \
+        [(str(tmp_path / "a.txt"), 3), (str(tmp_path / "sub/b.bin"), None)]
+
+
+def test_find_datasets(tmp_path):
+    directory = _datasets(tmp_path / "in")
+    (directory / "notes.md").write_text("not a data-set")
+    assert [os.path.basename(p) for p, _ in batch.find_datasets(str(directory))] \
+        == ["d0.txt", "d1.bin", "d2.txt", "d3.bin"]
+
+
+def test_run_batch(tmp_path):
+    directory = _datasets(tmp_path / "in")
+    (directory / "broken.txt").write_text("1,2\n3\n")
+    report = batch.run_batch(str(directory), str(tmp_path / "out"), k=3,
+                             n_workers=2, max_pending=1, log=None,
+                             skip_visualization=True)
+    assert report.n_datasets == 4 and report.n_points == 100 + 120 + 140 + 160
+    assert sorted(report.job_times) == ["d0", "d1", "d2", "d3"]
+    assert list(report.failures) == ["broken"]
+    assert report.datasets_per_second > 0
+
+    # the same results as clustering each data-set on its own
+    for name in report.job_times:
+        path = directory / (name + (".bin" if name in ("d1", "d3") else ".txt"))
+        points, centers = bd.load_data(str(path))
+        expected = tmp_path / "expected" / name
+        expected.mkdir(parents=True)
+        params = ProgramParams(points.shape[0], 3, points.shape[1], False)
+        run_clustering(params, points, centers, skip_visualization=True,
+                       output_dir=str(expected))
+        for fname in ["data.txt", "clusters.txt"]:
+            assert (tmp_path / "out" / name / fname).read_text() == \
+                (expected / fname).read_text()
+
+
+def test_colliding_names(tmp_path):
+    directory = _datasets(tmp_path / "in", count=1)
+    datasets = [(str(directory / "d0.txt"), None)] * 2
+    report = batch.run_batch(datasets, str(tmp_path / "out"), n_workers=1,
+                             log=None, skip_visualization=True)
+    assert sorted(report.job_times) == ["d0_0", "d0_1"]
+
+
+def test_no_leaks_on_errors(tmp_path, monkeypatch):
+    directory = _datasets(tmp_path / "in")
+    created = []
+
+    def to_shared_memory(points, centers):
+        created.append(to_shared_memory.original(points, centers))
+        return created[-1]
+
+    def submit(self, fn, *args):
+        if len(created) == 3:
+            raise RuntimeError("broken pool")
+        return submit.original(self, fn, *args)
+
+    to_shared_memory.original = batch._to_shared_memory
+    submit.original = batch.ProcessPoolExecutor.submit
+    monkeypatch.setattr(batch, "_to_shared_memory", to_shared_memory)
+    monkeypatch.setattr(batch.ProcessPoolExecutor, "submit", submit)
+    with pytest.raises(RuntimeError):
+        batch.run_batch(str(directory), str(tmp_path / "out"), k=3,
+                        n_workers=1, max_pending=4, log=None,
+                        skip_visualization=True)
+    assert len(created) == 3
+    for shm in created:
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(name=shm.name)
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__batch(tmp_path="batch_timing", count=200, n_workers=None):
+    import pathlib
+    import subprocess
+    import sys
+    directory = _datasets(pathlib.Path(tmp_path) / "in", count)
+    report = batch.run_batch(str(directory), os.path.join(tmp_path, "out"),
+                             k=3, n_workers=n_workers, log=None,
+                             skip_visualization=True)
+    print(f"- batch: {report.datasets_per_second:.2f} data-sets/sec")
+    # a process per data-set, as invoking run_from_txt for each of them
+    code = ("import sys; from binary_data import load_data; "
+            "from main import run_clustering; "
+            "from initialization import ProgramParams; "
+            "p, c = load_data(sys.argv[1]); "
+            "run_clustering(ProgramParams(p.shape[0], 3, p.shape[1], False), "
+            "p, c, skip_visualization=True)")
+    paths = [os.path.abspath(p)
+             for p, _ in batch.find_datasets(str(directory))][:20]
+    t = timeit(lambda: [subprocess.run([sys.executable, "-c", code, p],
+                                       check=True, cwd=tmp_path)
+                        for p in paths], number=1)
+    print(f"- a process per data-set: {len(paths) / t:.2f} data-sets/sec")
@@ -0,0 +1,63 @@
+import pytest
+import benchmark
+
+
+def _records(a=1e-6, b=2.0, c=0.5, ns=(100, 200, 400), ks=(5, 20)):
+    return [{"n": n, "k": k, "d": 2,
+             "times": {phase: a * n ** b * k ** c
+                       for phase in benchmark.PHASES}}
+            for n in ns for k in ks]
+
+
+def test_time_phases(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    times = benchmark.time_phases(60, 3, 2)
+    assert set(times) == set(benchmark.PHASES)
+    assert all(t >= 0 for t in times.values())
+    # the outputs are written to a temporary directory
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_fit_scaling():
+    fits = benchmark.fit_scaling(_records())
+    for fit in fits.values():
+        assert fit["a"] == pytest.approx(1e-6)
+        assert fit["b"] == pytest.approx(2.0)
+        assert fit["c"] == pytest.approx(0.5)
+    # a single k
+    fits = benchmark.fit_scaling(_records(ks=(5,)))
+    assert all(f["c"] == 0 for f in fits.values())
+
+
+def test_derive_capacity():
+    fits = benchmark.fit_scaling(_records(c=0))
+    n, k = benchmark.derive_capacity(fits, time_limit=10, k_ratio=0.5)
+    assert k == n // 2
+    assert benchmark.predict_time(fits, n, k) <= 10
+    assert benchmark.predict_time(fits, n + 1, k) > 10
+
+
+def test_compare_results():
+    baseline = {"records": _records()}
+    results = {"records": _records()}
+    assert benchmark.compare_results(baseline, results) == []
+    results["records"][-1]["times"]["kmeans"] *= 2
+    regressions = benchmark.compare_results(baseline, results)
+    assert [(r["n"], r["k"], r["phase"]) for r in regressions] == \
+        [(400, 20, "kmeans")]
+    # too short to be a regression
+    assert benchmark.compare_results(baseline, results, min_time=1) == []
+
+
+def test_update_config(tmp_path):
+    fname = tmp_path / "config.py"
+    fname.write_text("MAX_N_2D_CAPACITY = 470\nMAX_K_2D_CAPACITY = 350\n")
+    benchmark.update_config({"MAX_N_2D_CAPACITY": 1000}, str(fname))
+    assert fname.read_text() == \
+        "MAX_N_2D_CAPACITY = 1000\nMAX_K_2D_CAPACITY = 350\n"
+
+
+def test_save_and_load(tmp_path):
+    results = {"records": _records(), "capacities": {"MAX_N_2D_CAPACITY": 5}}
+    benchmark.save_results(results, str(tmp_path / "b.json"))
+    assert benchmark.load_results(str(tmp_path / "b.json")) == results
@@ -0,0 +1,86 @@
+from timeit import timeit
+import numpy as np
+import pytest
+import binary_data as bd
+import output_data as od
+
+
+def _data(n=1000, d=3, seed=0):
+    rng = np.random.default_rng(seed)
+    points = rng.normal(scale=10, size=(n, d)).astype(np.float32)
+    centers = rng.integers(0, 7, n).astype(np.int32)
+    return points, centers
+
+
+def test_round_trip(tmp_path):
+    fname = str(tmp_path / "data.bin")
+    points, centers = _data()
+    bd.save_binary(fname, points, centers)
+    data = bd.load_binary(fname)
+    assert isinstance(data.points, np.memmap)
+    assert data.points.dtype == np.float32 and data.points.shape == (1000, 3)
+    assert (data.points == points).all() and (data.centers == centers).all()
+    assert data.spectral_clusters is None and data.kmeans_clusters is None
+
+    spectral, kmeans = centers[::-1].copy(), centers % 3
+    bd.save_binary(fname, data.points, data.centers, spectral, kmeans)
+    data = bd.load_binary(fname)
+    assert (data.points == points).all() and (data.centers == centers).all()
+    assert (data.spectral_clusters == spectral).all()
+    assert (data.kmeans_clusters == kmeans).all()
+
+
+def test_is_binary(tmp_path, monkeypatch):
+    monkeypatch.setattr(od.config, "FNAME_DATA_TXT", str(tmp_path / "data.txt"))
+    points, centers = _data(n=10)
+    od.print_data_txt(points, centers)
+    bd.save_binary(str(tmp_path / "data.bin"), points, centers)
+    assert bd.is_binary(str(tmp_path / "data.bin"))
+    assert not bd.is_binary(str(tmp_path / "data.txt"))
+    with pytest.raises(ValueError):
+        bd.load_binary(str(tmp_path / "data.txt"))
+
+
+@pytest.mark.parametrize("n", [1, 999, 1000, 1001])
+def test_converters(tmp_path, monkeypatch, n):
+    txt_fname = str(tmp_path / "data.txt")
+    monkeypatch.setattr(od.config, "FNAME_DATA_TXT", txt_fname)
+    points, centers = _data(n=n)
+    od.print_data_txt(points, centers)
+
+    bd.txt_to_binary(txt_fname, str(tmp_path / "data.bin"), chunk_size=100)
+    data = bd.load_binary(str(tmp_path / "data.bin"))
+    assert (data.centers == centers).all()
+    # 'data.txt' keeps 6 decimal places
+    assert np.allclose(data.points, points, rtol=0, atol=2e-6)
+
+    bd.binary_to_txt(str(tmp_path / "data.bin"), str(tmp_path / "again.txt"),
+                     chunk_size=100)
+    with open(txt_fname) as f, open(str(tmp_path / "again.txt")) as g:
+        assert f.read() == g.read()
+
+
+def test_txt_with_blank_lines(tmp_path):
+    txt_fname = str(tmp_path / "data.txt")
+    with open(txt_fname, "w") as f:
+        f.write("1.5,2,0\n\n3,4.25,1\n5,6,2\n\n")
+    bd.txt_to_binary(txt_fname, str(tmp_path / "data.bin"), chunk_size=2)
+    data = bd.load_binary(str(tmp_path / "data.bin"))
+    points, centers = bd.load_data(txt_fname)
+    assert data.points.shape == (3, 2)
+    assert (data.points == points).all()
+    assert (data.centers == centers).all() and centers.tolist() == [0, 1, 2]
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__load(fname="data_timing", n=10 ** 6, d=3):
+    points, centers = _data(n=n, d=d)
+    od.config.FNAME_DATA_TXT = fname + ".txt"
+    od.print_data_txt(points, centers)
+    bd.save_binary(fname + ".bin", points, centers)
+    t_txt = timeit(lambda: np.genfromtxt(fname + ".txt", delimiter=','),
+                   number=1)
+    t_bin = timeit(lambda: np.asarray(bd.load_binary(fname + ".bin").points)
+                   .sum(), number=1)
+    print(f"- genfromtxt: {t_txt:.3f} sec, binary: {t_bin:.3f} sec "
+          f"(x{t_txt / t_bin:.2f})")
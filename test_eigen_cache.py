@@ -0,0 +1,113 @@
+import os
+from timeit import timeit
+import numpy as np
+import metrics
+from eigen_cache import EigenCache, cache_key
+from initialization import make_blobs
+from output_data import calc_jaccard
+from spectral_clustering import run_nsc, eigen_settings
+
+
+def _pairs(m, n=50, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.random(m)), rng.normal(size=(n, m))
+
+
+def test_cache_key():
+    x = np.arange(12, dtype=np.float64).reshape(6, 2)
+    key = cache_key(x, eigen_settings())
+    assert key == cache_key(x.copy(), eigen_settings())
+    # non-contiguous views of the same values
+    assert key == cache_key(np.asfortranarray(x), eigen_settings())
+    assert key != cache_key(x.astype(np.float32), eigen_settings())
+    assert key != cache_key(x.reshape(4, 3), eigen_settings())
+    assert key != cache_key(x, eigen_settings("knn"))
+    assert cache_key(x, eigen_settings("knn", 5)) != \
+        cache_key(x, eigen_settings("knn", 6))
+    # irrelevant settings are ignored
+    assert key == cache_key(x, eigen_settings(n_neighbors=5))
+    y = x.copy()
+    y[3, 1] += 1e-12
+    assert key != cache_key(y, eigen_settings())
+
+
+def test_get_put():
+    cache = EigenCache()
+    values, vectors = _pairs(8)
+    cache.put("a", values, vectors, n_auto=None)
+    assert cache.get("a", None) is None
+    got_values, got_vectors = cache.get("a", 5)
+    assert (got_values == values[:5]).all()
+    assert (got_vectors == vectors[:, :5]).all()
+    assert cache.get("a", 9) is None
+    # merged with a smaller set, computed without forcing k
+    cache.put("a", values[:4], vectors[:, :4], n_auto=4)
+    assert len(cache.get("a", None)[0]) == 4
+    assert len(cache.get("a", 8)[0]) == 8
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+def test_memory_eviction():
+    entry_bytes = sum(a.nbytes for a in _pairs(4))
+    cache = EigenCache(max_bytes=3 * entry_bytes)
+    for key in "abc":
+        cache.put(key, *_pairs(4))
+    cache.get("a", 4)
+    cache.put("d", *_pairs(4))
+    # b is the least recently used
+    assert cache.get("b", 4) is None
+    assert all(cache.get(key, 4) is not None for key in "acd")
+    # too big to be kept at all
+    cache.put("e", *_pairs(40))
+    assert cache.get("e", 4) is None and len(cache) == 3
+
+
+def test_disk(tmp_path):
+    entry = _pairs(4)
+    cache = EigenCache(directory=str(tmp_path))
+    cache.put("a", *entry, n_auto=4)
+    again = EigenCache(directory=str(tmp_path))
+    values, vectors = again.get("a")
+    assert (values == entry[0]).all() and (vectors == entry[1]).all()
+    assert again.get("b") is None
+
+
+def test_disk_eviction(tmp_path):
+    cache = EigenCache(directory=str(tmp_path))
+    cache.put("a", *_pairs(4))
+    file_bytes = os.path.getsize(tmp_path / "a.npz")
+    cache = EigenCache(directory=str(tmp_path),
+                       max_disk_bytes=int(2.5 * file_bytes))
+    cache.put("b", *_pairs(4))
+    os.utime(tmp_path / "a.npz", (0, 0))
+    cache.put("c", *_pairs(4))
+    assert sorted(os.listdir(tmp_path)) == ["b.npz", "c.npz"]
+
+
+def test_run_nsc_cached():
+    points, centers = make_blobs(400, 2, centers=4, random_state=0)
+    cache = EigenCache()
+    expected, k = run_nsc(points)
+    labels, cached_k = run_nsc(points, cache=cache)
+    assert k == cached_k and (labels == expected).all()
+    with metrics.MetricsRecorder() as recorder:
+        labels, cached_k = run_nsc(points, cache=cache)
+        # a forced k reuses the eigenpairs too
+        forced, _ = run_nsc(points, k + 1, cache=cache)
+    assert k == cached_k and (labels == expected).all()
+    assert [p["name"] for p in recorder.phases] == \
+        ["eigen_cache", "eigengap", "kmeans"] * 2
+    assert calc_jaccard(forced, run_nsc(points, k + 1)[0]) > 0.95
+    # different settings aren't mixed up
+    run_nsc(points, affinity="knn", cache=cache)
+    assert cache.hits == 2 and cache.misses == 2
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__cached_nsc(n=3000):
+    points, _ = make_blobs(n, 3, centers=5, random_state=0)
+    cache = EigenCache()
+    t_first = timeit(lambda: run_nsc(points, cache=cache), number=1)
+    t_forced = timeit(lambda: run_nsc(points, 6, cache=cache), number=1)
+    print(f"- first run: {t_first:.3f} sec, forced k (cached): "
+          f"{t_forced:.3f} sec (x{t_first / t_forced:.2f})")
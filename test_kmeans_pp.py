@@ -0,0 +1,389 @@
+import itertools
+from timeit import timeit
+import tracemalloc
+import numpy as np
+import pytest
+import mykmeanssp as km
+from kmeans_pp import k_means_pp, k_means_parallel, kmeans, kmeans_fit
+from config import MAX_ITER
+
+
+def _blobs(n=300, d=3, k=4, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(k, d))
+    return centers[rng.integers(0, k, n)] + rng.normal(size=(n, d))
+
+
+def _naive_k_means_pp(k, obs_arr):
+    # the original implementation, kept as a reference
+    np.random.seed(0)
+    n = len(obs_arr)
+    initial_indices = np.empty(k, dtype=int)
+    chosen_index = np.random.choice(n)
+    initial_indices[0] = chosen_index
+    minimal_distances = np.linalg.norm(obs_arr - obs_arr[chosen_index],
+                                       axis=1) ** 2
+    for i in range(1, k):
+        probs = minimal_distances / minimal_distances.sum()
+        chosen_index = np.random.choice(n, p=probs)
+        initial_indices[i] = chosen_index
+        new_distances = np.linalg.norm(obs_arr - obs_arr[chosen_index],
+                                       axis=1) ** 2
+        np.minimum(minimal_distances, new_distances, out=minimal_distances)
+    np.random.seed(None)
+    return initial_indices
+
+
+def _potential(x, indices):
+    centers = x[indices]
+    distances = ((x[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+    return distances.min(axis=1).sum()
+
+
+class TestKMeansPP:
+    def test_same_as_naive(self):
+        for seed in range(5):
+            x = _blobs(n=500, k=6, seed=seed)
+            assert (k_means_pp(6, x) == _naive_k_means_pp(6, x)).all()
+
+    def test_greedy(self):
+        x = _blobs(n=2000, d=2, k=30)
+        standard = k_means_pp(30, x)
+        greedy = k_means_pp(30, x, n_local_trials=5)
+        assert len(set(greedy)) == 30
+        assert _potential(x, greedy) <= _potential(x, standard)
+
+    def test_duplicate_points(self):
+        x = np.repeat(_blobs(n=5, k=5), 20, axis=0)
+        for n_local_trials in [1, 3]:
+            indices = k_means_pp(5, x, n_local_trials)
+            assert len({tuple(p) for p in x[indices]}) == 5
+
+    def test_init_methods(self):
+        x = _blobs()
+        n, d = x.shape
+        labels, _ = kmeans_fit(x, 4, n, d, MAX_ITER, init="greedy-k-means++")
+        assert set(labels.tolist()) == {0, 1, 2, 3}
+        with pytest.raises(ValueError):
+            kmeans_fit(x, 4, n, d, MAX_ITER, init="random")
+
+
+class TestKMeansParallel:
+    def test_indices(self):
+        x = _blobs(n=3000, k=20)
+        indices = k_means_parallel(20, x)
+        assert indices.shape == (20,)
+        assert len(set(indices.tolist())) == 20
+        assert (0 <= indices).all() and (indices < 3000).all()
+
+    def test_reproducible(self):
+        x = _blobs(n=3000, k=20)
+        first = k_means_parallel(20, x, rng=np.random.default_rng(7))
+        again = k_means_parallel(20, x, rng=np.random.default_rng(7),
+                                 n_jobs=4, chunk_size=100)
+        assert (first == again).all()
+
+    def test_global_random_state_untouched(self):
+        x = _blobs()
+        np.random.seed(123)
+        expected = np.random.random()
+        np.random.seed(123)
+        k_means_pp(4, x)
+        k_means_parallel(4, x)
+        kmeans_fit(x, 4, x.shape[0], x.shape[1], MAX_ITER, init="k-means||")
+        assert np.random.random() == expected
+
+
+class TestBufferInput:
+    def test_buffer_matches_list(self):
+        x = _blobs()
+        n, d = x.shape
+        indices = k_means_pp(4, x)
+        from_list = km.kmeans(x.tolist(), indices.tolist(), 4, n, d, MAX_ITER)
+        from_buffer = km.kmeans(x, indices, 4, n, d, MAX_ITER)
+        assert from_list == from_buffer
+
+    def test_float32_buffer(self):
+        x = _blobs().astype(np.float32)
+        n, d = x.shape
+        indices = k_means_pp(4, x)
+        from_list = km.kmeans(x.tolist(), indices.tolist(), 4, n, d, MAX_ITER)
+        # in single precision, the same clusters for well separated blobs
+        from_buffer = km.kmeans(x, indices.astype(np.int32), 4, n, d, MAX_ITER)
+        assert from_list == from_buffer
+
+    def test_bad_buffers(self):
+        x = _blobs()
+        n, d = x.shape
+        with pytest.raises(ValueError):
+            # not C-contiguous
+            km.kmeans(np.asfortranarray(x), [0, 1, 2, 3], 4, n, d, MAX_ITER)
+        with pytest.raises(ValueError):
+            # unsupported dtype
+            km.kmeans(x.astype(np.int64), [0, 1, 2, 3], 4, n, d, MAX_ITER)
+        with pytest.raises(IndexError):
+            km.kmeans(x, np.array([0, 1, 2, n]), 4, n, d, MAX_ITER)
+
+    def test_wrapper(self):
+        x = _blobs()
+        n, d = x.shape
+        clusters = kmeans(x, 4, n, d, MAX_ITER)
+        assert len(clusters) == n
+        assert set(clusters) == {0, 1, 2, 3}
+
+
+class TestKmeansFit:
+    def test_matches_kmeans(self):
+        x = _blobs()
+        n, d = x.shape
+        labels, centroids = kmeans_fit(x, 4, n, d, MAX_ITER)
+        assert labels.dtype == np.int32 and labels.shape == (n,)
+        assert centroids.shape == (4, d)
+        assert labels.tolist() == kmeans(x, 4, n, d, MAX_ITER)
+        # the final centroids are the means of their clusters
+        for i in range(4):
+            assert np.allclose(centroids[i], x[labels == i].mean(axis=0))
+
+    def test_iterations_and_bad_output(self):
+        x = _blobs()
+        n, d = x.shape
+        indices = k_means_pp(4, x)
+        labels = np.empty(n, dtype=np.int32)
+        centroids = np.empty((4, d))
+        assert km.kmeans_fit(x, indices, 4, n, d, 1, labels, centroids) == 1
+        assert 1 <= km.kmeans_fit(x, indices, 4, n, d, MAX_ITER,
+                                  labels, centroids) <= MAX_ITER
+        with pytest.raises(ValueError):
+            km.kmeans_fit(x, indices, 4, n, d, MAX_ITER,
+                          labels.astype(np.int64), centroids)
+        with pytest.raises(ValueError):
+            km.kmeans_fit(x, indices, 4, n, d, MAX_ITER, labels, centroids[:2])
+
+
+class TestAcceleratedKmeans:
+    @pytest.mark.parametrize("algorithm", ["hamerly", "elkan"])
+    def test_same_as_lloyd(self, algorithm):
+        for k, d in [(2, 2), (6, 3), (25, 5)]:
+            x = _blobs(n=1000, d=d, k=k)
+            lloyd = kmeans_fit(x, k, 1000, d, MAX_ITER)
+            accelerated = kmeans_fit(x, k, 1000, d, MAX_ITER,
+                                     algorithm=algorithm)
+            assert (lloyd[0] == accelerated[0]).all()
+            assert (lloyd[1] == accelerated[1]).all()
+
+    @pytest.mark.parametrize("algorithm", ["hamerly", "elkan"])
+    def test_same_as_lloyd_with_ties(self, algorithm):
+        # points on a small grid - many duplicates and equal distances
+        rng = np.random.default_rng(0)
+        for k in range(2, 10):
+            x = rng.integers(0, 4, size=(200, 2)).astype(float)
+            lloyd, _ = kmeans_fit(x, k, 200, 2, MAX_ITER)
+            accelerated, _ = kmeans_fit(x, k, 200, 2, MAX_ITER,
+                                        algorithm=algorithm)
+            assert (lloyd == accelerated).all()
+
+    def test_unknown_algorithm(self):
+        x = _blobs()
+        with pytest.raises(ValueError):
+            kmeans_fit(x, 4, x.shape[0], x.shape[1], MAX_ITER,
+                       algorithm="bogus")
+
+
+class TestThreads:
+    @pytest.mark.parametrize("algorithm", ["lloyd", "hamerly", "elkan"])
+    def test_deterministic(self, algorithm):
+        x = _blobs(n=2000, d=4, k=8)
+        single, _ = kmeans_fit(x, 8, 2000, 4, MAX_ITER, algorithm=algorithm)
+        first, first_centroids = kmeans_fit(x, 8, 2000, 4, MAX_ITER,
+                                            algorithm=algorithm, n_threads=4)
+        for _ in range(3):
+            labels, centroids = kmeans_fit(x, 8, 2000, 4, MAX_ITER,
+                                           algorithm=algorithm, n_threads=4)
+            assert (labels == first).all()
+            assert (centroids == first_centroids).all()
+        assert (single == first).all()
+
+    def test_more_threads_than_observations(self):
+        x = _blobs(n=10, k=2)
+        labels, _ = kmeans_fit(x, 2, 10, 3, MAX_ITER, n_threads=64)
+        assert (labels == kmeans_fit(x, 2, 10, 3, MAX_ITER)[0]).all()
+        with pytest.raises(ValueError):
+            kmeans_fit(x, 2, 10, 3, MAX_ITER, n_threads=0)
+
+
+class TestRestarts:
+    def _inertia(self, x, labels, centroids):
+        return ((x - centroids[labels]) ** 2).sum()
+
+    def test_keeps_the_best(self):
+        x = _blobs(n=1000, d=2, k=12, seed=3)
+        n, d = x.shape
+        rng = np.random.default_rng(0)
+        indices = np.concatenate([rng.choice(n, 12, replace=False)
+                                  for _ in range(6)])
+        labels = np.empty(n, dtype=np.int32)
+        centroids = np.empty((12, d))
+        inertias = np.empty(6)
+        km.kmeans_fit(x, indices, 12, n, d, MAX_ITER, labels, centroids,
+                      n_init=6, inertias=inertias)
+        # each restart's inertia is the same as running it alone
+        for i in range(6):
+            single_labels = np.empty(n, dtype=np.int32)
+            single_centroids = np.empty((12, d))
+            km.kmeans_fit(x, indices[i * 12:(i + 1) * 12], 12, n, d, MAX_ITER,
+                          single_labels, single_centroids)
+            assert np.isclose(inertias[i], self._inertia(x, single_labels,
+                                                         single_centroids))
+            if i == np.argmin(inertias):
+                assert (labels == single_labels).all()
+                assert (centroids == single_centroids).all()
+        assert len(np.unique(inertias)) > 1
+        with pytest.raises(ValueError):
+            km.kmeans_fit(x, indices, 12, n, d, MAX_ITER, labels, centroids,
+                          n_init=7)
+        with pytest.raises(ValueError):
+            km.kmeans_fit(x, indices, 12, n, d, MAX_ITER, labels, centroids,
+                          n_init=6, inertias=inertias[:5])
+
+    @pytest.mark.parametrize("init", ["k-means++", "k-means||"])
+    def test_n_init(self, init):
+        x = _blobs(n=1000, d=2, k=12, seed=3)
+        single = kmeans_fit(x, 12, 1000, 2, MAX_ITER, init=init)
+        best = kmeans_fit(x, 12, 1000, 2, MAX_ITER, init=init, n_init=8)
+        # the first restart is the single run, so the best is at least as good
+        assert self._inertia(x, *best) <= self._inertia(x, *single)
+        assert kmeans(x, 12, 1000, 2, MAX_ITER, init=init, n_init=1) == \
+            single[0].tolist()
+        for n_threads in [3, 8, 16]:
+            labels, centroids = kmeans_fit(x, 12, 1000, 2, MAX_ITER, init=init,
+                                           n_init=8, n_threads=n_threads)
+            assert np.isclose(self._inertia(x, labels, centroids),
+                              self._inertia(x, *best))
+        with pytest.raises(ValueError):
+            kmeans_fit(x, 12, 1000, 2, MAX_ITER, n_init=0)
+
+
+class TestFloat32:
+    def test_close_to_float64(self):
+        x = _blobs(n=5000, d=5, k=10, seed=1)
+        labels64, centroids64 = kmeans_fit(x, 10, 5000, 5, MAX_ITER)
+        labels32, centroids32 = kmeans_fit(x.astype(np.float32), 10, 5000, 5,
+                                           MAX_ITER)
+        assert (labels32 == labels64).mean() > 0.999
+        assert np.allclose(centroids32, centroids64, atol=1e-4)
+        # the sums are accumulated in double
+        x32 = x.astype(np.float32).astype(np.float64)
+        for i in range(10):
+            assert np.allclose(centroids32[i], x32[labels32 == i].mean(axis=0),
+                               rtol=1e-12, atol=1e-12)
+
+    @pytest.mark.parametrize("algorithm", ["hamerly", "elkan"])
+    def test_same_as_lloyd(self, algorithm):
+        rng = np.random.default_rng(0)
+        for k, d in [(2, 2), (6, 3), (25, 5)]:
+            x = _blobs(n=1000, d=d, k=k).astype(np.float32)
+            lloyd = kmeans_fit(x, k, 1000, d, MAX_ITER)
+            accelerated = kmeans_fit(x, k, 1000, d, MAX_ITER,
+                                     algorithm=algorithm, n_threads=3)
+            assert (lloyd[0] == accelerated[0]).all()
+            assert np.allclose(lloyd[1], accelerated[1], rtol=1e-12)
+            # points on a small grid - many duplicates and equal distances
+            x = rng.integers(0, 4, size=(200, 2)).astype(np.float32)
+            lloyd, _ = kmeans_fit(x, k, 200, 2, MAX_ITER)
+            accelerated, _ = kmeans_fit(x, k, 200, 2, MAX_ITER,
+                                        algorithm=algorithm)
+            assert (lloyd == accelerated).all()
+
+    @pytest.mark.parametrize("algorithm", ["hamerly", "elkan"])
+    def test_same_as_lloyd_far_from_origin(self, algorithm):
+        # float32 rounds these mu by about as much as the distances between them
+        for spread, seed in itertools.product([0.01, 0.5], range(10)):
+            rng = np.random.default_rng(seed)
+            centers = 5000 + rng.uniform(-spread, spread, size=(20, 3))
+            x = (centers[rng.integers(0, 20, 3000)] +
+                 rng.normal(scale=0.1, size=(3000, 3))).astype(np.float32)
+            lloyd = kmeans_fit(x, 20, 3000, 3, MAX_ITER,
+                               rng=np.random.default_rng(seed))
+            accelerated = kmeans_fit(x, 20, 3000, 3, MAX_ITER,
+                                     algorithm=algorithm,
+                                     rng=np.random.default_rng(seed))
+            assert (lloyd[0] == accelerated[0]).all()
+            assert np.allclose(lloyd[1], accelerated[1], rtol=1e-12)
+
+    def test_no_float64_copy(self, monkeypatch):
+        x = _blobs(n=100000, d=5, k=10).astype(np.float32)
+        in_use = []
+
+        def fit(*args, **kwargs):
+            in_use.append(tracemalloc.get_traced_memory()[0])
+            return fit.original(*args, **kwargs)
+
+        fit.original = km.kmeans_fit
+        monkeypatch.setattr(km, "kmeans_fit", fit)
+        tracemalloc.start()
+        kmeans_fit(x, 10, 100000, 5, MAX_ITER)
+        tracemalloc.stop()
+        # the seeding's float64 copy is freed before clustering
+        assert in_use[0] < x.size * 8 / 2
+
+    def test_restarts(self):
+        x = _blobs(n=1000, d=2, k=12, seed=3).astype(np.float32)
+        labels, centroids = kmeans_fit(x, 12, 1000, 2, MAX_ITER, n_init=4,
+                                       n_threads=2)
+        assert centroids.dtype == np.float64
+        assert (labels == kmeans_fit(x, 12, 1000, 2, MAX_ITER, n_init=4)[0]
+                ).all()
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__kmeans_threads(n=200000, d=8, k=60, threads=(1, 2, 4, 8)):
+    x = _blobs(n=n, d=d, k=k)
+    base = None
+    for n_threads in threads:
+        t = timeit(lambda: kmeans_fit(x, k, n, d, MAX_ITER,
+                                      n_threads=n_threads), number=1)
+        base = base or t
+        print(f"- n_threads = {n_threads}: {t:.3f} sec (x{base / t:.2f})")
+
+
+def time__kmeans_algorithms(n=20000, d=5, ks=(5, 20, 50, 100, 200)):
+    for k in ks:
+        x = _blobs(n=n, d=d, k=k)
+        indices = k_means_pp(k, x)
+        labels = np.empty(n, dtype=np.int32)
+        centroids = np.empty((k, d))
+        times = {}
+        for algorithm in ["lloyd", "hamerly", "elkan"]:
+            times[algorithm] = timeit(
+                lambda: km.kmeans_fit(x, indices, k, n, d, MAX_ITER, labels,
+                                      centroids, algorithm=algorithm),
+                number=3)
+        print(f"- k = {k}: " + ", ".join(
+            f"{a}: {t:.3f} sec (x{times['lloyd'] / t:.2f})"
+            for a, t in times.items()))
+
+
+def time__kmeans_n_init(n=20000, d=5, k=30, n_inits=(1, 4, 10),
+                        threads=(1, 4)):
+    x = _blobs(n=n, d=d, k=k).astype(np.float32)
+    for n_init in n_inits:
+        for n_threads in threads:
+            t = timeit(lambda: kmeans_fit(x, k, n, d, MAX_ITER, n_init=n_init,
+                                          n_threads=n_threads), number=1)
+            t_python = timeit(lambda: [kmeans_fit(
+                x, k, n, d, MAX_ITER, rng=np.random.default_rng(i),
+                n_threads=n_threads) for i in range(n_init)], number=1)
+            print(f"- n_init = {n_init}, n_threads = {n_threads}: {t:.3f} sec,"
+                  f" restarts from python: {t_python:.3f} sec")
+
+
+def time__kmeans_float32(n=1000000, d=3, k=20):
+    x = _blobs(n=n, d=d, k=k)
+    indices = k_means_pp(k, x[:10000])
+    labels = np.empty(n, dtype=np.int32)
+    centroids = np.empty((k, d))
+    for dtype in [np.float64, np.float32]:
+        points = x.astype(dtype)
+        t = timeit(lambda: km.kmeans_fit(points, indices, k, n, d, MAX_ITER,
+                                         labels, centroids), number=1)
+        print(f"- {np.dtype(dtype).name}: {t:.3f} sec")
@@ -1,6 +1,8 @@
+from timeit import timeit
 import numpy as np
 import pytest
 import linalg
+import spectral_clustering as nsc
 
 
 class TestGS:
@@ -46,3 +48,152 @@ class TestGS:
         q, r = linalg.gram_schmidt(a)
         assert np.allclose(q, expected_q, atol=0.01)
         assert np.allclose(r, expected_r, atol=0.01)
+
+
+def _symmetric(n, seed=0):
+    a = np.random.default_rng(seed).normal(size=(n, n))
+    return a + a.T
+
+
+class TestTridiagonalQR:
+    @pytest.mark.parametrize("n", [1, 2, 3, 10, 100])
+    def test_decomposition(self, n):
+        a = _symmetric(n)
+        a_, q_ = linalg.tridiagonal_qr(a)
+        eigen_values = np.diagonal(a_)
+        assert (a_ == np.diag(eigen_values)).all()
+        assert np.allclose(q_.T @ q_, np.eye(n))
+        assert np.allclose(a @ q_, q_ * eigen_values)
+        assert np.allclose(np.sort(eigen_values), np.linalg.eigvalsh(a))
+
+    def test_repeated_eigenvalues(self):
+        for a in [np.eye(5), np.zeros((4, 4)), np.ones((6, 6)),
+                  np.kron(np.eye(3), np.ones((2, 2)))]:
+            a_, q_ = linalg.tridiagonal_qr(a)
+            assert np.allclose(q_.T @ q_, np.eye(a.shape[0]))
+            assert np.allclose(a @ q_, q_ * np.diagonal(a_))
+
+    def test_input_unchanged(self):
+        a = _symmetric(20)
+        copy = a.copy()
+        linalg.tridiagonal_qr(a)
+        assert (a == copy).all()
+
+    def test_same_eigengap_as_qr_iteration(self):
+        x = np.random.default_rng(0).normal(size=(60, 2))
+        x[:20] += 10
+        x[20:40] -= 10
+        l = nsc.form_laplacian(nsc.form_weight(x))
+        new_values, new_vectors = linalg.tridiagonal_qr(l)
+        old_values, old_vectors = linalg.qr_iteration(l)
+        new_k = linalg.eigengap_method(new_values)
+        old_k = linalg.eigengap_method(old_values)
+        assert len(new_k) == len(old_k) == 3
+        # the chosen eigen-spaces are the same (the vectors may differ by sign)
+        new_u, old_u = new_vectors[:, new_k], old_vectors[:, old_k]
+        assert np.allclose(new_u @ new_u.T, old_u @ old_u.T, atol=1e-3)
+
+    def test_bad_buffers(self):
+        import mylinalgsp
+        with pytest.raises(ValueError):
+            mylinalgsp.eigh_tridiagonal_qr(np.eye(3), np.empty(2))
+        with pytest.raises(ValueError):
+            mylinalgsp.eigh_tridiagonal_qr(np.eye(3, dtype=np.float32),
+                                           np.empty(3))
+
+
+class TestCSRMatrix:
+    def test_from_coo(self):
+        rng = np.random.default_rng(0)
+        dense = rng.normal(size=(30, 20)) * (rng.random((30, 20)) < 0.2)
+        dense[3] = 0
+        rows, cols = np.nonzero(dense)
+        order = rng.permutation(len(rows))
+        a = linalg.CSRMatrix.from_coo(rows[order], cols[order],
+                                      dense[rows, cols][order], dense.shape)
+        assert a.nnz == len(rows)
+        assert (a.toarray() == dense).all()
+        assert (a.diagonal() == np.diagonal(dense)).all()
+        block = rng.normal(size=(20, 4))
+        assert np.allclose(a @ block, dense @ block)
+        assert np.allclose(a @ block[:, 0], dense @ block[:, 0])
+        left, right = rng.random(30), rng.random(20)
+        assert np.allclose(a.scale(left, right).toarray(),
+                           left[:, None] * dense * right)
+
+    def test_sparse_eigenpairs(self):
+        l = _laplacian(300, 3)
+        l[np.abs(l) < 1e-3] = 0
+        rows, cols = np.nonzero(l)
+        sparse = linalg.CSRMatrix.from_coo(rows, cols, l[rows, cols], l.shape)
+        values, vectors = linalg.smallest_eigenpairs(sparse, k=10)
+        assert values.shape == (10,)
+        assert np.allclose(values, np.linalg.eigvalsh(l)[:10])
+
+
+def _laplacian(n, k, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(-10, 10, size=(k, 3))
+    x = centers[rng.integers(0, k, n)] + rng.normal(size=(n, 3))
+    return nsc.form_laplacian(nsc.form_weight(x))
+
+
+class TestPartialEigen:
+    def test_lobpcg(self):
+        a = _symmetric(300)
+        x = np.random.default_rng(1).normal(size=(300, 6))
+        values, vectors = linalg.lobpcg(a, x, n_wanted=4)
+        expected = np.linalg.eigvalsh(a)[:4]
+        assert np.allclose(values[:4], expected)
+        assert np.allclose(a @ vectors[:, :4], vectors[:, :4] * values[:4],
+                           atol=1e-6)
+        assert np.allclose(vectors.T @ vectors, np.eye(6))
+
+    @pytest.mark.parametrize("n, k", [(500, 4), (1000, 7)])
+    def test_same_eigengap_as_full(self, n, k):
+        l = _laplacian(n, k)
+        values, vectors = linalg.smallest_eigenpairs(l)
+        assert len(values) < n / 4
+        full_values, _ = linalg.tridiagonal_qr(l)
+        expected = linalg.eigengap_method(full_values)
+        assert len(linalg.eigengap_method(values)) == len(expected) == k
+        assert np.allclose(values, np.sort(np.diagonal(full_values))[
+                                   :len(values)])
+        assert np.allclose(l @ vectors, vectors * values, atol=1e-6)
+
+    def test_forced_k(self):
+        l = _laplacian(800, 3)
+        values, vectors = linalg.smallest_eigenpairs(l, k=5)
+        assert values.shape == (5,) and vectors.shape == (800, 5)
+        assert np.allclose(values, np.linalg.eigvalsh(l)[:5])
+
+    def test_small_matrix(self):
+        # the full decomposition is used, the first half of the eigenvalues
+        l = _laplacian(20, 2)
+        values, vectors = linalg.smallest_eigenpairs(l)
+        assert values.shape == (10,) and vectors.shape == (20, 10)
+        assert np.allclose(values, np.linalg.eigvalsh(l)[:10])
+
+    def test_eigengap_1d(self):
+        values = np.array([0.3, 0, 0.01, 0.02, 0.5])
+        assert (linalg.eigengap_method(values) == [1, 2, 3]).all()
+        assert (linalg.eigengap_method(values, 2) == [1, 2]).all()
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__eigen_engines(ns=(50, 100, 200, 470)):
+    for n in ns:
+        a = _symmetric(n)
+        t1 = timeit(lambda: linalg.qr_iteration(a), number=1)
+        t2 = timeit(lambda: linalg.tridiagonal_qr(a), number=1)
+        print(f"- n = {n}: qr_iteration: {t1:.3f} sec, "
+              f"tridiagonal_qr: {t2:.3f} sec (x{t1 / t2:.1f})")
+
+
+def time__partial_eigen(ns=(500, 1000, 2000, 4000), k=5):
+    for n in ns:
+        l = _laplacian(n, k)
+        t1 = timeit(lambda: linalg.tridiagonal_qr(l), number=1)
+        t2 = timeit(lambda: linalg.smallest_eigenpairs(l), number=1)
+        print(f"- n = {n}: tridiagonal_qr: {t1:.3f} sec, "
+              f"smallest_eigenpairs: {t2:.3f} sec (x{t1 / t2:.1f})")
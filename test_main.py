@@ -0,0 +1,66 @@
+import re
+import subprocess
+import sys
+from timeit import timeit
+import pytest
+
+# Maximal time (in seconds) importing main may take
+IMPORT_TIME_BUDGET = 1.0
+
+
+def _import_main(code=""):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           "import main\n" + code],
+                          capture_output=True, text=True, check=True)
+
+
+def test_no_heavy_imports():
+    result = _import_main("import sys\n"
+                          "print(*sorted(sys.modules), sep='\\n')")
+    modules = set(result.stdout.split())
+    assert "main" in modules
+    assert not {"matplotlib", "sklearn", "scipy"} & modules
+
+
+def test_import_time():
+    result = _import_main()
+    # the cumulative time of main's import, in microseconds
+    cumulative = re.search(r"\|\s*(\d+)\s*\|\s*main$", result.stderr, re.M)
+    assert int(cumulative.group(1)) / 1e6 < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize("random", [False, True])
+def test_concurrent_same_results(tmp_path, monkeypatch, random):
+    from initialization import make_blobs, ProgramParams
+    from main import run_clustering
+    points, centers = make_blobs(400, 3, centers=4, random_state=0)
+    params = ProgramParams(400, 4, 3, random)
+    outputs = []
+    for concurrent in [False, True]:
+        directory = tmp_path / str(concurrent)
+        directory.mkdir()
+        monkeypatch.chdir(directory)
+        run_clustering(params, points, centers, skip_visualization=True,
+                       concurrent=concurrent)
+        outputs.append([(directory / fname).read_text()
+                        for fname in ["data.txt", "clusters.txt"]])
+    assert outputs[0] == outputs[1]
+
+
+# ------------------ TIME COMPARISONS: -----------------
+def time__import_main():
+    result = _import_main()
+    for line in result.stderr.splitlines()[-10:]:
+        print(line)
+
+
+def time__concurrent(n=4000, k=50, d=3):
+    from initialization import make_blobs, ProgramParams
+    from main import run_clustering
+    points, centers = make_blobs(n, d, centers=k, random_state=0)
+    params = ProgramParams(n, k, d, False)
+    for concurrent in [False, True]:
+        t = timeit(lambda: run_clustering(params, points, centers,
+                                          skip_visualization=True,
+                                          concurrent=concurrent), number=1)
+        print(f"- concurrent = {concurrent}: {t:.3f} sec")
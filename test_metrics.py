@@ -0,0 +1,87 @@
+import json
+import numpy as np
+import metrics
+from initialization import make_blobs, ProgramParams
+from main import run_clustering
+from spectral_clustering import run_nsc
+
+
+def test_without_recorder():
+    assert metrics.current_recorder() is None
+    with metrics.phase("nothing"):
+        metrics.count("a")
+        metrics.record("b", 1)
+
+
+def test_nested_phases():
+    with metrics.MetricsRecorder() as recorder:
+        assert metrics.current_recorder() is recorder
+        metrics.record("n", 10)
+        with metrics.phase("outer"):
+            metrics.count("calls")
+            with metrics.phase("inner"):
+                big = np.ones(2 ** 20)  # 8 MB
+                metrics.count("calls", 2)
+                metrics.count("calls", 3)
+            del big
+            metrics.count("calls")
+    assert metrics.current_recorder() is None
+    outer, inner = recorder.phases
+    assert (outer["name"], inner["name"]) == ("outer", "outer/inner")
+    assert recorder.counters == {"n": 10}
+    assert outer["counters"] == {"calls": 2}
+    assert inner["counters"] == {"calls": 5}
+    assert inner["peak_memory"] >= 8 * 2 ** 20
+    assert outer["peak_memory"] >= inner["peak_memory"]
+    assert outer["wall_time"] >= inner["wall_time"] >= 0
+    assert recorder.wall_time >= outer["wall_time"]
+
+
+def test_without_reset_peak(monkeypatch):
+    # as on Python 3.8
+    monkeypatch.setattr(metrics, "_CAN_RESET_PEAK", False)
+    monkeypatch.delattr(metrics.tracemalloc, "reset_peak")
+    with metrics.MetricsRecorder() as recorder:
+        for name in ["first", "second"]:
+            with metrics.phase(name):
+                with metrics.phase("inner"):
+                    big = np.ones(2 ** 20)  # 8 MB
+                del big
+    first, first_inner, second, second_inner = recorder.phases
+    assert 8 * 2 ** 20 <= first["peak_memory"] < 9 * 2 ** 20
+    assert 8 * 2 ** 20 <= second["peak_memory"] < 9 * 2 ** 20
+    assert "peak_memory" not in first_inner
+    assert "peak_memory" not in second_inner
+
+
+def test_without_memory_tracing():
+    with metrics.MetricsRecorder(trace_memory=False) as recorder:
+        with metrics.phase("a"):
+            pass
+    assert "peak_memory" not in recorder.phases[0]
+
+
+def test_run_nsc_counters():
+    points, _ = make_blobs(300, 2, centers=3, random_state=0)
+    with metrics.MetricsRecorder() as recorder:
+        run_nsc(points, 3)
+    phases = {p["name"]: p for p in recorder.phases}
+    assert list(phases) == ["laplacian", "eigenpairs", "eigengap", "kmeans"]
+    assert phases["eigenpairs"]["counters"]["m"] == 3
+    assert phases["eigenpairs"]["counters"]["lobpcg_iterations"] > 0
+    assert phases["eigengap"]["counters"]["k"] == 3
+    assert phases["kmeans"]["counters"]["kmeans_iterations"] >= 1
+
+
+def test_run_clustering_saves_metrics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    points, centers = make_blobs(200, 2, centers=3, random_state=0)
+    params = ProgramParams(200, 3, 2, False)
+    run_clustering(params, points, centers, skip_visualization=True,
+                   record_metrics=True)
+    with open(tmp_path / "metrics.json") as f:
+        result = json.load(f)
+    assert result["counters"] == {"n": 200, "d": 2, "k": 3}
+    assert [p["name"] for p in result["phases"]] == \
+        ["nsc", "nsc/laplacian", "nsc/eigenpairs", "nsc/eigengap",
+         "nsc/kmeans", "kmeans", "data_output", "clusters_output"]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+import minibatch_kmeans as mbk
+
+
+def _blobs(n=5000, d=2, k=4, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = np.array([[-20, -20], [-20, 20], [20, -20], [20, 20]])[:k, :d]
+    labels = rng.integers(0, k, n)
+    return centers[labels] + rng.normal(size=(n, d)), labels, centers
+
+
+def _same_partition(a, b):
+    # both labelings induce the same partition (up to renaming the clusters)
+    pairs = set(zip(a.tolist(), b.tolist()))
+    return len(pairs) == len(set(a.tolist())) == len(set(b.tolist()))
+
+
+def test_minibatch_step_is_running_mean():
+    rng = np.random.default_rng(1)
+    batch = rng.normal(size=(50, 3))
+    centroids = np.zeros((1, 3))
+    counts = np.array([10])
+    mbk.minibatch_step(batch, centroids, counts)
+    assert counts[0] == 60
+    # 10 previous points at the origin, and the new 50 points
+    assert np.allclose(centroids[0], batch.sum(axis=0) / 60)
+
+
+def test_minibatch_kmeans():
+    x, labels, centers = _blobs()
+    result, centroids = mbk.minibatch_kmeans(x, 4, batch_size=256)
+    assert result.dtype == np.int32 and result.shape == labels.shape
+    assert _same_partition(result, labels)
+    assert np.allclose(np.sort(centroids, axis=0), np.sort(centers, axis=0),
+                       atol=0.5)
+
+
+def test_streaming_kmeans():
+    x, labels, _ = _blobs()
+    chunks = (x[i:i + 700] for i in range(0, x.shape[0], 700))
+    centroids, counts = mbk.streaming_kmeans(chunks, 4, batch_size=256,
+                                             seed_sample_size=1000)
+    assert counts.sum() == x.shape[0]
+    assert _same_partition(mbk.predict(x, centroids), labels)
+
+
+def test_streaming_too_short():
+    x, _, _ = _blobs(n=3)
+    with pytest.raises(ValueError):
+        mbk.streaming_kmeans([x], 4)
@@ -1,8 +1,10 @@
 from timeit import timeit
 import time
+import tracemalloc
 from sklearn.datasets import make_blobs
 import output_data as od
 import numpy as np
+import pytest
 
 class Test_3d_output:
     def test_vis(self):
@@ -11,6 +13,24 @@ class Test_3d_output:
         points, centers = make_blobs(n, d, centers=k)
         od.visualization_pdf(k, points, centers, centers, k_spectral, 0.24, 0.27)
 
+    def test_vis_large(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(od.config, "FNAME_VIS_PDF",
+                            str(tmp_path / "clusters.pdf"))
+        for d in [2, 3]:
+            points, centers = make_blobs(200000, d, centers=5, random_state=0)
+            t = time.time()
+            od.visualization_pdf(5, points, centers, centers, 5, 1, 1)
+            assert time.time() - t < 30
+            assert (tmp_path / "clusters.pdf").stat().st_size < 2 * 2 ** 20
+
+    def test_stratified_sample(self):
+        labels = np.repeat([3, 0, 7], [10000, 50, 1])
+        sample = od.stratified_sample(labels, 1000)
+        assert (np.diff(sample) > 0).all()
+        # proportional quotas (rounded down), and at least one of each label
+        assert np.bincount(labels[sample]).tolist() == \
+            [4] + [0] * 2 + [994] + [0] * 3 + [1]
+
     def test_calc_jaccard(self):
         # Iftah's forum example
         centers = np.array([0,0,1,1,2,2])
@@ -19,6 +39,70 @@ class Test_3d_output:
         assert jac == 0.2
 
 
+def _naive_jaccard(centers, clusters):
+    # the original implementation, comparing each pair
+    n = centers.shape[0]
+    tri0, tri1 = np.triu_indices(n, 1)
+    centers_pairs = centers[tri0] == centers[tri1]
+    clusters_pairs = clusters[tri0] == clusters[tri1]
+    return np.sum(centers_pairs & clusters_pairs) / \
+        np.sum(centers_pairs | clusters_pairs)
+
+
+class TestJaccard:
+    def test_same_as_naive(self):
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            n = rng.integers(2, 300)
+            centers = rng.integers(0, rng.integers(1, 20), n)
+            clusters = rng.integers(0, rng.integers(1, 20), n)
+            expected = _naive_jaccard(centers, clusters)
+            assert od.calc_jaccard(centers, clusters) == expected
+            # labels that aren't small non-negative integers
+            assert od.calc_jaccard(centers - 5, clusters * 0.5) == expected
+            assert od.calc_jaccard_chunked(centers, clusters, 7) == expected
+
+    def test_sparse_labels(self):
+        # ids of representative points - few labels, spread over [0, n)
+        n = 200000
+        rng = np.random.default_rng(2)
+        ids = rng.choice(n, 7, replace=False)
+        centers = ids[rng.integers(0, 7, n)]
+        labels = rng.integers(0, 3, n)
+        clusters = np.array([5, n // 2, n - 1])[labels]
+        indices = od._label_indices(centers)
+        assert indices.max() == 6
+        assert (np.sort(ids)[indices] == centers).all()
+        # dense labels are kept as is
+        assert (od._label_indices(labels) == labels).all()
+        # without compressing, the contingency table would be n x n
+        tracemalloc.start()
+        jac = od.calc_jaccard(centers, clusters)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert jac == od.calc_jaccard(indices, labels)
+        assert peak < 20 * n * 8
+        tracemalloc.start()
+        jac_chunked = od.calc_jaccard_chunked(centers, clusters, 30000)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert jac_chunked == jac
+        assert peak < 20 * n * 8
+
+    def test_chunked_from_disk(self, tmp_path):
+        rng = np.random.default_rng(1)
+        centers = rng.integers(0, 10, 5000).astype(np.int32)
+        clusters = (centers + (rng.random(5000) < 0.1)) % 10
+        np.save(tmp_path / "centers.npy", centers)
+        np.save(tmp_path / "clusters.npy", clusters)
+        jac = od.calc_jaccard_chunked(
+            np.load(tmp_path / "centers.npy", mmap_mode='r'),
+            np.load(tmp_path / "clusters.npy", mmap_mode='r'), chunk_size=999)
+        assert jac == od.calc_jaccard(centers, clusters)
+        with pytest.raises(ValueError):
+            od.calc_jaccard_chunked(centers - 1, clusters)
+
+
 class Test_txt_ouput:
     def test_sanity_check_data(self):
         obs_arr = np.array(
@@ -48,6 +132,31 @@ class Test_txt_ouput:
                 assert line.strip() == expected_output[i]
 
 
+    def test_clusters_same_as_old(self, tmp_path, monkeypatch):
+        def old_format(clusters):
+            # the original implementation, building the string
+            clusters_dict = {}
+            for i, cluster in enumerate(clusters):
+                clusters_dict[cluster] = clusters_dict.get(cluster, "") + f"{i},"
+            return "".join(line[:-1] + "\n" for line in clusters_dict.values())
+
+        monkeypatch.setattr(od.config, "FNAME_CLUSTERS_TXT",
+                            str(tmp_path / "clusters.txt"))
+        rng = np.random.default_rng(0)
+        for n in [1, 7, 1000]:
+            spectral = rng.integers(-3, 12, n)
+            kmeans = rng.integers(0, 5, n).astype(np.float32)
+            od.print_clusters_txt(5, spectral, kmeans)
+            with open(tmp_path / "clusters.txt") as f:
+                assert f.read() == "5\n" + old_format(spectral) + \
+                       old_format(kmeans)
+            # in chunks
+            with open(tmp_path / "chunked.txt", "w") as f:
+                od.write_clusters(f, spectral, chunk_size=3)
+            with open(tmp_path / "chunked.txt") as f:
+                assert f.read() == old_format(spectral)
+
+
 
 
 # ----------- TRASH (ALL TESTED TO BE SLOWER):
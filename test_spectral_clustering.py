@@ -1,8 +1,11 @@
+import tracemalloc
 import numpy as np
+import pytest
 from timeit import timeit
 
 import spectral_clustering as nsc
 import linalg as la
+from output_data import calc_jaccard
 EPSILON = 0.001
 
 # ------------------ LA TESTS: -----------------
@@ -83,6 +86,27 @@ def time_avg__form_Weight():
     print(f"- Regular  : {np.mean(times[:, 0])} sec")
     print(f"- With +w.T: {np.mean(times[:, 1])} sec")
 
+def time__nystrom(n=3000, k=6, ms=(50, 100, 300, 1000)):
+    # accuracy (jaccard with the exact clustering) vs. time, for each m
+    x, _ = _blobs(n, k)
+    exact_time = timeit(lambda: nsc.run_nsc(x), number=1)
+    exact, _ = nsc.run_nsc(x)
+    print(f"- exact: {exact_time:.3f} sec")
+    for m in ms:
+        t = timeit(lambda: nsc.run_nsc(x, approx="nystrom", n_landmarks=m),
+                   number=1)
+        clusters, _ = nsc.run_nsc(x, approx="nystrom", n_landmarks=m)
+        print(f"- nystrom, m = {m}: {t:.3f} sec, "
+              f"jaccard with exact: {calc_jaccard(exact, clusters):.3f}")
+
+def time__dense_laplacian(ns=(500, 1000, 2000, 4000)):
+    for n in ns:
+        x = np.random.rand(n, 3)
+        t1 = timeit(lambda: nsc.form_laplacian(nsc.form_weight(x)), number=1)
+        t2 = timeit(lambda: nsc.form_dense_laplacian(x), number=1)
+        print(f"- n = {n}: form_weight + form_laplacian: {t1:.3f} sec, "
+              f"form_dense_laplacian: {t2:.3f} sec")
+
 def test__phases():
     x = np.array([
         [3, 4, 2],
@@ -127,7 +151,165 @@ def test_laplacian_comparison():
     print('(1) - ', timeit(lambda: nsc.form_laplacian(w), number=100) * 10000)
     print('(2) - ', timeit(lambda : nsc.form_laplacian_imp(w), number=100)*10000)
 
+def test__dense_laplacian():
+    x = np.random.default_rng(0).normal(size=(300, 3)) * 5 + 50
+    expected = nsc.form_laplacian(nsc.form_weight(x))
+    for block_size in [1, 1000, 300 * 300]:
+        l = nsc.form_dense_laplacian(x, block_size)
+        assert l.dtype == np.float64
+        assert np.allclose(l, expected, atol=1e-6)
+        assert np.allclose(l, l.T, rtol=0, atol=1e-12)
+
+
+def test__dense_laplacian_memory():
+    n = 1000
+    x = np.random.default_rng(0).normal(size=(n, 3))
+    tracemalloc.start()
+    nsc.form_dense_laplacian(x, block_size=n * 100)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # the laplacian itself, and a few n-sized arrays
+    assert peak < n * n * 8 * 1.05
+
+
+def _blobs(n, k, seed=0):
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, k, n)
+    return rng.uniform(-10, 10, size=(k, 3))[labels] + \
+        rng.normal(size=(n, 3)), labels
+
+
+def _distances(x):
+    d = np.linalg.norm(x[:, None] - x[None], axis=2)
+    np.fill_diagonal(d, np.inf)
+    return d
+
+
+def test__knn_weight():
+    x, _ = _blobs(200, 3)
+    w = nsc.form_knn_weight(x, 7, block_size=1000).toarray()
+    mask = w > 0
+    assert (w == w.T).all()
+    nearest = np.argsort(_distances(x), axis=1)[:, :7]
+    assert mask[np.arange(200)[:, None], nearest].all()
+    # neighbours are either among the 7 nearest, or have the point among theirs
+    assert (mask == (mask & mask.T)).all()
+    assert mask.sum() <= 2 * 7 * 200
+    assert np.allclose(w[mask], nsc.form_weight(x)[mask], atol=1e-6)
+
+
+def test__radius_weight():
+    x, _ = _blobs(200, 3)
+    w = nsc.form_radius_weight(x, 2.5, block_size=999).toarray()
+    assert ((w > 0) == (_distances(x) <= 2.5)).all()
+    assert np.allclose(w, nsc.form_weight(x) * (w > 0), atol=1e-6)
+
+
+def test__sparse_laplacian():
+    x, _ = _blobs(150, 3)
+    w = nsc.form_knn_weight(x)
+    l = nsc.form_laplacian(w)
+    assert np.allclose(l.toarray(), nsc.form_laplacian(w.toarray()))
+    with pytest.raises(ValueError):
+        # the outliers have no neighbours
+        nsc.form_laplacian(nsc.form_radius_weight(x, 0.01))
+
+
+def test__run_sparse():
+    x, labels = _blobs(600, 4)
+    for kwargs in [dict(affinity="knn"), dict(affinity="radius", radius=4)]:
+        clusters, k = nsc.run_nsc(x, 4, **kwargs)
+        assert k == 4
+        assert len(set(zip(clusters.tolist(), labels.tolist()))) == 4
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x, 4, affinity="radius")
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x, 4, affinity="full")
+
+
+def test__nystrom():
+    x, labels = _blobs(1500, 5)
+    l = nsc.form_dense_laplacian(x)
+    _, exact = la.smallest_eigenpairs(l, k=5)
+    values, vectors = nsc.nystrom_eigenpairs(x, 200)
+    assert len(values) == 200 and vectors.shape == (1500, 200)
+    assert (np.diff(values) >= 0).all()
+    assert np.allclose(vectors.T @ vectors, np.eye(200))
+    # the leading eigen-space is approximated well
+    approx = vectors[:, :5]
+    assert np.allclose(approx @ approx.T, exact @ exact.T, atol=0.05)
+
+    clusters, k = nsc.run_nsc(x, approx="nystrom", n_landmarks=100)
+    assert k == 5
+    assert len(set(zip(clusters.tolist(), labels.tolist()))) == 5
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x, approx="nystrom", affinity="knn")
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x, approx="svd")
+    # a forced k needs as many eigenpairs
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x, k=10, approx="nystrom", n_landmarks=5)
+    with pytest.raises(ValueError):
+        nsc.run_nsc(x[:8], k=6, approx="nystrom", n_landmarks=8)
+
+
+def test__sweep():
+    x, labels = _blobs(400, 4)
+    ks = [2, 3, 4, 5, 6]
+    results = nsc.sweep_nsc(x, ks, centers=labels)
+    assert [r.k for r in results] == ks
+    values, vectors = nsc._eigenpairs(x, 7, "dense", nsc.N_NEIGHBORS, None,
+                                      None, nsc.N_LANDMARKS)
+    for r in results:
+        # the same as clustering the first k eigenvectors of the spectrum
+        t = nsc.form_t(vectors[:, :r.k])
+        expected, centroids = nsc.kmeans_fit(t, r.k, 400, r.k, nsc.MAX_ITER)
+        assert (r.labels == expected).all()
+        assert np.isclose(r.inertia, ((t - centroids[expected]) ** 2).sum())
+        assert np.isclose(r.eigengap, values[r.k] - values[r.k - 1])
+        assert r.jaccard == calc_jaccard(labels, r.labels)
+    # the eigengap method's k has the biggest gap, the real k the best score
+    k, = [r.k for r in results if r.eigengap == max(r.eigengap for r in results)]
+    assert k == nsc.run_nsc(x)[1] == 4
+    assert max(results, key=lambda r: r.jaccard).k == 4
+    assert results[2].jaccard > 0.95
+
+    # the same in parallel, and without the real centers
+    for a, b in zip(results, nsc.sweep_nsc(x, ks, n_jobs=3)):
+        assert (a.labels == b.labels).all() and b.jaccard is None
+    # k = n has no eigengap
+    assert np.isnan(nsc.sweep_nsc(x[:10], [10])[0].eigengap)
+    with pytest.raises(ValueError):
+        nsc.sweep_nsc(x, [0, 2])
+    with pytest.raises(ValueError):
+        nsc.sweep_nsc(x, [])
+    for kwargs in [dict(affinity="knnn"), dict(approx="nystrm"),
+                   dict(affinity="knn", approx="nystrom"),
+                   dict(affinity="radius")]:
+        with pytest.raises(ValueError):
+            nsc.sweep_nsc(x, [2, 3], **kwargs)
+
+
+def test__sweep_cache():
+    from eigen_cache import EigenCache
+    x, _ = _blobs(300, 3)
+    cache = EigenCache()
+    first = nsc.sweep_nsc(x, [2, 3, 4], cache=cache)
+    assert cache.misses == 1 and len(cache) == 1
+    # smaller sweeps and run_nsc reuse the spectrum of the bigger sweep
+    second = nsc.sweep_nsc(x, [3], cache=cache)
+    assert (second[0].labels == first[1].labels).all()
+    nsc.run_nsc(x, 4, cache=cache)
+    assert cache.hits == 2
+
+
 # ------------------ TIME COMPARISONS: -----------------
+def time__sweep(n=1500, ks=range(2, 31)):
+    x, _ = _blobs(n, 10)
+    t_sweep = timeit(lambda: nsc.sweep_nsc(x, ks), number=1)
+    t_runs = timeit(lambda: [nsc.run_nsc(x, k) for k in ks], number=1)
+    print(f"-n = {n}, {len(ks)} ks: sweep {t_sweep}, run_nsc per k {t_runs}")
+
 def time__run(n,d):
     np.random.seed(0)
     x = np.random.rand(n, d)
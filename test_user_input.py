@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+import numpy as np
+import pytest
 import initialization
 
 
@@ -70,3 +72,22 @@ class TestGeneratePoints:
         assert params.dim in [2, 3]
         assert len(points) == args.n
         assert len(centers) == args.n
+
+
+class TestMakeBlobs:
+    def test_same_as_sklearn(self):
+        datasets = pytest.importorskip("sklearn.datasets")
+        for n, d, k, seed in [(50, 2, 10, 0), (471, 3, 350, 1), (7, 3, 7, 2)]:
+            points, centers = initialization.make_blobs(n, d, centers=k,
+                                                        random_state=seed)
+            expected_points, expected_centers = datasets.make_blobs(
+                n, d, centers=k, random_state=seed)
+            assert (points == expected_points).all()
+            assert (centers == expected_centers).all()
+
+    def test_global_random_state(self):
+        np.random.seed(3)
+        points, _ = initialization.make_blobs(20, 2, centers=3)
+        np.random.seed(3)
+        again, _ = initialization.make_blobs(20, 2, centers=3)
+        assert (points == again).all()